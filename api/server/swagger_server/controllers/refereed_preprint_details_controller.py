@@ -1,12 +1,18 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from connexion import problem
 from math import ceil
-from neoflask.cache import cache
-from neoflask.queries import REFEREED_PREPRINTS_V2, REFEREED_PREPRINT_V2
+from neoflask.cache import memoize
+from neoflask.queries import (
+    REFEREED_PREPRINTS_V2, REFEREED_PREPRINT_V2,
+    REFEREED_PREPRINT_DOCUMENTS_V2, REFEREED_PREPRINT_DOCUMENT_V2, REFEREED_PREPRINT_DOCUMENTS_RANKED_V2,
+)
 from neotools import ask_neo
 from urllib.parse import urlencode
 
 
-@cache.memoize()  # memoize handles function parameters, cached does not
+@memoize(serialize=True)
 def paper_get(doi=None, slug=None):  # noqa: E501
     """Get details about a refereed preprint by DOI or slug.
 
@@ -21,6 +27,10 @@ def paper_get(doi=None, slug=None):  # noqa: E501
     """
     if (not doi and not slug) or (doi and slug):
         return problem(status=400, title="Bad Request", detail="Must specify either doi or slug")
+    # the document rendered by sdg.sd_precompute, or rendered now if the db was not precomputed with it
+    result = ask_neo(REFEREED_PREPRINT_DOCUMENT_V2(), doi=doi, slug=slug)
+    if result:
+        return json.loads(result[0]["document"])
     result = ask_neo(REFEREED_PREPRINT_V2(), doi=doi, slug=slug)
     return result[0]["refereed_preprint"] if result else None
 
@@ -32,6 +42,25 @@ def _to_lucene_query(user_input):
     return f'"{escaped}"'
 
 
+def _encode_cursor(doi):
+    # the cursor is the DOI of the last item of the page, opaque to clients
+    return urlsafe_b64encode(doi.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        return urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def _ranked_list(reviewed_by, lucene_query, published_in, sort_by, sort_ascending):
+    # the list ranked by sdg.sd_precompute that has the requested page, None if the request filters it further
+    if lucene_query or published_in or (reviewed_by and len(reviewed_by) > 1):
+        return None
+    return f"{reviewed_by[0] if reviewed_by else ''}|{sort_by}|{'asc' if sort_ascending else 'desc'}"
+
+
 def papers_url(reviewed_by=None, query=None, page=None, per_page=None, sort_by=None, sort_order=None):
     base_url = "/api/v2/papers/"
     query_params_list = [
@@ -50,8 +79,8 @@ def papers_url(reviewed_by=None, query=None, page=None, per_page=None, sort_by=N
     return f"{base_url}?{query_params}"
 
 
-@cache.memoize()  # memoize handles function parameters, .cached does not
-def papers_get(reviewed_by=None, query=None, published_in=None, page=None, per_page=None, sort_by=None, sort_order=None):  # noqa: E501
+@memoize(serialize=True)
+def papers_get(reviewed_by=None, query=None, published_in=None, page=None, per_page=None, sort_by=None, sort_order=None, cursor=None):  # noqa: E501
     r"""Get paginated collections of refereed preprints, optionally filtered by reviewing service
 
      # noqa: E501
@@ -70,9 +99,16 @@ def papers_get(reviewed_by=None, query=None, published_in=None, page=None, per_p
     :type sort_by: dict | bytes
     :param sort_order: The direction to sort the results in.
     :type sort_order: dict | bytes
+    :param cursor: The nextCursor of the paging information of a previous page of results, to get the page following it with the same parameters. The page parameter is ignored if a cursor is specified. Cursor paging is faster than page numbers for deep pages.
+    :type cursor: str
 
     :rtype: InlineResponse200
     """
+    after = None
+    if cursor is not None:
+        after = _decode_cursor(cursor)
+        if not after:
+            return problem(status=400, title="Bad Request", detail="Invalid cursor")
     lucene_query = _to_lucene_query(query) if query else None
     db_page = page - 1  # neo4j pages are 0-indexed, page is checked for > 0 in param validation
     db_sort_by = ({
@@ -87,16 +123,32 @@ def papers_get(reviewed_by=None, query=None, published_in=None, page=None, per_p
         page=db_page,  # converted from 1- to 0-indexed above
         per_page=per_page,  # already validated, and can be passed through
         sort_by=db_sort_by,
-        sort_ascending=sort_ascending
+        sort_ascending=sort_ascending,
+        after=after,  # the DOI of the last item of the previous page
     )
-    result = ask_neo(REFEREED_PREPRINTS_V2(), **db_params)
+    ranked_list = _ranked_list(reviewed_by, lucene_query, published_in, db_sort_by, sort_ascending)
+    result = None
+    if ranked_list is not None:
+        result = ask_neo(REFEREED_PREPRINT_DOCUMENTS_RANKED_V2(), list=ranked_list, page=db_page, per_page=per_page, after=after)
+        if result[0]["n_total"] == 0:  # or the lists were not ranked by sdg.sd_precompute
+            result = None
+    if result is None:
+        result = ask_neo(REFEREED_PREPRINT_DOCUMENTS_V2(), **db_params)
+    if len(result[0]["items"]) == result[0]["n_items"]:
+        items = [json.loads(document) for document in result[0]["items"]]
+    else:  # not all documents rendered by sdg.sd_precompute, the whole page from the live query
+        result = ask_neo(REFEREED_PREPRINTS_V2(), **db_params)
+        items = result[0]["items"]
     n_total = result[0]["n_total"]
+    start = result[0]["start"]
+    if after is not None:
+        page = start // per_page + 1
     n_pages = int(ceil(n_total / per_page))
     show_prev = page > 1 and page <= n_pages
     show_next = page < n_pages and page >= 1
 
     return {
-        "items": result[0]["items"],
+        "items": items,
         "paging": {
             "first": papers_url(reviewed_by, query, 1, per_page, sort_by, sort_order),
             "prev": papers_url(reviewed_by, query, max(1, page - 1), per_page, sort_by, sort_order) if show_prev else None,
@@ -109,5 +161,6 @@ def papers_get(reviewed_by=None, query=None, published_in=None, page=None, per_p
             "totalItems": n_total,
             "sortedBy": sort_by,
             "sortedOrder": sort_order,
+            "nextCursor": _encode_cursor(items[-1]["doi"]) if items and start + len(items) < n_total else None,
         }
     }
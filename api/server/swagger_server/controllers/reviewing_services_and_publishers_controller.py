@@ -1,9 +1,9 @@
-from neoflask.cache import cache
+from neoflask.cache import cached_view
 from neoflask.queries import DESCRIBE_PUBLISHERS, DESCRIBE_REVIEWING_SERVICES_V2
 from neotools import ask_neo
 
 
-@cache.cached()
+@cached_view()
 def publishers_get():  # noqa: E501
     """Get information about available publishers.
 
@@ -15,7 +15,7 @@ def publishers_get():  # noqa: E501
     return ask_neo(DESCRIBE_PUBLISHERS())
 
 
-@cache.cached()
+@cached_view()
 def reviewing_services_get():  # noqa: E501
     """Get information about available reviewing services
 
@@ -16,7 +16,7 @@ class PagingInfo(Model):
 
     Do not edit the class manually.
     """
-    def __init__(self, first: str=None, prev: str=None, current: str=None, next: str=None, last: str=None, current_page: int=None, total_pages: int=None, per_page: int=None, total_items: int=None, sorted_by: PaperSortBy=None, sorted_order: SortOrder=None):  # noqa: E501
+    def __init__(self, first: str=None, prev: str=None, current: str=None, next: str=None, last: str=None, current_page: int=None, total_pages: int=None, per_page: int=None, total_items: int=None, sorted_by: PaperSortBy=None, sorted_order: SortOrder=None, next_cursor: str=None):  # noqa: E501
         """PagingInfo - a model defined in Swagger
 
         :param first: The first of this PagingInfo.  # noqa: E501
@@ -41,6 +41,8 @@ class PagingInfo(Model):
         :type sorted_by: PaperSortBy
         :param sorted_order: The sorted_order of this PagingInfo.  # noqa: E501
         :type sorted_order: SortOrder
+        :param next_cursor: The next_cursor of this PagingInfo.  # noqa: E501
+        :type next_cursor: str
         """
         self.swagger_types = {
             'first': str,
@@ -53,7 +55,8 @@ class PagingInfo(Model):
             'per_page': int,
             'total_items': int,
             'sorted_by': PaperSortBy,
-            'sorted_order': SortOrder
+            'sorted_order': SortOrder,
+            'next_cursor': str
         }
 
         self.attribute_map = {
@@ -67,7 +70,8 @@ class PagingInfo(Model):
             'per_page': 'perPage',
             'total_items': 'totalItems',
             'sorted_by': 'sortedBy',
-            'sorted_order': 'sortedOrder'
+            'sorted_order': 'sortedOrder',
+            'next_cursor': 'nextCursor'
         }
         self._first = first
         self._prev = prev
@@ -80,6 +84,7 @@ class PagingInfo(Model):
         self._total_items = total_items
         self._sorted_by = sorted_by
         self._sorted_order = sorted_order
+        self._next_cursor = next_cursor
 
     @classmethod
     def from_dict(cls, dikt) -> 'PagingInfo':
@@ -340,3 +345,26 @@ class PagingInfo(Model):
         """
 
         self._sorted_order = sorted_order
+
+    @property
+    def next_cursor(self) -> str:
+        """Gets the next_cursor of this PagingInfo.
+
+        The cursor to pass as cursor parameter to get the next page of results. Null if the current page is the last page.  # noqa: E501
+
+        :return: The next_cursor of this PagingInfo.
+        :rtype: str
+        """
+        return self._next_cursor
+
+    @next_cursor.setter
+    def next_cursor(self, next_cursor: str):
+        """Sets the next_cursor of this PagingInfo.
+
+        The cursor to pass as cursor parameter to get the next page of results. Null if the current page is the last page.  # noqa: E501
+
+        :param next_cursor: The next_cursor of this PagingInfo.
+        :type next_cursor: str
+        """
+
+        self._next_cursor = next_cursor
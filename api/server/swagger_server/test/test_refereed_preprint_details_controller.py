@@ -49,6 +49,16 @@ class TestRefereedPreprintDetailsController(BaseTestCase):
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
+    def test_papers_get_invalid_cursor(self):
+        """Test case for papers_get with a cursor that is not one returned as nextCursor"""
+        query_string = [('cursor', '!')]
+        response = self.client.open(
+            '/api/v2/papers/',
+            method='GET',
+            query_string=query_string)
+        self.assert400(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
 
 if __name__ == '__main__':
     import unittest
@@ -2,7 +2,9 @@ import os
 from connexion import FlaskApp
 from dotenv import load_dotenv
 from .cache import init_cache
+from .db import init_db
 from .config import Config
+from .serializer import JSONProvider
 from flask_cors import CORS
 from swagger_server import encoder
 
@@ -19,7 +21,7 @@ connexion_app.add_api(
     pythonic_params=True,
     strict_validation=True,
 )
-app.json_encoder = encoder.JSONEncoder
+app.json = JSONProvider(app, encoder=encoder.JSONEncoder)
 
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
@@ -27,5 +29,6 @@ Config.init_app(app)
 app.config.from_object(Config)
 
 init_cache(app)
+init_db(app)
 
 from . import views
@@ -1,7 +1,67 @@
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import wraps
+from threading import Lock
+from random import random
+from time import monotonic, sleep, time
+from typing import Callable, Dict, List
+import brotli
+from flask import Response, copy_current_request_context, current_app, g, has_request_context, request
 from flask_caching import Cache
+from redis.exceptions import LockError
+from werkzeug.datastructures import Headers
+from neotools import ask_neo
+from .queries import DB_GENERATION
+from .serializer import json_response
+
+# entries of past db generations are not deleted, they expire after this many seconds
+CACHE_TIMEOUT = int(os.getenv('CACHE_TIMEOUT', 7 * 24 * 60 * 60))
+# after this many seconds a cached value is stale: it is still served, but refreshed in the background by one of
+# CACHE_REFRESH_THREADS threads per worker
+CACHE_SOFT_TIMEOUT = int(os.getenv('CACHE_SOFT_TIMEOUT', 60 * 60))
+CACHE_REFRESH_THREADS = int(os.getenv('CACHE_REFRESH_THREADS', 2))
+# size in bytes of the in-memory cache of each worker, and of the largest entry it keeps, see LocalCache
+CACHE_LOCAL_MAX_BYTES = int(os.getenv('CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_LOCAL_MAX_ITEM_BYTES = int(os.getenv('CACHE_LOCAL_MAX_ITEM_BYTES', 16 * 1024 * 1024))
+# how often a worker checks whether a db update completed, in seconds
+CACHE_GENERATION_CHECK_INTERVAL = float(os.getenv('CACHE_GENERATION_CHECK_INTERVAL', 60))
+
+# single flight: seconds after which the lock on computing a value expires, e.g. if its worker was killed, and
+# how long concurrent requests wait for the value before computing it themselves
+CACHE_LOCK_TIMEOUT = float(os.getenv('CACHE_LOCK_TIMEOUT', 120))
+CACHE_LOCK_WAIT = float(os.getenv('CACHE_LOCK_WAIT', 10))
+CACHE_LOCK_POLL_INTERVAL = 0.1
+
+# popularity of the cached paths, see record_hit(): the share of the requests that are counted, the number of
+# seconds after which the counts are halved, and the number of paths kept
+CACHE_POPULARITY_SAMPLE_RATE = float(os.getenv('CACHE_POPULARITY_SAMPLE_RATE', 0.1))
+CACHE_POPULARITY_HALF_LIFE = int(os.getenv('CACHE_POPULARITY_HALF_LIFE', 24 * 60 * 60))
+CACHE_POPULARITY_MAX_PATHS = int(os.getenv('CACHE_POPULARITY_MAX_PATHS', 100000))
+
+# the bodies of cached responses of at least this many bytes are stored compressed, with brotli ('br') or gzip, at
+# these levels, see compress_response()
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv('CACHE_COMPRESS_MIN_BYTES', 1024))
+CACHE_COMPRESSION = os.getenv('CACHE_COMPRESSION', 'br')
+CACHE_BROTLI_QUALITY = int(os.getenv('CACHE_BROTLI_QUALITY', 5))
+CACHE_GZIP_LEVEL = int(os.getenv('CACHE_GZIP_LEVEL', 6))
+
+# the Redis key of the last generation seen by any worker, for when the db can't be reached
+GENERATION_KEY = 'generation'
+# the Redis key of the sorted set of the counts of the paths, not namespaced by generation
+POPULARITY_KEY = 'popularity'
+# requests of the cache warm-up have this header and are not counted
+WARM_UP_HEADER = 'X-Cache-Warm-Up'
 
 cache = Cache(config={
-    'CACHE_DEFAULT_TIMEOUT': 365 * 24 * 60 * 60,
+    'CACHE_DEFAULT_TIMEOUT': CACHE_TIMEOUT,
     'CACHE_KEY_PREFIX': __name__,
     'CACHE_TYPE': 'redis',
     'CACHE_REDIS_HOST': 'redis',
@@ -9,7 +69,616 @@ cache = Cache(config={
 })
 
 
+# the responses that only change with the db generation get an ETag and a Last-Modified header and conditional
+# requests for them are answered with 304 Not Modified, see not_modified(); not the statistics of the worker, nor the
+# responses whose defaults depend on the date: the docmaps of the last days and the automatic topics of the last months
+CONDITIONAL_PATHS = re.compile(r'^/api/v[12]/')
+UNCONDITIONAL_PATHS = re.compile(r'^/api/v1/stats/|/docmap/\d+d/|^/api/v1/by_auto_topics/?$')
+
+
 def init_cache(app):
     cache.init_app(app)
-    with app.app_context():
-        cache.clear()
+    app.before_request(not_modified)
+    app.after_request(add_validators)
+
+
+_generation = None
+_previous_generation = None
+_generation_checked = None
+_generation_lock = Lock()
+
+
+def current_generation() -> str:
+    """
+    The generation of the database: the time the last db update completed, as written by sdg/update_close.cql.
+
+    Cache keys are prefixed with the generation, so that an update makes the new entries replace the old ones,
+    which then expire, without clearing the cache; a restarted worker finds the cache warm. The generation is read
+    from the db at most every CACHE_GENERATION_CHECK_INTERVAL seconds. If the db can't be reached, the last
+    generation seen by this or another worker is used; None if there is none, and then nothing is cached.
+    """
+    global _generation, _previous_generation, _generation_checked
+    now = monotonic()
+    if _generation_checked is not None and now - _generation_checked < CACHE_GENERATION_CHECK_INTERVAL:
+        return _generation
+    with _generation_lock:
+        if _generation_checked is None or now - _generation_checked >= CACHE_GENERATION_CHECK_INTERVAL:
+            try:
+                result = ask_neo(DB_GENERATION())
+            except Exception as e:
+                current_app.logger.warning(f"db generation unknown: {e}")
+                generation = _generation or cache.get(GENERATION_KEY)
+            else:
+                generation = str(result[0]['update_completed']) if result else 'initial'
+                cache.set(GENERATION_KEY, generation, timeout=0)
+            if generation != _generation:
+                current_app.logger.info(f"cache generation {generation}")
+                if _generation is not None:
+                    _previous_generation = _generation
+                LOCAL_CACHE.clear()
+            _generation = generation
+            _generation_checked = now
+    return _generation
+
+
+def stable_key(*parts) -> str:
+    """
+    A digest of the canonical JSON of `parts`.
+
+    Unlike hash(), which is randomized per process for strings, the digest is the same in every worker and after
+    restarts, so that all of them share the entries of the Redis cache. Dictionaries are canonical whatever the
+    order of their keys.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def request_cache_key() -> str:
+    """The cache key of the current request: its path, its query string and, for POST requests, its JSON body."""
+    args = {k: sorted(v) for k, v in request.args.lists()}
+    body = request.get_json(silent=True) if request.method == 'POST' else None
+    return f'view{request.path}/{stable_key(args, body)}'
+
+
+def record_hit():
+    """
+    Count the path of the current GET request, with its query string, in the popularity of the cached paths.
+
+    Only a sample of CACHE_POPULARITY_SAMPLE_RATE of the requests is counted, each for 1 / CACHE_POPULARITY_SAMPLE_RATE,
+    to spare a Redis write per request. The first request counted in each CACHE_POPULARITY_HALF_LIFE seconds halves
+    all counts and drops the least popular paths beyond CACHE_POPULARITY_MAX_PATHS, so that the counts follow the
+    recent traffic. The cache warm-up requests the most popular paths first, see popular_paths().
+    """
+    if (
+        random() >= CACHE_POPULARITY_SAMPLE_RATE
+        or not has_request_context()
+        or request.method != 'GET'
+        or WARM_UP_HEADER in request.headers
+    ):
+        return
+    try:
+        client = getattr(cache.cache, '_write_client', None)
+        if client is None:
+            return
+        key = f'{cache.cache._get_prefix()}{POPULARITY_KEY}'
+        path = request.full_path.rstrip('?')
+        pipeline = client.pipeline(transaction=False)
+        pipeline.zincrby(key, 1 / CACHE_POPULARITY_SAMPLE_RATE, path)
+        pipeline.set(f'{key}/decayed', 1, nx=True, ex=CACHE_POPULARITY_HALF_LIFE)
+        _, decay = pipeline.execute()
+        if decay:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.zunionstore(key, {key: 0.5})
+            pipeline.zremrangebyrank(key, 0, -CACHE_POPULARITY_MAX_PATHS - 1)
+            pipeline.execute()
+    except Exception:
+        current_app.logger.exception("cache popularity update failed")
+
+
+def popular_paths(coverage: float = 1.0) -> List[str]:
+    """The most popular paths first, as many as account for a share `coverage` of the counted requests."""
+    client = getattr(cache.cache, '_read_client', None)
+    if client is None:
+        return []
+    counts = client.zrevrange(f'{cache.cache._get_prefix()}{POPULARITY_KEY}', 0, -1, withscores=True)
+    target = coverage * sum(count for _, count in counts)
+    paths, covered = [], 0.0
+    for path, count in counts:
+        if covered >= target:
+            break
+        paths.append(path.decode('utf-8'))
+        covered += count
+    return paths
+
+
+def _is_conditional() -> bool:
+    return (
+        request.method in ('GET', 'HEAD')
+        and CONDITIONAL_PATHS.match(request.path) is not None
+        and UNCONDITIONAL_PATHS.search(request.path) is None
+    )
+
+
+def generation_etag(generation: str) -> str:
+    """The strong ETag of the response to the current request in the db generation `generation`."""
+    return stable_key(generation, request_cache_key())
+
+
+def generation_last_modified(generation: str) -> datetime:
+    """The time the db update of `generation` completed, None for the initial generation."""
+    # to the second, as HTTP dates, and without the nanoseconds of neo4j datetimes that fromisoformat() rejects
+    match = re.match(r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.\d+)?(Z|[+-]\d\d:\d\d)?', generation)
+    if match is None:
+        return None
+    last_modified = datetime.fromisoformat(match.group(1) + (match.group(2) or 'Z').replace('Z', '+00:00'))
+    return last_modified.astimezone(timezone.utc)
+
+
+def not_modified():
+    """
+    Answer a conditional request with 304 Not Modified if the client has the response of the current db generation.
+
+    Registered to run before the views. Only the generation this worker checked less than
+    CACHE_GENERATION_CHECK_INTERVAL seconds ago is used, so that neither Redis nor Neo4j are queried; otherwise the
+    request is handled as usual, which checks the generation again. If-None-Match takes precedence over
+    If-Modified-Since.
+    """
+    generation, checked = _generation, _generation_checked
+    g.cache_request_generation = generation
+    if (
+        generation is None
+        or checked is None
+        or monotonic() - checked >= CACHE_GENERATION_CHECK_INTERVAL
+        or not _is_conditional()
+    ):
+        return None
+    if request.if_none_match:
+        # any encoding of the response, the client has one it accepts; weak comparison as required for If-None-Match,
+        # since proxies and CDNs may pass the ETag of a response they recompress on as W/"..."
+        etag = generation_etag(generation)
+        modified = not any(
+            request.if_none_match.contains_weak(e) for e in (etag, f'{etag}-gzip', f'{etag}-br')
+        )
+    elif request.if_modified_since:
+        last_modified = generation_last_modified(generation)
+        modified = last_modified is None or last_modified > request.if_modified_since
+    else:
+        return None
+    if modified:
+        return None
+    return current_app.response_class(status=304)  # with the validators of add_validators()
+
+
+def _served(generation: str):
+    """Record the db generation of a value the current request is answered with, see add_validators()."""
+    if has_request_context():
+        g.setdefault('cache_generations', set()).add(generation)
+
+
+def add_validators(response: Response) -> Response:
+    """
+    Add the ETag and Last-Modified headers of the current db generation; registered to run after the views.
+
+    Only if the response is of the current generation: that of the cached values it was made of, see _served(), or
+    else of the generation known when the request started. A response of the previous generation, served while
+    the value is computed again, or computed just before the generation changed, gets no validators, so that
+    clients don't keep it until the next db update.
+    """
+    generation = _generation
+    served = g.get('cache_generations') or {g.get('cache_request_generation')}
+    if served != {generation}:
+        return response
+    if generation is not None and response.status_code in (200, 304) and _is_conditional():
+        # strong ETags differ by encoding, see serve_response()
+        encoding = response.headers.get('Content-Encoding')
+        response.set_etag(generation_etag(generation) + (f'-{encoding}' if encoding else ''))
+        last_modified = generation_last_modified(generation)
+        if last_modified is not None:
+            response.last_modified = last_modified
+    return response
+
+
+Entry = namedtuple('Entry', ['value', 'fresh_until'])
+"""A cached value and the time, in seconds since the epoch, after which it is stale and refreshed."""
+
+
+class LocalCache:
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        """
+        A least recently used cache of entries in the memory of the worker, bounded by their pickled size.
+
+        It saves the Redis round trip and the unpickling of hot entries. The values are shared by the threads of
+        the worker and must not be modified; responses are copied when they are read, see cached_call().
+
+        Args:
+            max_bytes (int): the total size of the entries kept
+            max_item_bytes (int): the size above which an entry is not kept
+        """
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries = OrderedDict()  # key -> (entry, size)
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Entry:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: str, entry: Entry, size: int):
+        if size > min(self.max_item_bytes, self.max_bytes):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (entry, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+LOCAL_CACHE = LocalCache(CACHE_LOCAL_MAX_BYTES, CACHE_LOCAL_MAX_ITEM_BYTES)
+
+
+def _get(key: str) -> Entry:
+    return _get_many([key])[0]
+
+
+def _get_many(keys: List[str]) -> List[Entry]:
+    """The entries of `keys` from the local cache where they are fresh there, the others from Redis in one MGET."""
+    entries = [LOCAL_CACHE.get(key) for key in keys]
+    now = time()
+    remote = [i for i, entry in enumerate(entries) if entry is None or entry.fresh_until < now]
+    if not remote:
+        return entries
+    try:
+        client = getattr(cache.cache, '_read_client', None)
+        if client is not None:
+            # raw, to know the size of the entries
+            prefix = cache.cache._get_prefix()
+            raws = client.mget([f'{prefix}{keys[i]}' for i in remote])
+            found = [(cache.cache.serializer.loads(raw), len(raw) if raw is not None else 0) for raw in raws]
+        else:
+            values = cache.get_many(*[keys[i] for i in remote])
+            found = [(value, len(pickle.dumps(value)) if value is not None else 0) for value in values]
+    except Exception:
+        current_app.logger.exception(f"cache get failed for {[keys[i] for i in remote]}")
+        return entries  # the stale local entries, if any
+    for i, (entry, size) in zip(remote, found):
+        if entry is not None:
+            if not isinstance(entry, Entry):  # cached before entries had a soft timeout
+                entry = Entry(entry, 0)
+            LOCAL_CACHE.set(keys[i], entry, size)
+            entries[i] = entry
+    return entries
+
+
+def _set(key: str, value, timeout: int = None, soft_timeout: int = None):
+    _set_many({key: value}, timeout, soft_timeout)
+
+
+def _set_many(values: Dict, timeout: int = None, soft_timeout: int = None):
+    """Cache the values by key, in one round trip to Redis."""
+    soft_timeout = soft_timeout if soft_timeout is not None else CACHE_SOFT_TIMEOUT
+    fresh_until = time() + soft_timeout
+    entries = {key: Entry(value, fresh_until) for key, value in values.items() if value is not None}
+    if not entries:
+        return
+    try:
+        cache.set_many(entries, timeout=timeout)
+    except Exception:
+        current_app.logger.exception(f"cache set failed for {list(entries)}")
+    for key, entry in entries.items():
+        LOCAL_CACHE.set(key, Entry(_copy(entry.value), fresh_until), len(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)))
+
+
+CompressedResponse = namedtuple('CompressedResponse', ['data', 'encoding', 'status', 'headers'])
+"""A response whose body was compressed once when it was cached, see compress_response() and serve_response()."""
+
+
+def compress_response(value):
+    """
+    A CompressedResponse of `value` if it is a response with a body of at least CACHE_COMPRESS_MIN_BYTES, else `value`.
+
+    The body is compressed with CACHE_COMPRESSION, brotli by default, or gzip; it is then stored compressed in the
+    cache, which saves Redis and worker memory, and sent as is to the clients that accept the encoding.
+    """
+    if (
+        not isinstance(value, Response)
+        or value.status_code != 200
+        or value.direct_passthrough
+        or 'Content-Encoding' in value.headers
+    ):
+        return value
+    data = value.get_data()
+    if len(data) < CACHE_COMPRESS_MIN_BYTES:
+        return value
+    if CACHE_COMPRESSION == 'br':
+        data, encoding = brotli.compress(data, quality=CACHE_BROTLI_QUALITY), 'br'
+    else:
+        data, encoding = gzip.compress(data, compresslevel=CACHE_GZIP_LEVEL, mtime=0), 'gzip'
+    headers = [(k, v) for k, v in value.headers if k != 'Content-Length']
+    return CompressedResponse(data, encoding, value.status, headers)
+
+
+def serve_response(value):
+    """
+    The response of a cached value: a CompressedResponse is sent compressed if the request accepts its encoding, and
+    decompressed otherwise. Other values are returned as they are.
+    """
+    if not isinstance(value, CompressedResponse):
+        return value
+    response = current_app.response_class(status=value.status, headers=value.headers)
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings[value.encoding]:
+        response.set_data(value.data)
+        response.headers['Content-Encoding'] = value.encoding
+    elif value.encoding == 'br':
+        response.set_data(brotli.decompress(value.data))
+    else:
+        response.set_data(gzip.decompress(value.data))
+    return response
+
+
+def _copy(value):
+    # a response is modified when it is sent, e.g. by flask_cors, so the one in the local cache is not shared
+    if isinstance(value, Response):
+        return value.__class__(value.get_data(), status=value.status, headers=Headers(value.headers))
+    return value
+
+
+def _lock(key: str):
+    """A Redis lock on computing the value of `key`, None if the cache is not Redis."""
+    client = getattr(cache.cache, '_write_client', None)
+    if client is None:
+        return None
+    # not thread local: a background refresh releases the lock taken by the request
+    return client.lock(f'{cache.cache._get_prefix()}lock/{key}', timeout=CACHE_LOCK_TIMEOUT, thread_local=False)
+
+
+def _release(lock, key: str):
+    try:
+        lock.release()
+    except LockError:
+        current_app.logger.warning(f"cache lock on {key} expired while computing the value")
+    except Exception:
+        current_app.logger.exception(f"cache lock release failed for {key}")
+
+
+def cached_call(key: str, funct: Callable, timeout: int = None, soft_timeout: int = None):
+    """
+    Return the cached value of `key` in the current db generation, or compute it with `funct()` and cache it.
+
+    A missing value is computed once for all workers ("single flight"): the first request takes a Redis lock on
+    the key and computes the value, while concurrent requests for it get the value of the previous generation if
+    there is one, or wait up to CACHE_LOCK_WAIT seconds for the value to be cached; after that they compute it too.
+
+    Values are kept for `timeout` seconds, by default CACHE_TIMEOUT, but are stale after `soft_timeout` seconds, by
+    default CACHE_SOFT_TIMEOUT: a stale value is still returned, while it is refreshed in the background by one
+    worker ("stale while revalidate"). Once computed, a value is never waited for again until it expires.
+
+    None is not cached. Errors of the cache backend are logged and the value computed as if it missed.
+    """
+    try:
+        generation = current_generation()
+    except Exception:
+        current_app.logger.exception("cache generation failed")
+        generation = None
+    if generation is None:
+        _served(None)
+        return funct()
+    key_in_generation = f'{generation}/{key}'
+    entry = _get(key_in_generation)
+    if entry is None:
+        return _single_flight(key, generation, funct, timeout, soft_timeout)
+    if entry.fresh_until < time():
+        _refresh(key_in_generation, funct, timeout, soft_timeout)
+    _served(generation)
+    return _copy(entry.value)
+
+
+def _single_flight(key: str, generation: str, funct: Callable, timeout: int = None, soft_timeout: int = None):
+    key_in_generation = f'{generation}/{key}'
+    try:
+        lock = _lock(key_in_generation)
+        acquired = lock is None or lock.acquire(blocking=False)
+    except Exception:
+        current_app.logger.exception(f"cache lock failed for {key_in_generation}")
+        lock, acquired = None, True
+    if acquired:
+        _served(generation)
+        try:
+            entry = _get(key_in_generation) if lock is not None else None  # cached since the miss?
+            if entry is not None:
+                return _copy(entry.value)
+            value = funct()
+            _set(key_in_generation, value, timeout, soft_timeout)
+            return value
+        finally:
+            if lock is not None:
+                _release(lock, key_in_generation)
+    # another request computes the value
+    previous_generation = _previous_generation
+    if previous_generation is not None:
+        entry = _get(f'{previous_generation}/{key}')
+        if entry is not None:
+            _served(previous_generation)  # no validators for it, see add_validators()
+            return _copy(entry.value)
+    _served(generation)
+    deadline = monotonic() + CACHE_LOCK_WAIT
+    while monotonic() < deadline:
+        sleep(CACHE_LOCK_POLL_INTERVAL)
+        entry = _get(key_in_generation)
+        if entry is not None:
+            return _copy(entry.value)
+        try:
+            if not lock.locked():  # failed, or the value is None
+                break
+        except Exception:
+            break
+    value = funct()
+    _set(key_in_generation, value, timeout, soft_timeout)
+    return value
+
+
+def cached_call_many(keys: Dict, funct: Callable, timeout: int = None, soft_timeout: int = None) -> Dict:
+    """
+    The values of several items, each cached under its own key, e.g. one per DOI.
+
+    The entries are read in one round trip to Redis and the missing items computed all at once with
+    `funct(missing_items)`, which must return their values by item. Stale values are returned and refreshed in
+    the background, as with cached_call(); each worker refreshes the stale items it could lock.
+
+    Args:
+        keys (Dict): the cache key of each item
+        funct (Callable): computes the values of a list of items
+
+    Returns:
+        (Dict): the value of each item
+    """
+    try:
+        generation = current_generation()
+    except Exception:
+        current_app.logger.exception("cache generation failed")
+        generation = None
+    _served(generation)
+    if generation is None:
+        return funct(list(keys))
+    keys_in_generation = {item: f'{generation}/{key}' for item, key in keys.items()}
+    entries = dict(zip(keys_in_generation, _get_many(list(keys_in_generation.values()))))
+    values = {item: _copy(entry.value) for item, entry in entries.items() if entry is not None}
+    missing = [item for item, entry in entries.items() if entry is None]
+    if missing:
+        computed = funct(missing)
+        _set_many({keys_in_generation[item]: computed.get(item) for item in missing}, timeout, soft_timeout)
+        values.update(computed)
+    now = time()
+    stale = [item for item, entry in entries.items() if entry is not None and entry.fresh_until < now]
+    if stale:
+        _refresh_many({item: keys_in_generation[item] for item in stale}, funct, timeout, soft_timeout)
+    return values
+
+
+_refresh_executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_THREADS, thread_name_prefix='cache-refresh')
+
+
+def _refresh(key: str, funct: Callable, timeout: int = None, soft_timeout: int = None):
+    """Recompute a stale value in a background thread, unless another request already does."""
+    _refresh_many({None: key}, lambda items: {None: funct()}, timeout, soft_timeout)
+
+
+def _refresh_many(keys: Dict, funct: Callable, timeout: int = None, soft_timeout: int = None):
+    """Recompute stale values in a background thread, those that another request doesn't already recompute."""
+    locks = {}
+    for item, key in keys.items():
+        try:
+            lock = _lock(key)
+            if lock is None or lock.acquire(blocking=False):
+                locks[item] = lock
+        except Exception:
+            current_app.logger.exception(f"cache lock failed for {key}")
+    if not locks:
+        return
+    app = current_app._get_current_object()
+
+    def refresh():
+        try:
+            values = funct(list(locks))
+            _set_many({keys[item]: values.get(item) for item in locks}, timeout, soft_timeout)
+        except Exception:
+            app.logger.exception(f"cache refresh failed for {[keys[item] for item in locks]}")
+        finally:
+            for item, lock in locks.items():
+                if lock is not None:
+                    _release(lock, keys[item])
+
+    # the view or the function may depend on the request, e.g. for its parameters
+    if has_request_context():
+        refresh = copy_current_request_context(refresh)
+    else:
+        refresh = _in_app_context(app, refresh)
+    _refresh_executor.submit(refresh)
+
+
+def _in_app_context(app, funct: Callable) -> Callable:
+    def in_app_context():
+        with app.app_context():
+            return funct()
+    return in_app_context
+
+
+def cached_view(timeout: int = None, soft_timeout: int = None, make_cache_key: Callable = request_cache_key):
+    """
+    Decorator caching the response of a view, by default under the key of the request, see request_cache_key().
+
+    Replaces Cache.cached(), whose key ignores the query string and the body of the request. See cached_call()
+    for the timeouts. The request is counted in the popularity of the cached paths, see record_hit(). Large
+    responses are cached compressed, see compress_response().
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def inner(*args, **kwargs):
+            record_hit()
+            value = cached_call(
+                make_cache_key(), lambda: compress_response(view_func(*args, **kwargs)), timeout, soft_timeout
+            )
+            return serve_response(value)
+        return inner
+    return decorator
+
+
+def memoize(timeout: int = None, soft_timeout: int = None, serialize: bool = False):
+    """
+    Decorator caching the result of a function by the values of its arguments, e.g. for the connexion controllers.
+
+    The arguments are bound to the signature of the function, so that passing them by position or by name, or
+    leaving out a default, gives the same key. Replaces Cache.memoize(), whose key depends on the repr of the
+    arguments. See cached_call() for the timeouts. The request the function is called in, if any, is counted in
+    the popularity of the cached paths, see record_hit().
+
+    With `serialize`, dictionaries and lists returned by the function are cached as the JSON response connexion
+    would make of them, compressed, see compress_response(), so that a cache hit is not serialized again; the
+    decorated function then returns that response.
+    """
+    def decorator(funct):
+        signature = inspect.signature(funct)
+        name = f'{funct.__module__}.{funct.__qualname__}'
+
+        @wraps(funct)
+        def inner(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = f'memoize/{name}/{stable_key(bound.arguments)}'
+            record_hit()
+            if not serialize:
+                return cached_call(key, lambda: funct(*args, **kwargs), timeout, soft_timeout)
+
+            def compute():
+                value = funct(*args, **kwargs)
+                return compress_response(json_response(value)) if isinstance(value, (dict, list)) else value
+            return serve_response(cached_call(key, compute, timeout, soft_timeout))
+        return inner
+    return decorator
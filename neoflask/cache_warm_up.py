@@ -1,76 +1,274 @@
+"""
+Warm-up of the cache of the API: every page of /api/v2/papers/ and, for every paper listed, /api/v2/paper/ by slug
+and by DOI and /api/v2/docmap/.
+
+The requests are made by a pool of workers, over HTTP with pooled connections to the API at base_url or, with
+--in-process, by calling the controllers directly in this process. Both fill the same cache, the latter without the
+HTTP round trips and JSON encoding and decoding; base_url is then only used for the external links rendered in the
+docmaps. A time budget stops the warm-up after that many seconds, e.g.:
+
+    python -m neoflask.cache_warm_up http://localhost:5000 --workers 16 --budget 1800
+    python -m neoflask.cache_warm_up http://localhost:5000 --in-process
+
+The paths most requested by the users, as counted by neoflask.cache.record_hit(), are warmed up first: as many as
+account for --coverage of the counted requests. With --popular-only the warm-up stops there and leaves the long tail
+to be cached when it is requested, e.g. to have the hot set warm within minutes of a db update:
+
+    python -m neoflask.cache_warm_up http://localhost:5000 --coverage 0.95 --popular-only
+"""
+
 from argparse import ArgumentParser
-from requests import get
-from tqdm import tqdm, trange
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Iterable, List
+from requests import Session
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 import common.logging
-from . import EEB_INTERNAL_API
+from . import EEB_INTERNAL_API, app
+from .cache import WARM_UP_HEADER, popular_paths
 
 logger = common.logging.get_logger(__name__)
 
+DEFAULT_WORKERS = 8
+DEFAULT_COVERAGE = 0.95
+
+# the arguments connexion passes to papers_get() for the parameters left out, see swagger.yaml; the in-process
+# calls must pass the same ones to fill the cache entries that the HTTP requests read
+PAPERS_DEFAULTS = dict(per_page=10, sort_by='reviewing-date', sort_order='desc')
+
+
+class HttpClient:
+
+    def __init__(self, base_url: str, pool_size: int = DEFAULT_WORKERS):
+        """Requests the API at base_url with a session whose connection pool is shared by the workers."""
+        self.base_url = base_url
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers[WARM_UP_HEADER] = '1'
+
+    def _get(self, path: str, params: Dict = None):
+        response = self.session.get(f"{self.base_url}{path}", params=params)
+        response.raise_for_status()
+        return response
+
+    def get_json(self, path: str, params: Dict = None):
+        return self._get(path, params).json()
+
+    def get(self, path: str):
+        # any path, e.g. one of popular_paths(), which may not be JSON, e.g. /sitemap.xml or a redirect
+        self._get(path)
+
+    def papers(self, page: int) -> Dict:
+        return self.get_json("/api/v2/papers/", {"page": page})
+
+    def paper(self, doi: str = None, slug: str = None):
+        self.get_json("/api/v2/paper/", {"doi": doi} if doi else {"slug": slug})
+
+    def docmap(self, doi: str):
+        self.get_json(f"/api/v2/docmap/{doi}")
+
+    def close(self):
+        self.session.close()
+
+
+class InProcessClient:
+
+    def __init__(self, base_url: str):
+        """Calls the controllers of the API in this process, as if requested at base_url."""
+        # imported here since it registers the views on the app
+        from swagger_server.controllers.refereed_preprint_details_controller import paper_get, papers_get
+        from .views import docmap_semantic_doi
+        self.base_url = base_url
+        self.app = app
+        self._paper_get = paper_get
+        self._papers_get = papers_get
+        self._docmap = docmap_semantic_doi
+
+    def _context(self, path: str, params: Dict = None):
+        # the docmaps render external links from the URL of the request, and the views key the cache on its path
+        return self.app.test_request_context(
+            path, base_url=self.base_url, query_string=params, headers={WARM_UP_HEADER: '1'}
+        )
+
+    def get(self, path: str):
+        # any path, e.g. one of popular_paths(), through the whole app but without HTTP
+        response = self.app.test_client().get(path, base_url=self.base_url, headers={WARM_UP_HEADER: '1'})
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.status_code} for {path}")
+
+    def papers(self, page: int) -> Dict:
+        with self._context("/api/v2/papers/", {"page": page}):
+            return self._papers_get(page=page, **PAPERS_DEFAULTS).get_json()  # cached serialized
+
+    def paper(self, doi: str = None, slug: str = None):
+        with self._context("/api/v2/paper/", {"doi": doi} if doi else {"slug": slug}):
+            self._paper_get(doi=doi, slug=slug)
+
+    def docmap(self, doi: str):
+        with self._context(f"/api/v2/docmap/{doi}"):
+            response = self.app.make_response(self._docmap(doi=doi))
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.status_code} for docmap {doi}")
+
+    def close(self):
+        pass
+
 
-def get_json(base_url, path):
-    url = f"{base_url}{path}"
-    response = get(url)
-    response.raise_for_status()
-    return response.json()
+class WarmUp:
 
+    def __init__(self, client, workers: int = DEFAULT_WORKERS, budget: float = None, no_progress: bool = False):
+        """
+        Runs the requests of the warm-up with a pool of workers and counts them by kind.
 
-def get_paper_ids(papers):
-    return [
-        {"doi": paper["doi"], "slug": paper["slug"]}
-        for paper in papers["items"]
-    ]
+        Args:
+            client (HttpClient | InProcessClient): makes the requests
+            workers (int): the number of requests made concurrently
+            budget (float): seconds after which the remaining requests are skipped, no limit if None
+            no_progress (bool): do not output progress bars
+        """
+        self.client = client
+        self.workers = workers
+        self.budget = budget
+        self.no_progress = no_progress
+        self.start = monotonic()
+        self.deadline = self.start + budget if budget is not None else None
+        self.counts = {}  # kind -> Counter of ok, failed and skipped requests
+        self.seconds = Counter()  # kind -> seconds spent in the requests that were made
+        self._lock = Lock()
 
+    def expired(self) -> bool:
+        return self.deadline is not None and monotonic() > self.deadline
 
-def warmup_individual_method(base_url, get_path, params, no_progress):
-    logger.info(f"Warming up cache for {get_path('{param}')} with {len(params)} params.")
-    with logging_redirect_tqdm():
-        for param in tqdm(params, disable=no_progress):
-            path = get_path(param)
-            get_json(base_url, path)
+    def _call(self, kind: str, funct: Callable, kwargs: Dict):
+        if self.expired():
+            outcome, result, seconds = 'skipped', None, 0.0
+        else:
+            start = monotonic()
+            try:
+                outcome, result = 'ok', funct(**kwargs)
+            except Exception as e:
+                logger.error(f"warming up {kind} {kwargs} failed: {e}")
+                outcome, result = 'failed', None
+            seconds = monotonic() - start
+        with self._lock:
+            self.counts.setdefault(kind, Counter())[outcome] += 1
+            self.seconds[kind] += seconds
+        return result
 
+    def run(self, requests: Iterable) -> List:
+        """
+        Make requests, given as (kind, funct, kwargs) tuples, and return the results of funct(**kwargs) in order.
 
-def warmup_paged_method(base_url, path_first_page, no_progress):
-    response = get_json(base_url, path_first_page)
-    yield get_paper_ids(response)
-    n_pages = response["paging"]["totalPages"]
+        None is returned for the requests that failed or were skipped.
+        """
+        requests = list(requests)
+        results = [None] * len(requests)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cache_warm_up') as executor:
+            futures = {executor.submit(self._call, *request): i for i, request in enumerate(requests)}
+            with logging_redirect_tqdm():
+                for future in tqdm(as_completed(futures), total=len(futures), disable=self.no_progress):
+                    results[futures[future]] = future.result()
+        return results
 
-    with logging_redirect_tqdm():
-        for page in trange(2, n_pages + 1, disable=no_progress):
-            path_next_page = response["paging"]["next"]
-            if not path_next_page:
-                logger.error(f"Expected {n_pages} pages, but only got {page - 1}")
-            response = get_json(base_url, path_next_page)
-            yield get_paper_ids(response)
-        if response["paging"]["next"]:
-            logger.error(f"Expected {n_pages} pages, but got more.")
+    def report(self) -> Dict:
+        """The number of requests by kind and outcome, with the mean latency and the overall throughput."""
+        elapsed = monotonic() - self.start
+        kinds = {}
+        for kind, counts in self.counts.items():
+            made = counts['ok'] + counts['failed']
+            kinds[kind] = {
+                'ok': counts['ok'],
+                'failed': counts['failed'],
+                'skipped': counts['skipped'],
+                'mean_latency_ms': round(self.seconds[kind] / made * 1000, 1) if made else None,
+            }
+        made = sum(k['ok'] + k['failed'] for k in kinds.values())
+        return {
+            'seconds': round(elapsed, 1),
+            'requests': made,
+            'requests_per_second': round(made / elapsed, 1) if elapsed else None,
+            'kinds': kinds,
+        }
 
 
-def cache_warm_up(base_url, no_progress=False):
-    logger.info(f"Warming up cache using base URL {base_url}")
+def crawl(warm_up: WarmUp, client):
+    """Every page of /api/v2/papers/, then the papers listed by slug and by DOI and their docmaps."""
+    # the pages are read from the rank lists of sdg.sd_precompute at the same cost whatever their number, so all
+    # pages after the first are requested at once instead of following the next links
+    logger.info("warming up /api/v2/papers/")
+    first_page, = warm_up.run([('papers', client.papers, {'page': 1})])
+    if first_page is None:
+        logger.error("could not get the first page of /api/v2/papers/")
+        return
+    pages = [first_page] + warm_up.run(
+        ('papers', client.papers, {'page': page})
+        for page in range(2, first_page["paging"]["totalPages"] + 1)
+    )
+    papers = [paper for page in pages if page is not None for paper in page["items"]]
 
-    path_papers = "/api/v2/papers/"
-    logger.info("warming up %s", path_papers)
-    paper_ids = [
-        pid
-        for pids in warmup_paged_method(base_url, path_papers, no_progress)
-        for pid in pids
-    ]
+    logger.info("warming up /api/v2/paper/ for slugs and DOIs and /api/v2/docmap/{doi}")
+    slugs = sorted(set(paper["slug"] for paper in papers))
+    dois = sorted(set(paper["doi"] for paper in papers))
+    warm_up.run(
+        [('paper by slug', client.paper, {'slug': slug}) for slug in slugs]
+        + [('paper by doi', client.paper, {'doi': doi}) for doi in dois]
+        + [('docmap', client.docmap, {'doi': doi}) for doi in dois]
+    )
 
-    logger.info("warming up /api/v2/paper/ for slugs and DOIs")
-    slugs = set([pid["slug"] for pid in paper_ids])
-    dois = set([pid["doi"] for pid in paper_ids])
-    warmup_individual_method(base_url, lambda slug: f"/api/v2/paper/?slug={slug}", slugs, no_progress)
-    warmup_individual_method(base_url, lambda doi: f"/api/v2/paper/?doi={doi}", dois, no_progress)
 
-    logger.info("warming up /api/v2/docmap/{doi}")
-    warmup_individual_method(base_url, lambda doi: f"/api/v2/docmap/{doi}", dois, no_progress)
+def cache_warm_up(
+    base_url, workers=DEFAULT_WORKERS, budget=None, in_process=False,
+    coverage=DEFAULT_COVERAGE, popular_only=False, no_progress=False,
+) -> Dict:
+    logger.info(f"Warming up cache {'in process' if in_process else 'using base URL'} {base_url} with {workers} workers")
+    client = InProcessClient(base_url) if in_process else HttpClient(base_url, pool_size=workers)
+    warm_up = WarmUp(client, workers=workers, budget=budget, no_progress=no_progress)
+    try:
+        if coverage:
+            try:
+                with app.app_context():
+                    paths = popular_paths(coverage)
+            except Exception as e:
+                logger.error(f"could not get the popular paths: {e}")
+                paths = []
+            logger.info(f"warming up the {len(paths)} most popular paths, {coverage:.0%} of the counted requests")
+            warm_up.run(('popular', client.get, {'path': path}) for path in paths)
+        if not popular_only:
+            crawl(warm_up, client)
+    finally:
+        client.close()
+    report = warm_up.report()
+    logger.info(
+        f"warmed up {report['requests']} requests in {report['seconds']} s ({report['requests_per_second']} requests/s)"
+    )
+    for kind, counts in report['kinds'].items():
+        logger.info(
+            f"{kind}: {counts['ok']} ok, {counts['failed']} failed, {counts['skipped']} skipped, "
+            f"{counts['mean_latency_ms']} ms mean latency"
+        )
+    if warm_up.expired():
+        logger.warning(f"time budget of {budget} s exceeded, the remaining requests were skipped")
+    return report
 
 
 if __name__ == '__main__':
     common.logging.configure_logging()
-    parser = ArgumentParser(description='Loading meca or CORD-19 archives into neo4j.')
-    parser.add_argument('base_url', default=EEB_INTERNAL_API,help='Host address to be warmed up')
+    parser = ArgumentParser(description='Warms up the cache of the API.')
+    parser.add_argument('base_url', nargs='?', default=EEB_INTERNAL_API, help='Host address to be warmed up')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of concurrent requests')
+    parser.add_argument('--budget', type=float, help='Seconds after which the warm-up stops')
+    parser.add_argument('--in-process', action='store_true', help='Call the controllers in this process instead of requesting base_url')
+    parser.add_argument('--coverage', type=float, default=DEFAULT_COVERAGE, help='Share of the counted requests whose paths are warmed up first, 0 to not warm up popular paths')
+    parser.add_argument('--popular-only', action='store_true', help='Only warm up the popular paths')
     parser.add_argument('--no-progress', action='store_true', help='Do not output progress bars')
     args = parser.parse_args()
-    cache_warm_up(args.base_url, no_progress=args.no_progress)
+    cache_warm_up(
+        args.base_url, workers=args.workers, budget=args.budget, in_process=args.in_process,
+        coverage=args.coverage, popular_only=args.popular_only, no_progress=args.no_progress,
+    )
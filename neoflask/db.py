@@ -0,0 +1,21 @@
+from neotools import get_db, NEO_MAX_CONNECTION_POOL_SIZE, NEO_WARM_UP
+from neotools.warmup import registered_queries, warm_up
+
+
+def init_db(app):
+    """
+    Create the neo4j driver of this worker process when the app starts.
+
+    The driver and its connection pool are then shared by all requests served by the process and closed when the
+    process exits (see neotools.get_db). Unless NEO_WARM_UP is false, the read queries of the API are then compiled
+    so that their plans are cached by Neo4j before the first request; a database that can't be reached only delays
+    this to the first requests.
+    """
+    db = get_db()
+    app.logger.info(f"neo4j driver ready, connection pool of max. {NEO_MAX_CONNECTION_POOL_SIZE} connections")
+    if NEO_WARM_UP:
+        from . import queries
+        try:
+            warm_up(db, registered_queries(module=queries.__name__).values())
+        except Exception as e:  # e.g. database not available yet
+            app.logger.warning(f"query warm-up skipped: {e}")
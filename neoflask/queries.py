@@ -1,7 +1,7 @@
-from neotools.db import Query
+from neotools.db import ReadQuery
 
 
-class COVID19(Query):
+class COVID19(ReadQuery):
 
     code = '''
 WITH "2019-nCoV OR 2019nCoV OR COVID-19 OR SARS-CoV-2 OR SARS-CoV2 OR SAR-CoV2 OR SRAS-CoV-2" AS search_query
@@ -36,7 +36,7 @@ ORDER BY DATETIME(pub_date) DESC, score DESC
     returns = ['id', 'pub_date', 'title', 'abstract', 'version', 'doi', 'journal', 'score']
 
 
-class REFEREED_PREPRINTS(Query):
+class REFEREED_PREPRINTS(ReadQuery):
 
     code = '''
 MATCH (refprep:VizCollection {name: "refereed-preprints"})-[:HasSubCol]->(revservice:VizSubCollection)
@@ -79,7 +79,7 @@ LIMIT $pagesize
     ] #, 'review_process']
 
 
-class REFEREED_PREPRINT_V2(Query):
+class REFEREED_PREPRINT_V2(ReadQuery):
     code = """
 MATCH (col:VizCollection {name: "refereed-preprints"})-[:HasSubCol]->(subcol:VizSubCollection)-[:HasPaper]->(vzp:VizPaper)
 WHERE (
@@ -184,11 +184,40 @@ RETURN {
         'doi': {'req_param': 'doi', 'default': None},
         'slug': {'req_param': 'slug', 'default': None}
       }
+    examples = [  # the paper is requested by either its DOI or its slug
+        {'doi': '10.1101/2020.01.01.000001', 'slug': None},
+        {'doi': None, 'slug': 'a-refereed-preprint'},
+    ]
     returns = ['refereed_preprint']
 
-class REFEREED_PREPRINTS_V2(Query):
-
+class REFEREED_PREPRINT_DOCUMENT_V2(ReadQuery):
+    # the RefereedPreprint as rendered by sdg.sd_precompute, see REFEREED_PREPRINT_V2; no record if not rendered
     code = '''
+CALL {
+  MATCH (vzp:VizPaper {doi: $doi})
+  RETURN vzp
+  UNION
+  MATCH (vzp:VizPaper {slug: $slug})
+  RETURN vzp
+}
+WITH vzp
+WHERE vzp.refereed_preprint_json IS NOT NULL
+RETURN vzp.refereed_preprint_json AS document
+LIMIT 1
+'''
+    map = {
+        'doi': {'req_param': 'doi', 'default': None},
+        'slug': {'req_param': 'slug', 'default': None}
+      }
+    examples = [  # the paper is requested by either its DOI or its slug
+        {'doi': '10.1101/2020.01.01.000001', 'slug': None},
+        {'doi': None, 'slug': 'a-refereed-preprint'},
+    ]
+    returns = ['document']
+
+class _REFEREED_PREPRINTS_PAGE(ReadQuery):
+    # the DOIs of a page of refereed preprints, filtered and sorted; subclasses render the items of the page
+    code_page = '''
 // Perform full-text search if `query` is provided
 CALL {
   WITH $lucene_query AS searchQuery
@@ -246,13 +275,56 @@ WITH
 ORDER BY
 // parameterized sort order
 CASE WHEN $sort_ascending THEN sort_field ELSE null END ASC,
-CASE WHEN $sort_ascending THEN null ELSE sort_field END DESC
+CASE WHEN $sort_ascending THEN null ELSE sort_field END DESC,
+doi ASC  // ties in a total order, the same as the lists ranked by sdg.sd_precompute, for paging after a DOI
 
 WITH COLLECT(DISTINCT doi) AS dois
-WITH 
+// paging, by page number or after the DOI of the last item of the previous page; a DOI no longer listed gives an empty page
+WITH
+  dois,
+  CASE
+    WHEN $after IS NULL THEN $page * $per_page
+    WHEN $after IN dois THEN apoc.coll.indexOf(dois, $after) + 1
+    ELSE SIZE(dois)
+  END AS start
+WITH
   SIZE(dois) AS n_total,
-  dois[$page * $per_page..($page + 1) * $per_page] AS dois  // paging
+  start,
+  dois[start..start + $per_page] AS dois
+'''
+    code_items = ''
+    map_page = {
+      'reviewed_by': {'req_param': 'reviewed_by', 'default': None},
+      'lucene_query': {'req_param': 'lucene_query', 'default': None},
+      'published_in': {'req_param': 'published_in', 'default': None},
+
+      'sort_by': {'req_param': 'sort_by', 'default': 'preprint_date'},
+      'sort_ascending': {'req_param': 'sort_ascending', 'default': False},
 
+      'page': {'req_param': 'page', 'default': 0},
+      'per_page': {'req_param': 'per_page', 'default': 10},
+      'after': {'req_param': 'after', 'default': None},
+    }
+    # the unranked pages are requested with a search or several reviewing services, see REFEREED_PREPRINT_DOCUMENTS_RANKED_V2
+    examples_page = [{
+      'reviewed_by': ['review commons', 'elife'],
+      'lucene_query': '"covid"',
+      'published_in': ['Life Science Alliance'],
+      'after': '10.1101/2020.01.01.000001',
+    }]
+
+    def __init_subclass__(cls, **kwargs):
+        # the code, map and examples are composed once per subclass, before they are validated and frozen by Query
+        cls.code = f'''{cls.code_page}
+{cls.code_items}
+'''
+        cls.map = cls.map_page
+        cls.examples = cls.examples_page
+        super().__init_subclass__(**kwargs)
+
+class REFEREED_PREPRINTS_V2(_REFEREED_PREPRINTS_PAGE):
+
+    code_items = '''
 CALL {
   WITH dois
   // construct the return object
@@ -351,27 +423,76 @@ CALL {
   }) AS items
 }
 
-RETURN n_total, items
+RETURN n_total, start, items
     '''
-    map = {
-      'reviewed_by': {'req_param': 'reviewed_by', 'default': None},
-      'lucene_query': {'req_param': 'lucene_query', 'default': None},
-      'published_in': {'req_param': 'published_in', 'default': None},
 
-      'sort_by': {'req_param': 'sort_by', 'default': 'preprint_date'},
-      'sort_ascending': {'req_param': 'sort_ascending', 'default': False},
+    returns = [
+      'n_total',
+      'start',
+      'items',
+    ]
 
-      'page': {'req_param': 'page', 'default': 0},
-      'per_page': {'req_param': 'per_page', 'default': 10},
-    }
+class REFEREED_PREPRINT_DOCUMENTS_V2(_REFEREED_PREPRINTS_PAGE):
+    # the items as rendered by sdg.sd_precompute; n_items is the number of DOIs of the page, the items of those not
+    # rendered are missing
+    code_items = '''
+CALL {
+  WITH dois
+  UNWIND dois AS doi
+  OPTIONAL MATCH (vzp:VizPaper {doi: doi})
+  WITH doi, COLLECT(vzp.refereed_preprint_json)[0] AS document
+  RETURN COLLECT(document) AS items
+}
+
+RETURN n_total, start, items, SIZE(dois) AS n_items
+    '''
 
     returns = [
       'n_total',
+      'start',
       'items',
+      'n_items',
     ]
 
 
-class COLLECTION_NAMES(Query):
+class REFEREED_PREPRINT_DOCUMENTS_RANKED_V2(_REFEREED_PREPRINTS_PAGE):
+    # same as REFEREED_PREPRINT_DOCUMENTS_V2 for the lists ranked by sdg.sd_precompute, i.e. the refereed preprints of
+    # one or all reviewing services in one sort order; the page is read from the index on (list, rank) without
+    # collecting and sorting the whole list
+    code_page = '''
+OPTIONAL MATCH (first:VizPaperRank {list: $list, rank: 0})
+OPTIONAL MATCH (last_item:VizPaperRank {list: $list, doi: $after})
+WITH
+  COALESCE(first.n_total, 0) AS n_total,
+  CASE
+    WHEN $after IS NULL THEN $page * $per_page
+    ELSE COALESCE(last_item.rank + 1, first.n_total, 0)
+  END AS start
+CALL {
+  WITH start
+  MATCH (r:VizPaperRank)
+  WHERE r.list = $list AND r.rank IN range(start, start + $per_page - 1)
+  WITH r
+  ORDER BY r.rank
+  RETURN COLLECT(r.doi) AS dois
+}
+WITH n_total, start, dois
+'''
+    code_items = REFEREED_PREPRINT_DOCUMENTS_V2.code_items
+    map_page = {
+      'list': {'req_param': 'list', 'default': None},
+      'page': {'req_param': 'page', 'default': 0},
+      'per_page': {'req_param': 'per_page', 'default': 10},
+      'after': {'req_param': 'after', 'default': None},
+    }
+    examples_page = [
+      {'list': '|preprint_date|desc', 'after': None},
+      {'list': 'review commons|preprint_date|desc', 'after': '10.1101/2020.01.01.000001'},
+    ]
+    returns = REFEREED_PREPRINT_DOCUMENTS_V2.returns
+
+
+class COLLECTION_NAMES(ReadQuery):
     code = '''
 MATCH (subject:Subject)
 RETURN subject.text AS subject
@@ -379,7 +500,7 @@ RETURN subject.text AS subject
     returns = ['subject']
 
 
-class SUBJECT_COLLECTIONS(Query):
+class SUBJECT_COLLECTIONS(ReadQuery):
 
     code = '''
 MATCH (a:Article)-[:has_subject]->(subject:Subject)
@@ -399,7 +520,7 @@ ORDER BY DATETIME(pub_date) DESC, score DESC
     returns = ['id', 'pub_date', 'title', 'abstract', 'version', 'doi', 'journal', 'score']
 
 
-class BY_SLUG(Query):
+class BY_SLUG(ReadQuery):
 
     code = '''
 // Get the most recent version of the article with the given slug
@@ -548,7 +669,7 @@ RETURN
       'highlighted_entities',
       'slug'
     ]
-class BY_DOIS(Query):
+class BY_DOIS(ReadQuery):
 
     code = '''
 // Get the most recent version of each article that has one of the given DOIs
@@ -700,7 +821,7 @@ RETURN
     ]
 
 
-class FIG_BY_DOI_IDX(Query):
+class FIG_BY_DOI_IDX(ReadQuery):
 
     code = '''
 //fig by doi and index position
@@ -723,7 +844,7 @@ ORDER BY version DESC, fig_idx ASC
     returns = ['doi', 'version', 'title', 'fig_title', 'fig_label', 'caption', 'fig_idx']
 
 
-class PANEL_BY_NEO_ID(Query):
+class PANEL_BY_NEO_ID(ReadQuery):
 
     code = '''
 MATCH (p:Panel)-->(ctCondTag)-->(h:H_Entity)
@@ -734,7 +855,7 @@ RETURN p.caption AS caption, COLLECT(DISTINCT h) AS tags
     map = {'id': {'req_param': 'id', 'default': ''}}
 
 
-class REVIEW_PROCESS_BY_DOI(Query):
+class REVIEW_PROCESS_BY_DOI(ReadQuery):
 
     code = '''
 MATCH (a:Article {doi: $doi})-[r:HasReview]->(review:Review)
@@ -748,7 +869,7 @@ RETURN a.doi as doi, {reviews: COLLECT(DISTINCT review {.*, id: id(review)}), re
     returns = ['doi', 'review_process']
 
 
-class _DOCMAP(Query):
+class _DOCMAP(ReadQuery):
     """Base class to filter and construct DocMaps.
 
     The creation of the DocMaps is encapsulated in `code_docmap_creation`. This
@@ -880,14 +1001,13 @@ RETURN docmap
 
     returns = ['docmap']
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.code = f'''{self.__class__.code_docmap_filtering}
-{self.__class__.code_docmap_creation}
+    def __init_subclass__(cls, **kwargs):
+        # the code, map and examples are composed once per subclass, before they are validated and frozen by Query
+        cls.code = f'''{cls.code_docmap_filtering}
+{cls.code_docmap_creation}
 '''
-        self.map = {}
-        self.map.update(self.__class__.map_docmap_creation)
-        self.map.update(self.__class__.map_docmap_filtering)
+        cls.map = {**cls.map_docmap_creation, **cls.map_docmap_filtering}
+        super().__init_subclass__(**kwargs)
 
 class DOCMAP_BY_DOI(_DOCMAP):
     code_docmap_filtering = '''
@@ -943,7 +1063,7 @@ WITH DISTINCT preprint
       },
     }
 
-class SEARCH_REVIEWS(Query):
+class SEARCH_REVIEWS(ReadQuery):
     code = '''
 MATCH (
   col:VizCollection {name: "refereed-preprints"}
@@ -986,7 +1106,7 @@ LIMIT $page_size
     }
     returns = ['doi']
 
-class REVIEW_MATERIAL_BY_ID(Query):
+class REVIEW_MATERIAL_BY_ID(ReadQuery):
     code = '''
 MATCH (r)
 WHERE
@@ -1063,7 +1183,7 @@ RETURN docmap
     returns = ['docmap']
 
 
-class DESCRIBE_REVIEWING_SERVICES(Query):
+class DESCRIBE_REVIEWING_SERVICES(ReadQuery):
     code = '''
 MATCH (r:ReviewingService)
 RETURN
@@ -1077,7 +1197,7 @@ RETURN
     returns = ['name', 'url', 'peer_review_policy', 'author_driven_submissions', 'post_review_decision', 'pre_review_triage']
 
 
-class DESCRIBE_REVIEWING_SERVICES_V2(Query):
+class DESCRIBE_REVIEWING_SERVICES_V2(ReadQuery):
     code = '''
 MATCH
     (col:VizCollection {name: "refereed-preprints"})-[:HasSubCol]->(subcol:VizSubCollection)-[:HasDesciption]->(descriptor:VizDescriptor)
@@ -1109,7 +1229,7 @@ RETURN
     ]
 
 
-class DESCRIBE_PUBLISHERS(Query):
+class DESCRIBE_PUBLISHERS(ReadQuery):
     code = '''
 MATCH (col:VizCollection {name: "refereed-preprints"})-[:HasSubCol]->(subcol:VizSubCollection)-[:HasPaper]->(vzp:VizPaper)
 MATCH (a:Article {doi: vzp.doi})
@@ -1124,7 +1244,7 @@ ORDER BY TOLOWER(id) ASC
     returns = ['id', 'n_papers']
 
 
-class BY_REVIEWING_SERVICE(Query):
+class BY_REVIEWING_SERVICE(ReadQuery):
 
     code = '''
 // Using precomputed Viz nodes
@@ -1147,7 +1267,7 @@ RETURN
     returns = ['id', 'papers', 'reviewing_service_description']
 
 
-class BY_AUTO_TOPICS(Query):
+class BY_AUTO_TOPICS(ReadQuery):
 
     code = '''
 // Using precomputed Viz nodes
@@ -1196,7 +1316,7 @@ RETURN
     returns = ['id', 'topics', 'topics_name', 'entity_highlighted_names', 'papers']
 
 
-class AUTOMAGIC(Query):
+class AUTOMAGIC(ReadQuery):
 
     code = '''
 // using precomputed Viz nodes
@@ -1227,7 +1347,7 @@ RETURN subcol.name AS id, COLLECT(paper_j) AS papers
     returns = ['id', 'papers']
 
 
-class LUCENE_SEARCH(Query):
+class LUCENE_SEARCH(ReadQuery):
     code = '''
 // Full-text search on multiple indices.
 
@@ -1290,7 +1410,7 @@ LIMIT 10
     returns = ['doi', 'info', 'score', 'source', 'query']
 
 
-class SEARCH_DOI(Query):
+class SEARCH_DOI(ReadQuery):
     code = '''
 WITH $query AS query
 MATCH (article:SDArticle)
@@ -1301,7 +1421,7 @@ RETURN
     map = {'query': {'req_param': 'search_string', 'default': ''}}
     returns = ['doi', 'info', 'score', 'source', 'query']
 
-class STATS(Query):
+class STATS(ReadQuery):
     code = '''
 MATCH (h:UpdateStatus)
 RETURN
@@ -1314,3 +1434,11 @@ RETURN
   h.update_completed AS last_updated
     '''
     returns = ['total_nodes', 'preprints', 'refereed_preprints', 'autoannotated_preprints', 'num_docmaps', 'num_reviews', 'last_updated']
+
+class DB_GENERATION(ReadQuery):
+    # changes each time a db update completes, see sdg/update_close.cql
+    code = '''
+MATCH (h:UpdateStatus)
+RETURN h.update_completed AS update_completed
+    '''
+    returns = ['update_completed']
@@ -0,0 +1,127 @@
+"""
+JSON serialisation of the responses of the API, for jsonify() as for the connexion controllers.
+
+JSONProvider serialises with orjson, a JSON library written in Rust, or with the json module of the standard library
+when JSON_SERIALIZER is set to 'json'. Both give the output json.dumps() gives with
+the JSON encoder of the app: the same formatting, key order and escaping of non-ASCII characters, and the same
+types encoded by the encoder's default(); only floats may be written differently, e.g. 1e16 instead of 1e+16. The
+temporal types of neo4j are written in ISO 8601 format, except durations which are written as json writes them, as
+lists of months, days, seconds and nanoseconds, like points as lists of coordinates.
+"""
+
+import json
+import os
+import re
+from typing import Type
+from flask import Response, current_app
+from flask.json.provider import DefaultJSONProvider
+import neo4j.spatial
+import neo4j.time
+import orjson
+
+JSON_SERIALIZER = os.getenv('JSON_SERIALIZER', 'orjson')
+
+NEO4J_TEMPORAL_TYPES = (neo4j.time.DateTime, neo4j.time.Date, neo4j.time.Time)
+# tuples, which json writes as lists but orjson only does for tuple itself
+NEO4J_TUPLE_TYPES = (neo4j.time.Duration, neo4j.spatial.Point)
+
+# the characters json.dumps() escapes with ensure_ascii, besides the control characters orjson escapes too
+_NON_ASCII = re.compile('[\x7f-\U0010ffff]')
+
+
+def _escape(match) -> str:
+    code = ord(match.group())
+    if code > 0xffff:  # as a UTF-16 surrogate pair
+        code -= 0x10000
+        return '\\u%04x\\u%04x' % (0xd800 | (code >> 10), 0xdc00 | (code & 0x3ff))
+    return '\\u%04x' % code
+
+
+class JSONProvider(DefaultJSONProvider):
+
+    def __init__(self, app, encoder: Type[json.JSONEncoder] = json.JSONEncoder, serializer: str = JSON_SERIALIZER):
+        """
+        The JSON provider of the app, see module docstring.
+
+        Args:
+            app (Flask): the app
+            encoder (Type[json.JSONEncoder]): the encoder of the types json does not encode, through its default()
+            serializer (str): 'orjson' or 'json'
+        """
+        super().__init__(app)
+        if serializer not in ('orjson', 'json'):
+            raise ValueError(f"serializer must be 'orjson' or 'json', not '{serializer}'")
+        self.encoder = encoder
+        self.serializer = serializer
+        self._default = encoder().default  # the encoders have no state
+
+    def _option(self, config_key: str, default):
+        # the deprecated config keys of Flask 2.2 take precedence, as for DefaultJSONProvider
+        value = self._app.config.get(config_key)
+        return default if value is None else value
+
+    def default(self, o):
+        if isinstance(o, NEO4J_TEMPORAL_TYPES):
+            return o.iso_format()
+        if isinstance(o, NEO4J_TUPLE_TYPES):
+            return list(o)
+        return self._default(o)
+
+    def dumpb(self, obj, **kwargs) -> bytes:
+        """Serialize data as JSON to UTF-8 encoded bytes, see dumps()."""
+        sort_keys = self._option('JSON_SORT_KEYS', self.sort_keys)
+        ensure_ascii = self._option('JSON_AS_ASCII', self.ensure_ascii)
+        indent, separators = kwargs.get('indent'), kwargs.get('separators')
+        # only the formats orjson writes: compact, or indented by 2 spaces with json's default separators
+        if self.serializer == 'orjson' and set(kwargs) <= {'indent', 'separators'} and (
+            (indent is None and separators == (',', ':'))
+            or (indent == 2 and separators in (None, (',', ': ')))
+        ):
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            try:
+                data = orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:  # e.g. integers beyond 64 bits, which json encodes
+                pass
+            else:
+                if ensure_ascii and (not data.isascii() or b'\x7f' in data):
+                    data = _NON_ASCII.sub(_escape, data.decode('utf-8')).encode('ascii')
+                return data
+        kwargs.setdefault('cls', self.encoder)
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('sort_keys', sort_keys)
+        kwargs.setdefault('ensure_ascii', ensure_ascii)
+        return json.dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj, **kwargs) -> str:
+        """
+        Serialize data as JSON to a string.
+
+        Keyword arguments are passed to json.dumps(); with orjson only `indent` and `separators` are supported and
+        other arguments fall back to json.
+        """
+        return self.dumpb(obj, **kwargs).decode('utf-8')
+
+    def response(self, *args, **kwargs) -> Response:
+        """The response of jsonify(), serialized to bytes without an intermediate string."""
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self._app.config.get('JSONIFY_PRETTYPRINT_REGULAR')
+        compact = self.compact if pretty is None else not pretty
+        if (compact is None and self._app.debug) or compact is False:
+            dump_args = {'indent': 2}
+        else:
+            dump_args = {'separators': (',', ':')}
+        mimetype = self._option('JSONIFY_MIMETYPE', self.mimetype)
+        return self._app.response_class(self.dumpb(obj, **dump_args) + b'\n', mimetype=mimetype)
+
+
+def json_response(value, indent: int = 2, mimetype: str = 'application/json') -> Response:
+    """
+    The response connexion makes of the value returned by a controller, i.e. indented by 2 spaces, for controllers
+    that return it already serialized, e.g. to cache it, see neoflask.cache.memoize().
+    """
+    data = current_app.json.dumpb(value, indent=indent)
+    return current_app.response_class(data + b'\n', mimetype=mimetype)
@@ -0,0 +1,300 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+from threading import Thread
+from time import sleep
+from unittest.mock import patch
+import brotli
+from flask import jsonify
+from pytest import fixture
+
+import neoflask
+import neoflask.cache
+from .cache import GENERATION_KEY, generation_last_modified, LOCAL_CACHE, WARM_UP_HEADER, Entry, LocalCache, _lock, cache, cached_call, current_generation, memoize, popular_paths, record_hit, request_cache_key, stable_key
+
+
+@fixture
+def app():
+    neoflask.app.config['TESTING'] = True
+    with neoflask.app.app_context():
+        cache.clear()
+        LOCAL_CACHE.clear()
+        yield neoflask.app
+
+
+@fixture
+def generation():
+    """The db generation returned by the db, checked at each call."""
+    generation = {'update_completed': '2023-01-01T00:00:00Z'}
+    neoflask.cache._generation, neoflask.cache._previous_generation, neoflask.cache._generation_checked = None, None, None
+    with patch('neoflask.cache.ask_neo', side_effect=lambda query: [generation]), \
+         patch('neoflask.cache.CACHE_GENERATION_CHECK_INTERVAL', 0):
+        yield generation
+    neoflask.cache._generation, neoflask.cache._previous_generation, neoflask.cache._generation_checked = None, None, None
+
+
+def test_stable_key_is_canonical():
+    assert stable_key({'a': 1, 'b': [1, 2]}) == stable_key({'b': [1, 2], 'a': 1})
+    assert stable_key({'a': 1, 'b': [1, 2]}) != stable_key({'a': 1, 'b': [2, 1]})
+    assert stable_key('10.1101/1', None) != stable_key('10.1101/1', '')
+
+
+def test_stable_key_is_the_same_in_every_process():
+    code = "from neoflask.cache import stable_key; print(stable_key(frozenset(['10.1101/1', '10.1101/2']), {'page': 2}))"
+    keys = {
+        subprocess.run(
+            [sys.executable, '-c', code], env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path), 'PYTHONHASHSEED': seed},
+            capture_output=True, text=True, check=True,
+        ).stdout.splitlines()[-1]  # after the log of the app start
+        for seed in ('1', '2')
+    }
+    assert len(keys) == 1
+
+
+def test_request_cache_key(app):
+    def key(url, **kwargs):
+        with app.test_request_context(url, **kwargs):
+            return request_cache_key()
+    assert key('/api/v1/collection?page=2&pagesize=10') == key('/api/v1/collection?pagesize=10&page=2')
+    assert key('/api/v1/collection?page=2') != key('/api/v1/collection?page=3')
+    assert key('/api/v1/collection', method='POST', json={'page': 2}) != key('/api/v1/collection', method='POST', json={'page': 3})
+
+
+def test_memoize(app, generation):
+    calls = []
+
+    @memoize()
+    def paper(doi=None, slug=None):
+        calls.append((doi, slug))
+        return {'doi': doi, 'slug': slug}
+
+    assert paper('10.1101/1') == {'doi': '10.1101/1', 'slug': None}
+    assert paper(doi='10.1101/1', slug=None) == {'doi': '10.1101/1', 'slug': None}
+    assert paper(slug='a-slug') == {'doi': None, 'slug': 'a-slug'}
+    assert calls == [('10.1101/1', None), (None, 'a-slug')]
+
+
+def test_generation(app, generation):
+    calls = []
+
+    @memoize()
+    def stats():
+        calls.append(generation['update_completed'])
+        return len(calls)
+
+    assert stats() == 1
+    assert stats() == 1
+    generation['update_completed'] = '2023-01-02T00:00:00Z'  # a db update completed
+    assert stats() == 2
+    assert calls == ['2023-01-01T00:00:00Z', '2023-01-02T00:00:00Z']
+
+
+def test_generation_without_db(app, generation):
+    assert current_generation() == '2023-01-01T00:00:00Z'
+    neoflask.cache._generation = None  # e.g. a new worker
+    with patch('neoflask.cache.ask_neo', side_effect=ConnectionError):
+        assert current_generation() == '2023-01-01T00:00:00Z'  # as last seen by any worker
+        cache.delete(GENERATION_KEY)
+        neoflask.cache._generation = None
+        assert current_generation() is None
+
+
+def test_single_flight(app, generation):
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        sleep(0.3)
+        return 'computed'
+
+    def request():
+        with app.app_context():
+            results.append(cached_call('slow', slow))
+
+    threads = [Thread(target=request) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ['computed'] * 4
+    assert len(calls) == 1
+
+
+def test_single_flight_serves_previous_generation(app, generation):
+    assert cached_call('slow', lambda: 'old') == 'old'
+    generation['update_completed'] = '2023-01-02T00:00:00Z'
+    assert current_generation() == '2023-01-02T00:00:00Z'
+    lock = _lock('2023-01-02T00:00:00Z/slow')
+    assert lock.acquire(blocking=False)  # another worker is computing the value
+    assert cached_call('slow', lambda: 'new') == 'old'
+    cache.cache._write_client.delete(lock.name)
+    assert cached_call('slow', lambda: 'new') == 'new'
+
+
+def test_stale_while_revalidate(app, generation):
+    values = ['old', 'new']
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return values[len(calls) - 1]
+
+    assert cached_call('daily', compute, soft_timeout=0) == 'old'
+    assert cached_call('daily', compute, soft_timeout=0) == 'old'  # stale, served while refreshed
+    for _ in range(50):
+        if len(calls) == 2:
+            break
+        sleep(0.1)
+    assert len(calls) == 2
+    sleep(0.1)  # the refreshed value is cached after it is computed
+    assert cached_call('daily', compute, soft_timeout=0) == 'new'
+
+
+def test_local_cache():
+    local = LocalCache(max_bytes=100, max_item_bytes=60)
+    local.set('a', Entry('a', 0), 40)
+    local.set('b', Entry('b', 0), 40)
+    assert local.get('a') == Entry('a', 0)  # b is now the least recently used
+    local.set('c', Entry('c', 0), 40)
+    assert local.get('b') is None
+    assert local.get('c') == Entry('c', 0)
+    local.set('big', Entry('big', 0), 61)
+    assert local.get('big') is None
+    assert local.stats()['bytes'] == 80
+
+
+def test_local_cache_in_front_of_redis(app, generation):
+    assert cached_call('stats', lambda: {'nodes': 1}) == {'nodes': 1}
+    cache.clear()  # served from memory
+    assert cached_call('stats', lambda: {'nodes': 2}) == {'nodes': 1}
+    generation['update_completed'] = '2023-01-02T00:00:00Z'
+    assert cached_call('stats', lambda: {'nodes': 3}) == {'nodes': 3}
+
+
+def test_local_cache_copies_responses(app, generation):
+    def view():
+        return jsonify({'nodes': 1})
+
+    first = cached_call('view/stats', view)
+    first.headers['Access-Control-Allow-Origin'] = '*'  # e.g. flask_cors
+    second = cached_call('view/stats', view)
+    assert second is not first
+    assert second.get_json() == {'nodes': 1}
+    assert 'Access-Control-Allow-Origin' not in second.headers
+
+
+def test_popularity(app):
+    def hit(url, n=1, **kwargs):
+        with app.test_request_context(url, **kwargs):
+            for _ in range(n):
+                record_hit()
+    with patch('neoflask.cache.CACHE_POPULARITY_SAMPLE_RATE', 1):
+        hit('/api/v2/paper/?doi=10.1101/1', 6)
+        hit('/api/v2/paper/?doi=10.1101/2', 3)
+        hit('/api/v2/docmap/10.1101/3')
+        hit('/api/v2/docmap/10.1101/4', headers={WARM_UP_HEADER: '1'})  # not counted
+        hit('/api/v1/dois/', method='POST', json=['10.1101/5'])  # not counted
+    assert popular_paths() == ['/api/v2/paper/?doi=10.1101/1', '/api/v2/paper/?doi=10.1101/2', '/api/v2/docmap/10.1101/3']
+    assert popular_paths(0.8) == ['/api/v2/paper/?doi=10.1101/1', '/api/v2/paper/?doi=10.1101/2']
+    assert popular_paths(0.5) == ['/api/v2/paper/?doi=10.1101/1']
+    with patch('neoflask.cache.CACHE_POPULARITY_SAMPLE_RATE', 0):
+        hit('/api/v2/docmap/10.1101/3', 100)  # sampled out
+    assert popular_paths(0.5) == ['/api/v2/paper/?doi=10.1101/1']
+
+
+def test_generation_last_modified():
+    assert generation_last_modified('2023-01-01T10:00:00Z').isoformat() == '2023-01-01T10:00:00+00:00'
+    assert generation_last_modified('2023-01-01T10:00:00.123456789+02:00').isoformat() == '2023-01-01T08:00:00+00:00'
+    assert generation_last_modified('initial') is None
+
+
+def test_conditional_requests(app, generation):
+    client = app.test_client()
+    with patch('neoflask.views.ask_neo', return_value=[{'subject': 'biology'}]):
+        response = client.get('/api/v1/subjects')
+    assert response.status_code == 200
+    etag, _ = response.get_etag()
+    assert etag and response.last_modified.isoformat() == '2023-01-01T00:00:00+00:00'
+
+    # answered from the generation known to the worker, without Redis or Neo4j
+    with patch('neoflask.cache.CACHE_GENERATION_CHECK_INTERVAL', 60), \
+         patch('neoflask.cache._get_many', side_effect=AssertionError('cache read')), \
+         patch('neoflask.cache.ask_neo', side_effect=AssertionError('db query')):
+        response = client.get('/api/v1/subjects', headers={'If-None-Match': f'"{etag}"'})
+        assert response.status_code == 304
+        assert response.get_etag() == (etag, False)
+        response = client.get('/api/v1/subjects', headers={'If-None-Match': f'W/"{etag}-gzip"'})
+        assert response.status_code == 304
+        response = client.get('/api/v1/subjects', headers={'If-Modified-Since': 'Sun, 01 Jan 2023 00:00:00 GMT'})
+        assert response.status_code == 304
+    with patch('neoflask.views.ask_neo', return_value=[{'subject': 'biology'}]):
+        assert client.get('/api/v1/subjects?page=2', headers={'If-None-Match': f'"{etag}"'}).status_code == 200
+    with patch('neoflask.views.ask_neo', return_value=[]):
+        response = client.get('/api/v1/by_auto_topics/')  # the default limit date depends on the date
+    assert response.status_code == 200 and response.get_etag() == (None, None)
+
+    generation['update_completed'] = '2023-02-01T00:00:00Z'
+    with patch('neoflask.views.ask_neo', return_value=[{'subject': 'biology'}]):
+        response = client.get('/api/v1/subjects', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+
+def test_no_validators_for_other_generations(app, generation):
+    client = app.test_client()
+    with patch('neoflask.views.ask_neo', return_value=[{'subject': 'biology'}]):
+        assert client.get('/api/v1/subjects').get_etag()[0]
+    with app.test_request_context('/api/v1/subjects'):
+        key = request_cache_key()
+
+    # served from the previous generation while another worker computes the value of the new one
+    generation['update_completed'] = '2023-02-01T00:00:00Z'
+    lock = _lock(f'2023-02-01T00:00:00Z/{key}')
+    assert lock.acquire(blocking=False)
+    response = client.get('/api/v1/subjects')
+    cache.cache._write_client.delete(lock.name)
+    assert response.json == [{'subject': 'biology'}]
+    assert response.get_etag() == (None, None) and response.last_modified is None
+
+    # computed before the generation changed
+    def ask_neo(query):
+        generation['update_completed'] = '2023-03-01T00:00:00Z'
+        current_generation()
+        return [{'subject': 'biology'}]
+    with patch('neoflask.views.ask_neo', side_effect=ask_neo):
+        response = client.get('/api/v1/subjects?page=2')
+    assert response.status_code == 200
+    assert response.get_etag() == (None, None)
+
+
+def test_compressed_responses(app, generation):
+    client = app.test_client()
+    subjects = [{'subject': f'subject {i}'} for i in range(100)]
+    with patch('neoflask.views.ask_neo', return_value=subjects) as mock, \
+         patch('neoflask.cache.CACHE_COMPRESSION', 'gzip'), \
+         patch('neoflask.cache.CACHE_COMPRESS_MIN_BYTES', 100):
+        compressed = client.get('/api/v1/subjects', headers={'Accept-Encoding': 'gzip, deflate'})
+        plain = client.get('/api/v1/subjects')
+    assert mock.call_count == 1
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.data)) == subjects
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.json == subjects
+    assert compressed.get_etag()[0] == plain.get_etag()[0] + '-gzip'
+
+
+def test_brotli_compressed_responses(app, generation):
+    client = app.test_client()
+    subjects = [{'subject': f'subject {i}'} for i in range(100)]
+    with patch('neoflask.views.ask_neo', return_value=subjects), \
+         patch('neoflask.cache.CACHE_COMPRESS_MIN_BYTES', 100):
+        compressed = client.get('/api/v1/subjects', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        gzip_only = client.get('/api/v1/subjects', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(compressed.data)) == subjects
+    assert 'Content-Encoding' not in gzip_only.headers and gzip_only.json == subjects
+    assert compressed.get_etag()[0] == gzip_only.get_etag()[0] + '-br'
@@ -0,0 +1,86 @@
+from threading import Lock, Thread
+from flask import Flask, Response, redirect
+from werkzeug.serving import make_server
+from neoflask.cache_warm_up import HttpClient, WarmUp, cache_warm_up
+
+
+class FakeClient:
+    # 3 pages of 2 papers, the paper with DOI 'doi-3' has no docmap
+
+    def __init__(self, base_url=None, pool_size=None):
+        self.requested = []
+        self._lock = Lock()
+
+    def _request(self, *request):
+        with self._lock:
+            self.requested.append(request)
+
+    def get(self, path):
+        self._request('get', path)
+
+    def papers(self, page):
+        self._request('papers', page)
+        return {
+            'items': [{'doi': f'doi-{i}', 'slug': f'slug-{i}'} for i in (2 * page - 1, 2 * page)],
+            'paging': {'totalPages': 3},
+        }
+
+    def paper(self, doi=None, slug=None):
+        self._request('paper', doi or slug)
+
+    def docmap(self, doi):
+        self._request('docmap', doi)
+        if doi == 'doi-3':
+            raise RuntimeError('404')
+
+    def close(self):
+        pass
+
+
+def test_cache_warm_up(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr('neoflask.cache_warm_up.HttpClient', lambda *args, **kwargs: client)
+    report = cache_warm_up('http://api', workers=4, coverage=0, no_progress=True)
+    assert sorted(r for r in client.requested if r[0] == 'papers') == [('papers', 1), ('papers', 2), ('papers', 3)]
+    assert sorted(r[1] for r in client.requested if r[0] == 'docmap') == [f'doi-{i}' for i in range(1, 7)]
+    assert len([r for r in client.requested if r[0] == 'paper']) == 12
+    assert report['requests'] == 3 + 12 + 6
+    assert report['kinds']['docmap'] == {'ok': 5, 'failed': 1, 'skipped': 0, 'mean_latency_ms': report['kinds']['docmap']['mean_latency_ms']}
+
+
+def test_cache_warm_up_popular_only(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr('neoflask.cache_warm_up.HttpClient', lambda *args, **kwargs: client)
+    monkeypatch.setattr('neoflask.cache_warm_up.popular_paths', lambda coverage: ['/api/v2/paper/?doi=doi-1'])
+    report = cache_warm_up('http://api', coverage=0.9, popular_only=True, no_progress=True)
+    assert client.requested == [('get', '/api/v2/paper/?doi=doi-1')]
+    assert report['kinds']['popular']['ok'] == 1
+
+
+def test_warm_up_budget():
+    client = FakeClient()
+    warm_up = WarmUp(client, workers=2, budget=0, no_progress=True)
+    warm_up.deadline -= 1  # already expired
+    assert warm_up.run([('papers', client.papers, {'page': 1})]) == [None]
+    assert client.requested == []
+    assert warm_up.report()['kinds']['papers']['skipped'] == 1
+
+
+def test_http_client_get_any_path():
+    api = Flask(__name__)
+    api.add_url_rule('/sitemap.xml', 'sitemap', lambda: Response('<urlset/>', mimetype='text/xml'))
+    api.add_url_rule('/doi/<path:doi>', 'doi', lambda doi: redirect(f'/sitemap.xml?doi={doi}'))
+    server = make_server('127.0.0.1', 0, api, threaded=True)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = HttpClient(f'http://127.0.0.1:{server.server_port}')
+    try:
+        warm_up = WarmUp(client, workers=2, no_progress=True)
+        warm_up.run(
+            ('popular', client.get, {'path': path}) for path in ['/sitemap.xml', '/doi/10.1101/1', '/missing']
+        )
+        assert dict(warm_up.counts['popular']) == {'ok': 2, 'failed': 1}
+    finally:
+        client.close()
+        server.shutdown()
+        thread.join()
@@ -0,0 +1,75 @@
+import datetime
+import json
+from decimal import Decimal
+from unittest.mock import patch
+import neo4j.spatial
+import neo4j.time
+from pytest import fixture, mark
+from swagger_server.encoder import JSONEncoder
+from swagger_server.models.sort_order import SortOrder
+
+import neoflask
+from .cache import LOCAL_CACHE, cache
+from .serializer import JSONProvider
+
+DATA = {
+    'title': 'Ca²⁺ signalling in 𝛽-cells: a “review”\x7f\n\t"quoted" \\ /',
+    'authors': [{'surname': 'Müller', 'given_names': 'Zoë', 'position_idx': 0, 'corresp': None}],
+    'scores': [0.5, 1.0, 12, -3, True, False],
+    'nested': {'empty_list': [], 'empty_dict': {}, 1: 'int key', None: 'null key'},
+    'posted': datetime.datetime(2023, 1, 2, 3, 4, 5, 600000),
+    'reviewed': datetime.datetime(2023, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+    'date': datetime.date(2023, 1, 2),
+    'decimal': Decimal('1.5'),
+    'model': SortOrder(),
+    'big': 2 ** 70,
+}
+
+
+@fixture(params=['orjson', 'json'])
+def provider(request):
+    return JSONProvider(neoflask.app, encoder=JSONEncoder, serializer=request.param)
+
+
+@mark.parametrize('kwargs', [{'separators': (',', ':')}, {'indent': 2}, {}])
+def test_same_output_as_json(provider, kwargs):
+    with neoflask.app.app_context():
+        expected = json.dumps(DATA, cls=JSONEncoder, **kwargs)
+        assert provider.dumps(DATA, **kwargs) == expected
+        data = {k: v for k, v in DATA.items() if k != 'big'}  # without the fallback to json
+        assert provider.dumps(data, **kwargs) == json.dumps(data, cls=JSONEncoder, **kwargs)
+
+
+def test_neo4j_types(provider):
+    data = {
+        'datetime': neo4j.time.DateTime(2023, 1, 2, 3, 4, 5, 123456789, tzinfo=datetime.timezone.utc),
+        'date': neo4j.time.Date(2023, 1, 2),
+        'duration': neo4j.time.Duration(days=3, hours=4),
+        'point': neo4j.spatial.CartesianPoint((1.0, 2.0)),
+    }
+    with neoflask.app.app_context():
+        assert json.loads(provider.dumps(data, separators=(',', ':'))) == {
+            'datetime': '2023-01-02T03:04:05.123456789+00:00',
+            'date': '2023-01-02',
+            'duration': [0, 3, 4 * 3600, 0],
+            'point': [1.0, 2.0],
+        }
+
+
+def test_memoized_controllers_are_cached_serialized():
+    neoflask.app.config['TESTING'] = True
+    with neoflask.app.app_context():
+        cache.clear()
+        LOCAL_CACHE.clear()
+    neoflask.cache._generation_checked = None
+    document = {'doi': '10.1101/1', 'title': 'Zoë', 'pub_date': '2023-01-01T00:00:00Z'}
+    controller = 'swagger_server.controllers.refereed_preprint_details_controller'
+    client = neoflask.app.test_client()
+    with patch('neoflask.cache.ask_neo', return_value=[{'update_completed': 'test_serialized'}]), \
+         patch(f'{controller}.ask_neo', return_value=[{'document': json.dumps(document)}]) as mock, \
+         patch('neoflask.cache.json_response', wraps=neoflask.serializer.json_response) as serialize:
+        first = client.get('/api/v2/paper/?doi=10.1101/1')
+        second = client.get('/api/v2/paper/?doi=10.1101/1')
+    assert mock.call_count == 1 and serialize.call_count == 1
+    assert first.data == second.data == (json.dumps(document, indent=2) + '\n').encode('utf-8')
+    neoflask.cache._generation, neoflask.cache._generation_checked = None, None
@@ -4,6 +4,8 @@ from neoflask.views import DEFAULT_PAGE, DEFAULT_PAGESIZE, DEFAULT_PUBLISHER, DE
 from pytest import fixture
 
 import neoflask
+import neoflask.cache
+from neoflask.cache import LOCAL_CACHE, cache
 
 @fixture
 def client():
@@ -107,4 +109,36 @@ def test_collection_refereed_preprints_post(client):
         def make_request():
             return client.post(url, json=request_body)
 
-        _assert_collection_refereed_preprints_response_matches(make_request, **request_body)
\ No newline at end of file
+        _assert_collection_refereed_preprints_response_matches(make_request, **request_body)
+
+
+def test_by_dois_caches_each_doi(client):
+    """
+    Verifies that `POST /api/v1/dois/` only queries the DOIs that are not cached yet.
+    """
+    papers = {
+        '10.1101/1': {'doi': '10.1101/1', 'pub_date': '2023-01-01T00:00:00Z'},
+        '10.1101/2': {'doi': '10.1101/2', 'pub_date': '2023-02-01T00:00:00Z'},
+        '10.1101/3': {'doi': '10.1101/3', 'pub_date': '2023-03-01T00:00:00Z'},
+    }
+    with neoflask.app.app_context():
+        cache.clear()
+        LOCAL_CACHE.clear()
+    neoflask.cache._generation_checked = None
+    with patch('neoflask.cache.ask_neo', return_value=[{'update_completed': 'test_by_dois'}]), patch(
+        'neoflask.views.ask_neo',
+        side_effect=lambda query, dois, published_in: [papers[doi] for doi in dois if doi in papers],
+    ) as mock:
+        response = client.post('/api/v1/dois/', json={'dois': ['10.1101/1', '10.1101/2']})
+        assert response.json == [papers['10.1101/2'], papers['10.1101/1']]
+        response = client.post('/api/v1/dois/', json={'dois': ['10.1101/2', '10.1101/3', '10.1101/4']})
+        assert response.json == [papers['10.1101/3'], papers['10.1101/2']]
+        assert sorted(mock.call_args.kwargs['dois']) == ['10.1101/3', '10.1101/4']
+        response = client.post('/api/v1/dois/', json={'dois': ['10.1101/4']})
+        assert response.json == []
+        assert mock.call_count == 2
+        # the same DOI listed twice is in the response twice
+        response = client.post('/api/v1/dois/', json={'dois': ['10.1101/1', '10.1101/3', '10.1101/1']})
+        assert response.json == [papers['10.1101/3'], papers['10.1101/1'], papers['10.1101/1']]
+        assert mock.call_count == 2
+    neoflask.cache._generation, neoflask.cache._generation_checked = None, None
@@ -27,8 +27,9 @@ from .queries import (
     SUBJECT_COLLECTIONS,
     REFEREED_PREPRINTS_V2,
 )
-from neoflask.cache import cache
-from neotools import ask_neo
+from neoflask.cache import LOCAL_CACHE, cached_call_many, cached_view, current_generation, stable_key
+from neotools import ask_neo, get_db
+from neotools.metrics import QUERY_METRICS
 import re
 from . import app
 
@@ -51,7 +52,7 @@ def root():
 
 
 @app.route('/doi/<path:doi>', methods=['GET'])
-@cache.cached()
+@cached_view()
 def doi_redirect(doi):
     papers = ask_neo(BY_DOIS(), dois=[doi])
     if len(papers) == 0:
@@ -69,7 +70,7 @@ def doi_redirect(doi):
 
 
 @app.route('/sitemap.xml', methods=['GET'])
-@cache.cached()
+@cached_view()
 def sitemap():
     """
     Generate dynamically a sitemap.
@@ -80,17 +81,59 @@ def sitemap():
     return Response(sitemap, mimetype='text/xml')
 
 
+@app.route('/api/v1/stats/db_pool', methods=['GET'])
+def db_pool_stats():
+    """
+    Statistics of this worker's neo4j connection pool: connections in use, idle connections and connection acquisition waits.
+    """
+    return jsonify(get_db().pool_stats())
+
+
+@app.route('/api/v1/stats/queries', methods=['GET'])
+def query_stats():
+    """
+    Statistics of this worker's neo4j queries by query class, the most time consuming first.
+    """
+    return jsonify(QUERY_METRICS.as_dict())
+
+
+@app.route('/api/v1/stats/cache', methods=['GET'])
+def cache_stats():
+    """
+    The db generation the cache keys are in and the statistics of this worker's in-memory cache.
+    """
+    return jsonify({'generation': current_generation(), 'local': LOCAL_CACHE.stats()})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    This worker's query and connection pool metrics in Prometheus text format.
+    """
+    lines = []
+    for key, value in get_db().pool_stats().items():
+        if value is not None:
+            if key == 'acquisitions':
+                lines.append('# TYPE neo4j_pool_acquisitions_total counter')
+                lines.append(f'neo4j_pool_acquisitions_total {value}')
+            else:
+                lines.append(f'# TYPE neo4j_pool_{key} gauge')
+                lines.append(f'neo4j_pool_{key} {value}')
+    body = QUERY_METRICS.prometheus() + '\n'.join(lines) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/v1/stats', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def stats():
     app.logger.info(f"show db stats")
     return jsonify(ask_neo(STATS()))
 
 
-# using routing rather than parameters to provide limit_date so that cache.cached() works properly; memoize would need function params
+# using routing rather than parameters to provide limit_date
 @app.route('/api/v1/by_auto_topics/', defaults={'limit_date': None}, methods=['GET', 'POST'])
 @app.route('/api/v1/by_auto_topics/<limit_date>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def by_hyp(limit_date):
     if limit_date is None:
         limit_date = n_months_ago(4)
@@ -99,7 +142,7 @@ def by_hyp(limit_date):
 
 
 @app.route('/api/v1/reviewing_services/', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def reviewing_services():
     app.logger.info(f"descriptions of reviewing services")
     return jsonify(ask_neo(DESCRIBE_REVIEWING_SERVICES()))
@@ -107,7 +150,7 @@ def reviewing_services():
 
 @app.route('/api/v1/by_reviewing_service/', defaults={'limit_date': '1900-01-01'}, methods=['GET', 'POST'])
 @app.route('/api/v1/by_reviewing_service/<limit_date>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def by_reviewing_service(limit_date):
     app.logger.info(f"list by by_reviewing_service")
     return jsonify(ask_neo(BY_REVIEWING_SERVICE(), limit_date=limit_date))
@@ -115,14 +158,14 @@ def by_reviewing_service(limit_date):
 
 @app.route('/api/v1/automagic/', defaults={'limit_date': '1900-01-01'}, methods=['GET', 'POST'])
 @app.route('/api/v1/automagic/<limit_date>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def automagic(limit_date):
     app.logger.info(f"list by automagic score")
     return jsonify(ask_neo(AUTOMAGIC(), limit_date=limit_date))
 
 
 @app.route('/api/v1/doi/<path:doi>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def by_doi(doi: str):
     app.logger.debug(f"lookup doi: {doi}")
     result = ask_neo(BY_DOIS(), dois=[doi])
@@ -130,7 +173,7 @@ def by_doi(doi: str):
 
 
 @app.route('/api/v1/slug/<path:slug>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def by_slug(slug: str):
     app.logger.debug(f"lookup slug: {slug}")
     result = ask_neo(BY_SLUG(), slug=slug)
@@ -149,27 +192,32 @@ def by_dois():
     dois_info = f'{dois}' if num_dois < 4 else f'["{dois[0]}", "{dois[1]}", ..., "{dois[-1]}"] ({num_dois} in total)'
     app.logger.debug(f"lookup dois: {dois_info} {' published in '+published_in if published_in else ''}")
 
-    cache_key = f'/api/v1/dois/{hash(frozenset(dois))}'
-    doi_data = cache.get(cache_key)
-    if doi_data is None:
-        app.logger.debug(f"\t\t cache miss: {cache_key}")
-        doi_data = ask_neo(BY_DOIS(), dois=dois, published_in=published_in)
-        cache.add(cache_key, doi_data)
-    else:
-        app.logger.debug(f"\t\t  cache hit: {cache_key}")
+    def query(missing_dois):
+        papers = {doi: [] for doi in missing_dois}
+        for paper in ask_neo(BY_DOIS(), dois=missing_dois, published_in=published_in):
+            if paper['doi'] in papers:
+                papers[paper['doi']].append(paper)
+        return papers
+
+    # one entry per DOI, so that overlapping lists of DOIs share them
+    cache_keys = {doi: f'/api/v1/dois/{stable_key(doi, published_in)}' for doi in dict.fromkeys(dois)}
+    papers = cached_call_many(cache_keys, query)
+    # mapped back over the requested DOIs: a DOI listed twice has its papers twice, as with UNWIND $dois in BY_DOIS
+    doi_data = [paper for doi in dois for paper in papers[doi]]
+    doi_data.sort(key=lambda paper: paper['pub_date'] or '', reverse=True)  # as ordered by BY_DOIS
 
     return jsonify(doi_data)
 
 
 @app.route('/api/v1/reviews/<path:doi>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def review_by_doi(doi: str):
     app.logger.info(f"review process for doi:{doi}")
     return jsonify(ask_neo(REVIEW_PROCESS_BY_DOI(), doi=doi))
 
 
 @app.route('/api/v1/review/<path:doi>/<int:n>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def review_by_doi_n(doi: str, n: int):
     app.logger.info(f"review #{n} for doi:{doi}")
     j = ask_neo(REVIEW_PROCESS_BY_DOI(), doi=doi)
@@ -182,7 +230,7 @@ def review_by_doi_n(doi: str, n: int):
 
 
 @app.route('/api/v1/response/<path:doi>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def response_by_doi(doi: str):
     app.logger.info(f"response for doi:{doi}")
     j = ask_neo(REVIEW_PROCESS_BY_DOI(), doi=doi)
@@ -200,7 +248,7 @@ def fig_by_doi_idx():
 @app.route('/api/v1/search/<escape_lucene:search_string>', methods=['GET'])
 # using <path:search_string> to match route when doi is searched
 @app.route('/api/v1/search/<path:search_string>', methods=['GET'])
-@cache.cached()
+@cached_view()
 def search(search_string: str):
     search_string = search_string.strip()
     doi = DOI_REGEX.search(search_string)
@@ -215,7 +263,7 @@ def search(search_string: str):
 
 
 @app.route('/api/v1/collection/covid19', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def covid19():
     return jsonify(ask_neo(COVID19()))
 
@@ -275,18 +323,6 @@ def paged(view_func):
 
     return inner
 
-def paging_aware_cache_key():
-    """
-    Function to generate a paging-aware cache key.
-
-    Use it as the `make_cache_key` parameter to @cached and in conjunction with @paged.
-
-    Adds the paging parameters set by the @paged decorator to the cache key. Otherwise,
-    requesting the same URL with different paging parameters returns the first, cached,
-    result.
-    """
-    return f'view/{request.path}/page-{hash(request.paging)}'
-
 DEFAULT_REVIEWING_SERVICE = ''
 DEFAULT_PUBLISHER = ''
 
@@ -295,7 +331,7 @@ DEFAULT_PUBLISHER = ''
     methods=['GET'],
 )
 @paged
-@cache.cached(key_prefix=paging_aware_cache_key)
+@cached_view()
 def refereed_preprints_get(reviewing_service, published_in):
     """
     Returns all refereed preprints that were reviewed by `reviewing_service` and
@@ -316,7 +352,7 @@ def refereed_preprints_get(reviewing_service, published_in):
     )
 
 @app.route('/api/v1/collection/refereed-preprints', methods=['GET'])
-@cache.cached()
+@cached_view()
 def refereed_preprints_get_all():
     """
     Returns all refereed preprints sorted by publication date of the preprint.
@@ -356,21 +392,21 @@ def refereed_preprints_post():
     )
 
 @app.route('/api/v1/collection/<subject>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def subject_collection(subject: str):
     app.logger.info(f"subject collection for subject: '{subject}'")
     return jsonify(ask_neo(SUBJECT_COLLECTIONS(), subject=subject))
 
 
 @app.route('/api/v1/subjects', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def subjects():
     app.logger.info(f"subjects names")
     return jsonify(ask_neo(COLLECTION_NAMES()))
 
 
 @app.route('/api/v2/review_material/<int:node_id>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def review_material_by_id(node_id: int):
     app.logger.info(f"review material for id {node_id}")
     root = url_for('root', _external=True)
@@ -380,7 +416,7 @@ def review_material_by_id(node_id: int):
 
 @app.route('/api/v2/review_process/<path:doi>', methods=['GET', 'POST'])
 @app.route('/api/v2/docmap/<path:doi>', methods=['GET', 'POST'])
-@cache.cached()
+@cached_view()
 def docmap_semantic_doi(doi: str):
     app.logger.debug(f"docmap for id {doi}")
     root = url_for('root', _external=True)
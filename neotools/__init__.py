@@ -1,18 +1,127 @@
+import asyncio
+import atexit
 import os
 from pathlib import Path
+from threading import Lock
 from dotenv import load_dotenv
-from neotools.db import Instance, Query
-from typing import Dict
+from neotools.db import AsyncInstance, Instance, Query, DEFAULT_FETCH_SIZE
+from neotools.metrics import QUERY_METRICS
+from neotools.replay import ReplayInstance, RECORD
+from neotools.slowlog import DEFAULT_PATH as DEFAULT_SLOW_QUERY_LOG, SlowQueryLog
+from typing import Dict, Iterator
 
 load_dotenv()
 
 FLOW_BATCH_SIZE = os.getenv('FLOW_BATCH_SIZE')
 
-def get_db():
-    NEO_URI = os.getenv('NEO_URI')
-    NEO_USERNAME = os.getenv("NEO_USERNAME")
-    NEO_PASSWORD = os.getenv("NEO_PASSWORD")
-    return Instance(NEO_URI, NEO_USERNAME, NEO_PASSWORD)
+# bounds of the connection pool of the process-wide driver, see get_db()
+NEO_MAX_CONNECTION_POOL_SIZE = int(os.getenv('NEO_MAX_CONNECTION_POOL_SIZE', 20))
+NEO_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv('NEO_CONNECTION_ACQUISITION_TIMEOUT', 30))
+
+# queries slower than this many seconds are recorded in the slow query log, see slowlog.py; unset to disable
+NEO_SLOW_QUERY_THRESHOLD = os.getenv('NEO_SLOW_QUERY_THRESHOLD')
+NEO_SLOW_QUERY_PROFILE_RATE = float(os.getenv('NEO_SLOW_QUERY_PROFILE_RATE', 0.1))
+NEO_SLOW_QUERY_LOG = os.getenv('NEO_SLOW_QUERY_LOG', DEFAULT_SLOW_QUERY_LOG)
+
+# compile the queries of the API when a worker starts, see neoflask.db.init_db()
+NEO_WARM_UP = os.getenv('NEO_WARM_UP', 'true').lower() == 'true'
+
+# record query results to, or replay them from, this directory instead of only querying the database, see replay.py
+NEO_REPLAY = os.getenv('NEO_REPLAY')
+NEO_REPLAY_MODE = os.getenv('NEO_REPLAY_MODE', 'replay')
+
+_db = None
+_db_pid = None
+_db_lock = Lock()
+
+
+def get_db() -> Instance:
+    """
+    Return the database instance of this process.
+
+    The instance, and with it the driver and its connection pool, is created on first use and reused by all later
+    calls, so that queries don't pay for a new Bolt handshake and authentication each time. A process forked after
+    the driver was created (e.g. a gunicorn worker) gets its own driver since connections can't be shared across
+    processes. The driver is closed when the process exits. Its queries are recorded in metrics.QUERY_METRICS and,
+    if NEO_SLOW_QUERY_THRESHOLD is set, the slow ones in the slow query log. If NEO_REPLAY is set, the instance is
+    a replay.ReplayInstance that records results to, or replays them from, that directory per NEO_REPLAY_MODE.
+    """
+    global _db, _db_pid
+    pid = os.getpid()
+    if _db is None or _db_pid != pid:
+        with _db_lock:
+            if _db is None or _db_pid != pid:
+                NEO_URI = os.getenv('NEO_URI')
+                NEO_USERNAME = os.getenv("NEO_USERNAME")
+                NEO_PASSWORD = os.getenv("NEO_PASSWORD")
+                if NEO_REPLAY and NEO_REPLAY_MODE != RECORD:
+                    _db = ReplayInstance(NEO_REPLAY, NEO_REPLAY_MODE)
+                else:
+                    _db = Instance(
+                        NEO_URI, NEO_USERNAME, NEO_PASSWORD,
+                        max_connection_pool_size=NEO_MAX_CONNECTION_POOL_SIZE,
+                        connection_acquisition_timeout=NEO_CONNECTION_ACQUISITION_TIMEOUT,
+                    )
+                    if NEO_REPLAY:
+                        _db = ReplayInstance(NEO_REPLAY, RECORD, db=_db)
+                _db.hooks.append(QUERY_METRICS.record)
+                if NEO_SLOW_QUERY_THRESHOLD:
+                    slow_query_log = SlowQueryLog(
+                        _db, path=NEO_SLOW_QUERY_LOG,
+                        threshold=float(NEO_SLOW_QUERY_THRESHOLD),
+                        profile_rate=NEO_SLOW_QUERY_PROFILE_RATE,
+                    )
+                    _db.hooks.append(slow_query_log.hook)
+                _db_pid = pid
+    return _db
+
+
+def close_db():
+    """Close the driver of this process, if any. The next call to get_db() creates a new one."""
+    global _db, _db_pid
+    with _db_lock:
+        if _db is not None and _db_pid == os.getpid():
+            _db.close()
+        _db = None
+        _db_pid = None
+
+
+atexit.register(close_db)
+
+_async_db = None
+_async_db_loop = None
+
+
+def get_async_db() -> AsyncInstance:
+    """
+    Return the async database instance of the running event loop.
+
+    Like get_db() the driver is created on first use and then reused, but since an async driver is bound to the
+    event loop it was created in, a new one is created when called from another loop (e.g. a second asyncio.run()).
+    Must be called from a coroutine; close it with `await close_async_db()` before the loop ends.
+    """
+    global _async_db, _async_db_loop
+    loop = asyncio.get_running_loop()
+    if _async_db is None or _async_db_loop is not loop:
+        NEO_URI = os.getenv('NEO_URI')
+        NEO_USERNAME = os.getenv("NEO_USERNAME")
+        NEO_PASSWORD = os.getenv("NEO_PASSWORD")
+        _async_db = AsyncInstance(
+            NEO_URI, NEO_USERNAME, NEO_PASSWORD,
+            max_connection_pool_size=NEO_MAX_CONNECTION_POOL_SIZE,
+            connection_acquisition_timeout=NEO_CONNECTION_ACQUISITION_TIMEOUT,
+        )
+        _async_db_loop = loop
+    return _async_db
+
+
+async def close_async_db():
+    """Close the async driver of the running event loop, if any."""
+    global _async_db, _async_db_loop
+    if _async_db is not None and _async_db_loop is asyncio.get_running_loop():
+        await _async_db.close()
+    _async_db = None
+    _async_db_loop = None
 
 
 def ask_neo(query: Query, **kwargs) -> Dict:
@@ -23,8 +132,32 @@ def ask_neo(query: Query, **kwargs) -> Dict:
         results = tx.run(code, params)
         data = [r.data(*query.returns) for r in results]  # consuming the data inside the transaction https://neo4j.com/docs/api/python-driver/current/transactions.html
         return data
-    # use the map of name of substitution variable in cypher to the name and default value of the var in the request
-    for var_in_cypher, var_in_request in query.map.items():
-        query.params[var_in_cypher] = kwargs.get(var_in_request['req_param'], var_in_request['default'])
+    # use the map of name of substitution variable in cypher to the name and default value of the var in the request;
+    # the parameters are bound to a copy so that the query object itself can be shared between threads
+    query = query.bind_request(**kwargs)
     data = get_db().query_with_tx_funct(tx_funct, query)
     return data
+
+
+def ask_neo_stream(query: Query, fetch_size: int = DEFAULT_FETCH_SIZE, **kwargs) -> Iterator[Dict]:
+    """
+    Run a query and yield the results one by one as dictionaries with the keys specified in the query.returns list.
+
+    Records are pulled from the database `fetch_size` at a time, see Instance.stream().
+    """
+    query = query.bind_request(**kwargs)
+    for r in get_db().stream(query, fetch_size=fetch_size):
+        yield r.data(*query.returns)
+
+
+async def ask_neo_async(query: Query, **kwargs) -> Dict:
+    """
+    Coroutine version of ask_neo(), running the query with the async database instance of the running event loop.
+    """
+    async def tx_funct(tx, code, params):
+        results = await tx.run(code, params)
+        data = [r.data(*query.returns) async for r in results]
+        return data
+    query = query.bind_request(**kwargs)
+    data = await get_async_db().query_with_tx_funct(tx_funct, query)
+    return data
@@ -1,64 +1,131 @@
+import asyncio
 import re
-from typing import List, Dict, Tuple, Callable
-from neo4j import GraphDatabase, Transaction
+from collections import ChainMap
+from copy import copy
+from threading import Lock
+from time import perf_counter
+from types import MappingProxyType
+from typing import List, Dict, Tuple, Callable, Iterable, Iterator, Mapping
+from neo4j import AsyncGraphDatabase, AsyncManagedTransaction, GraphDatabase, Record, ResultSummary, Transaction, READ_ACCESS, WRITE_ACCESS
 
 import common.logging
+from .metrics import QueryEvent, summarize
 logger = common.logging.get_logger(__name__)
 
-def quote4neo(properties):
-    quotes_added = {}
+# number of records pulled from the server at a time when streaming results, see Instance.stream()
+DEFAULT_FETCH_SIZE = 1000
+
+def normalize4neo(properties):
+    """
+    Normalize property values the way nodes were stored when their properties were inlined as cypher literals:
+    None becomes an empty string, single quotes are backslash-escaped and double quotes become single quotes.
+
+    Keeps MERGE on parameters matching the nodes that already are in the database.
+    """
+    normalized = {}
     for k, v in properties.items():
         if v is None:
-            v = '""'
+            v = ''
         elif isinstance(v, str):
             v = v.replace("'", r"\'")
-            v = v.replace('"', r"'")
-            v = v.replace('\\', r'\\') # why?
-            v = f'"{v}"'
-        quotes_added[k] = v
-    return quotes_added
+            v = v.replace('"', "'")
+        normalized[k] = v
+    return normalized
+
 
+def escape_name(name: str) -> str:
+    """Backtick-quote a label, relationship type or property name for use in cypher code."""
+    return '`' + name.replace('`', '``') + '`'
 
-def to_string(properties):
-    properties = quote4neo(properties)  # add quotes for neo cypher queries
-    properties_str = ', '.join([f"{k}: {v}" for k, v in properties.items()]) # stringfy
-    return properties_str
+
+# all Query subclasses by qualified name, filled as the modules defining them are imported
+QUERY_REGISTRY = {}
 
 
 class Query:
 
     code = ''
-    map = {}
-    returns = {}
-    _params = {}
+    map = MappingProxyType({})
+    returns = ()
+    access_mode = WRITE_ACCESS
+    examples = ()
 
-    def __init__(self, params: Dict = {}):
+    def __init__(self, params: Dict = None, code: str = None, returns: List = None):
         """
-        A simplistic class for a query. 
+        A simplistic class for a query.
+
+        The code, map and returns of a Query subclass are validated and frozen once, when the class is created, and
+        the class is registered in QUERY_REGISTRY.
+        Instances are immutable: the parameters are bound when the instance is created, and bind() or
+        bind_request() return a new instance with other parameters, so that the same query object can be shared
+        between threads. A subclass may still compose its code at instantiation by setting self.code before
+        calling Query.__init__().
 
         Attributes:
             code (str): the string of the query
-            map (Dict(str, List[str, str])): the mapping between the variable in the query (key) and a list with the name of the request parameter and its default value
-            returns (List): the keys to use when retrieving the results
-            params (Dict): the value of each parameters to be forwarded in the database transaction
+            map (Dict(str, Dict[str, str])): the mapping between the variable in the query (key) and a dict with the name of the request parameter ('req_param') and its default value ('default')
+            returns (Tuple): the keys to use when retrieving the results
+            params (Mapping): the value of each parameters to be forwarded in the database transaction, read-only
+            access_mode (str): READ_ACCESS or WRITE_ACCESS, whether the query only reads or also writes to the database
+            examples (Tuple[Mapping]): representative values of the variables without a default value, one mapping per typical request, for the query to be compiled ahead (see neotools.warmup)
 
         Args:
             params (Dict): the value of each parameters to be forwarded in the database transaction
+            code (str): the code of an ad-hoc query, instead of the code of the class
+            returns (List): the keys of an ad-hoc query, instead of the returns of the class
         """
-        self.params = params
-        substitution_variables = re.findall(r"\$(\w+)", self.code)
+        if code is not None:
+            self.code = code
+        if returns is not None:
+            self.returns = tuple(returns)
+        if 'code' in self.__dict__:  # code set on the instance has not been validated with the class
+            self._validate(self.code, self.map)
+        self._params = MappingProxyType(dict(params or {}))
+        self._frozen = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.map = MappingProxyType(dict(cls.map))
+        cls.returns = tuple(cls.returns)
+        cls.examples = tuple(MappingProxyType(dict(example)) for example in cls.examples)
+        cls._validate(cls.code, cls.map)
+        for example in cls.examples:
+            cls._validate(cls.code, example)
+        QUERY_REGISTRY[f"{cls.__module__}.{cls.__qualname__}"] = cls
+
+    @staticmethod
+    def _validate(code: str, map: Dict):
+        substitution_variables = re.findall(r"\$(\w+)", code)
         # check that parameters needed appear in the code
-        for p in self.map:
-            assert p in substitution_variables, f"variable '${p}' missing in from the query code \"{self.code}\""
+        for p in map:
+            if p not in substitution_variables:
+                raise ValueError(f"variable '${p}' missing in from the query code \"{code}\"")
         # checking for returns is more annoying: parse cypher between RETURN and next expected Cypher clause
 
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError(f"{self.__class__.__name__} instances are immutable, use bind() to set parameters")
+        super().__setattr__(name, value)
+
     @property
-    def params(self):
+    def params(self) -> Mapping:
         return self._params
 
-    @params.setter
-    def params(self, p: Dict):
-        self._params = p
+    def bind(self, **params) -> 'Query':
+        """Return a copy of this query with the given parameters added to its parameters."""
+        bound = copy(self)
+        object.__setattr__(bound, '_params', MappingProxyType({**self._params, **params}))
+        return bound
+
+    def bind_request(self, **request_params) -> 'Query':
+        """
+        Return a copy of this query with the parameters taken from the request parameters according to the map,
+        using the default value of missing ones.
+        """
+        return self.bind(**{
+            var_in_cypher: request_params.get(var_in_request['req_param'], var_in_request['default'])
+            for var_in_cypher, var_in_request in self.map.items()
+        })
 
     def __eq__(self, other):
         return (
@@ -67,29 +134,229 @@ class Query:
             and self.returns == other.returns
             and self.params == other.params
         )
+
     def __hash__(self):
-        return hash((self.code, self.map, self.returns, self.params))
+        # consistent with __eq__; the params are left out as their values may not be hashable
+        return hash((self.code, tuple(self.map), self.returns))
+
+
+class ReadQuery(Query):
+    """
+    A query that only reads from the database.
+
+    It is run in a read transaction of a read-access session, so that in a cluster it can be served by a read
+    replica and never takes write locks.
+    """
+
+    access_mode = READ_ACCESS
+
+
+class PoolStats:
+    """
+    Book-keeping of how long queries waited for a connection from the driver's pool.
+
+    The wait is measured from the moment a transaction is requested until the transaction
+    function starts running, i.e. it includes acquiring a pooled (or new) connection and
+    sending BEGIN.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        with self._lock:
+            self.acquisitions += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            mean_wait = self.total_wait / self.acquisitions if self.acquisitions else 0.0
+            return {
+                'acquisitions': self.acquisitions,
+                'acquisition_wait_mean_ms': round(mean_wait * 1000, 3),
+                'acquisition_wait_max_ms': round(self.max_wait * 1000, 3),
+            }
+
+
+class SummarizingTransaction:
+    """A transaction that keeps the results of the statements it runs, to read their summaries once consumed."""
+
+    def __init__(self, tx: Transaction):
+        self._tx = tx
+        self.results = []
+
+    def run(self, *args, **kwargs):
+        result = self._tx.run(*args, **kwargs)
+        self.results.append(result)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
 
 class Instance:
 
-    def __init__(self, uri, user, password):
-        self._driver = GraphDatabase.driver(uri, auth=(user, password)) #, encrypted=True)
+    def __init__(self, uri, user, password, **driver_config):
+        """
+        Wraps a neo4j driver and its connection pool.
+
+        Args:
+            uri (str): the bolt or neo4j URI of the database
+            user (str): the user name
+            password (str): the password
+            driver_config: forwarded to GraphDatabase.driver(), e.g. max_connection_pool_size or connection_acquisition_timeout
+
+        Attributes:
+            hooks (List[Callable]): functions called with a metrics.QueryEvent after each query
+        """
+        self._driver = GraphDatabase.driver(uri, auth=(user, password), **driver_config) #, encrypted=True)
+        self._max_pool_size = driver_config.get('max_connection_pool_size')
+        self._pool_stats = PoolStats()
+        self.hooks = []
 
     def close(self):
         self._driver.close()
 
+    def pool_stats(self) -> Dict:
+        """
+        Statistics about the connection pool: connections in use and idle, and the time spent waiting for a connection.
+        """
+        stats = {'max_size': self._max_pool_size, 'in_use': None, 'idle': None}
+        # the driver has no public API for this, read the pool's state defensively
+        pool = getattr(self._driver, '_pool', None)
+        try:
+            with pool.lock:
+                connections = [c for conns in pool.connections.values() for c in conns]
+                in_use = sum(1 for c in connections if c.in_use)
+            stats['in_use'] = in_use
+            stats['idle'] = len(connections) - in_use
+        except AttributeError:
+            logger.debug("connection pool internals not available for statistics")
+        stats.update(self._pool_stats.as_dict())
+        return stats
+
+    def _timed(self, tx_funct: Callable) -> Callable:
+        # measures the time until the driver hands out a transaction, i.e. the connection acquisition wait
+        requested = perf_counter()
+        started = []
+
+        def timed_tx_funct(tx, *args, **kwargs):
+            if not started:  # retries of the transaction function are not acquisition waits
+                started.append(True)
+                self._pool_stats.record(perf_counter() - requested)
+            return tx_funct(tx, *args, **kwargs)
+        return timed_tx_funct
+
+    @staticmethod
+    def _summarized(tx_funct: Callable) -> Callable:
+        # also returns the summaries of the statements run by tx_funct; they must be read within the transaction
+        def summarized_tx_funct(tx, *args, **kwargs):
+            tx = SummarizingTransaction(tx)
+            results = tx_funct(tx, *args, **kwargs)
+            summaries = [r.consume() for r in tx.results]
+            return results, summaries
+        return summarized_tx_funct
+
+    def _notify(self, name: str, wall_time: float, records: int, summaries: List, q: Query = None):
+        event = QueryEvent(
+            name=name, wall_time=wall_time, records=records, **summarize(summaries),
+            code=q.code if q is not None else None,
+            params=q.params if q is not None else None,
+            access_mode=q.access_mode if q is not None else WRITE_ACCESS,
+        )
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception(f"query hook {hook} failed")
+
+    @staticmethod
+    def _count(results) -> int:
+        return len(results) if isinstance(results, list) else int(bool(results))
+
     def query(self, q: Query):
-        with self._driver.session() as session:
-            results = session.write_transaction(self._tx_funct, q.code, q.params)
-            return results
+        return self.query_with_tx_funct(self._tx_funct, q)
 
     def query_with_tx_funct(self, tx_funct: Callable, q: Query):
         # To enable consuming results within session according to https://neo4j.com/docs/api/python-driver/current/transactions.html
         # "Results should be fully consumed within the function and only aggregate or status values should be returned"
-        with self._driver.session() as session:
-            results = session.write_transaction(tx_funct, q.code, q.params)
+        # Read queries go through read transactions so that a cluster can route them to any member.
+        start = perf_counter()
+        with self._driver.session(default_access_mode=q.access_mode) as session:
+            execute = session.execute_read if q.access_mode == READ_ACCESS else session.execute_write
+            if self.hooks:
+                results, summaries = execute(self._timed(self._summarized(tx_funct)), q.code, q.params)
+                self._notify(type(q).__name__, perf_counter() - start, self._count(results), summaries, q)
+            else:
+                results = execute(self._timed(tx_funct), q.code, q.params)
+            return results
+
+    def stream(self, q: Query, fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Record]:
+        """
+        Run a query and yield its records one by one, pulling them from the server `fetch_size` at a time.
+
+        Unlike query(), the result is never held in memory as a whole, which matters for queries returning the
+        whole graph. The records are consumed within an explicit transaction that stays open until the generator
+        is exhausted or closed; it is committed once all records were read and rolled back otherwise. Since
+        records were already handed out, a transient failure is not retried as it is with query().
+
+        Args:
+            q (Query): the query to run
+            fetch_size (int): the number of records fetched per round trip to the server
+        """
+        start = perf_counter()
+        count = 0
+        with self._driver.session(default_access_mode=q.access_mode, fetch_size=fetch_size) as session:
+            with session.begin_transaction() as tx:
+                results = tx.run(q.code, q.params)
+                for record in results:
+                    count += 1
+                    yield record
+                summary = results.consume() if self.hooks else None
+                tx.commit()
+        if self.hooks:
+            self._notify(type(q).__name__, perf_counter() - start, count, [summary], q)
+
+    def write_transaction(self, tx_funct: Callable, *args, name: str = 'transaction'):
+        """
+        Run tx_funct(tx, *args) in a single write transaction: the statements it runs are committed all together
+        or not at all, and the function is retried as a whole on transient errors.
+
+        The hooks are notified under the given name.
+        """
+        start = perf_counter()
+        with self._driver.session(default_access_mode=WRITE_ACCESS) as session:
+            if self.hooks:
+                results, summaries = session.execute_write(self._timed(self._summarized(tx_funct)), *args)
+                self._notify(name, perf_counter() - start, self._count(results), summaries)
+            else:
+                results = session.execute_write(self._timed(tx_funct), *args)
             return results
 
+    def explain(self, code: str, params: Dict = None, access_mode: str = READ_ACCESS) -> ResultSummary:
+        """
+        Plan the query with EXPLAIN, without running it, and return the summary with its plan.
+
+        The hooks are not notified, the query was not run.
+        """
+        with self._driver.session(default_access_mode=access_mode) as session:
+            return session.run('EXPLAIN ' + code, params).consume()
+
+    def profile(self, code: str, params: Dict = None) -> ResultSummary:
+        """
+        Run the read query with PROFILE and return the summary with its profiled plan.
+
+        The hooks are not notified, e.g. so that a hook can profile the queries it is notified of.
+        """
+        def tx_funct(tx):
+            return tx.run('PROFILE ' + code, params).consume()
+        with self._driver.session(default_access_mode=READ_ACCESS) as session:
+            return session.execute_read(tx_funct)
+
     def exists(self, q: Query) -> bool:
         def tx_funct(tx, code, params):
             results = tx.run(code, params)
@@ -106,74 +373,77 @@ class Instance:
 
     def node(self, n, clause="MERGE"):
         # avoid direct code injection via clause
-        if clause == 'MERGE':
-            cl = 'MERGE'
-        elif clause == 'CREATE':
-            cl = 'CREATE'
-        else:
-            clause = None
-        label = n.label
-        properties_str = to_string(n.properties)  # CHANGE THIS into params={**properties}
-        q = Query()
-        q.code = f"{cl} (n: {label} {{ {properties_str} }}) RETURN n;"
-        q.returns = ['n']
+        if clause not in ('MERGE', 'CREATE'):
+            raise ValueError(f"clause must be 'MERGE' or 'CREATE', not '{clause}'")
+        properties = normalize4neo(n.properties)
+        # the values are parameters so that the statement only varies with the label and the property names
+        properties_str = ', '.join([f"{escape_name(k)}: $props.{escape_name(k)}" for k in sorted(properties)])
+        q = Query(
+            code=f"{clause} (n:{escape_name(n.label)} {{ {properties_str} }}) RETURN n;",
+            returns=['n'],
+            params={'props': properties},
+        )
         res = self.query_with_tx_funct(self._tx_funct_single, q)
         node = res['n']
         return node
 
     def update_node(self, nodeId, properties):
-        q = Query(params={'nodeId': nodeId, 'props': properties})
-        q.code = 'MATCH (n) WHERE id(n) = $nodeId SET n += $props RETURN n;'
-        q.returns = ['r']
+        q = Query(
+            code='MATCH (n) WHERE id(n) = $nodeId SET n += $props RETURN n;',
+            returns=['n'],
+            params={'nodeId': nodeId, 'props': properties},
+        )
         res = self.query_with_tx_funct(self._tx_funct_single, q)
         node = res['n']
         return node
 
     def relationship(self, a, b, r: str, clause="MERGE"):
         # avoid direct code injection
-        if clause == 'MERGE':
-            cl = 'MERGE'
-        elif clause == 'CREATE':
-            cl = 'CREATE'
-        else:
-            clause = None
-        q = Query()
-        q.code = f"MATCH (a) WHERE id(a)={a.id} MATCH (b) WHERE id(b)={b.id} {cl} (a)-[r:{r}]->(b) RETURN r;"
-        q.returns = ['r']
+        if clause not in ('MERGE', 'CREATE'):
+            raise ValueError(f"clause must be 'MERGE' or 'CREATE', not '{clause}'")
+        q = Query(
+            code=f"MATCH (a) WHERE id(a) = $a MATCH (b) WHERE id(b) = $b {clause} (a)-[r:{escape_name(r)}]->(b) RETURN r;",
+            returns=['r'],
+            params={'a': a.id, 'b': b.id},
+        )
         res = self.query_with_tx_funct(self._tx_funct_single, q)
         rel = res['r']
         return rel
 
     def batch_of_nodes(self, label: str, batch: List[Dict]):
         # {batch: [{name:"Alice",age:32},{name:"Bob",age:42}]}
-        records = []
+        nodes = []
         if batch:
-            q = Query()
-            q.code = f'''
+            q = Query(
+                code=f'''
                     UNWIND $batch AS row
-                    CREATE (n:{label})
+                    CREATE (n:{escape_name(label)})
                     SET n += row
                     RETURN n
-                    '''
-            q.returns = ['n']
-            q.params = {'batch': batch}
+                    ''',
+                returns=['n'],
+                params={'batch': batch},
+            )
             records = self.query_with_tx_funct(self._tx_funct, q)
             nodes = [r['n'] for r in records]
         return nodes
 
     def batch_of_relationships(self, batch: List[Tuple], rel_label: str = '', clause="CREATE"):
-        records = []
+        relationships = []
         if batch:
-            q = Query()
-            q.code = f'''
+            if clause not in ('MERGE', 'CREATE'):
+                raise ValueError(f"clause must be 'MERGE' or 'CREATE', not '{clause}'")
+            q = Query(
+                code=f'''
                     UNWIND $batch AS row
                     MATCH (s) WHERE id(s) = row.source
                     MATCH (t) WHERE id(t) = row.target
-                    {clause} (s) -[r:{rel_label}]-> (t)
+                    {clause} (s) -[r:{escape_name(rel_label)}]-> (t)
                     RETURN r
-                    '''
-            q.returns = ['r']
-            q.params = {'batch': batch}
+                    ''',
+                returns=['r'],
+                params={'batch': batch},
+            )
             records = self.query_with_tx_funct(self._tx_funct, q)
             relationships = [r['r'] for r in records]
         return relationships
@@ -198,3 +468,281 @@ class Instance:
         results = tx.run(code, params)
         records = list(results)
         return records
+
+
+class GraphWriter:
+
+    def __init__(
+        self, db: Instance, graphs_per_commit: int = 1, batch_size: int = 10000, flush_interval: float = 10.0,
+        clause: str = 'MERGE', tolerated: Tuple = (),
+    ):
+        """
+        Writes graphs given as tables of nodes and relationships, see txt2node.flatten(), with parameterised UNWIND statements.
+
+        Nodes are grouped by label and set of property names, relationships by type, so that each group is written
+        by a single statement. All the statements of a flush run in one transaction: a graph is either written
+        completely or not at all. The buffer is flushed once it holds `graphs_per_commit` graphs or `batch_size`
+        nodes and relationships, or when `flush_interval` seconds passed since the last flush, and must be flushed
+        at the end with flush(). Graphs are not split across transactions, unless they are written with
+        atomic=False, e.g. a whole ontology, which is then written `batch_size` nodes and relationships at a time.
+
+        Args:
+            db (Instance): the database instance to write to
+            graphs_per_commit (int): number of graphs written in the same transaction
+            batch_size (int): number of buffered nodes and relationships that triggers a flush
+            flush_interval (float): seconds after which an added graph triggers a flush
+            clause (str): 'MERGE' or 'CREATE', used for nodes and relationships
+            tolerated (Tuple): exceptions upon which the buffered graphs are written again node by node instead of
+                failing, skipping only the offending nodes; the graphs are then no longer written atomically
+        """
+        if clause not in ('MERGE', 'CREATE'):  # avoid direct code injection via clause
+            raise ValueError(f"clause must be 'MERGE' or 'CREATE', not '{clause}'")
+        self.db = db
+        self.graphs_per_commit = graphs_per_commit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.clause = clause
+        self.tolerated = tolerated
+        self._nodes = {}  # (label, property names) -> list of {'key': key, 'props': properties}
+        self._relationships = {}  # relationship type -> list of {'source': key, 'target': key}
+        self._ids = {}  # key -> node id
+        self._next_key = 0
+        self._graphs = 0
+        self._buffered = 0
+        self._last_flush = perf_counter()
+        self.nodes_written = 0
+        self.relationships_written = 0
+
+    def write_graph(self, nodes: List[Dict], relationships: List[Dict], atomic: bool = True) -> int:
+        """
+        Buffer a graph and return the key of its first node, to be used with node_id() once flushed.
+
+        Args:
+            nodes (List[Dict]): the nodes as {'key': int, 'label': str, 'properties': Dict}, keys unique within the graph
+            relationships (List[Dict]): the relationships as {'source': key, 'target': key, 'type': str}
+            atomic (bool): write the graph in one transaction; otherwise it is flushed every `batch_size` nodes and
+                relationships, each relationship with the later of its two nodes, so that an error only fails a batch
+        """
+        offset = self._next_key  # keys are made unique across the graphs of the writer
+        incoming = {}  # key -> relationships buffered with that node when the graph is not atomic
+        for r in relationships:
+            if atomic:
+                self._buffer_relationship(r, offset)
+            else:
+                incoming.setdefault(max(r['source'], r['target']), []).append(r)
+        for n in nodes:
+            properties = normalize4neo(n['properties'])
+            group = (n['label'], tuple(sorted(properties)))
+            self._nodes.setdefault(group, []).append({'key': offset + n['key'], 'props': properties})
+            self._next_key = max(self._next_key, offset + n['key'] + 1)
+            if not atomic:
+                for r in incoming.get(n['key'], []):
+                    self._buffer_relationship(r, offset)
+                self._buffered += 1 + len(incoming.get(n['key'], []))
+                if self._buffered >= self.batch_size:
+                    self._graphs += 1  # the part of the graph buffered so far
+                    self.flush()
+        if atomic:
+            self._buffered += len(nodes) + len(relationships)
+        self._graphs += 1
+        if (
+            self._graphs >= self.graphs_per_commit
+            or self._buffered >= self.batch_size
+            or perf_counter() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+        return offset + nodes[0]['key'] if nodes else None
+
+    @property
+    def pending(self) -> int:
+        """The number of graphs buffered and not written yet."""
+        return self._graphs
+
+    def _buffer_relationship(self, r: Dict, offset: int):
+        self._relationships.setdefault(r['type'], []).append({'source': offset + r['source'], 'target': offset + r['target']})
+
+    def node_id(self, key: int) -> int:
+        """The database id of a node that was flushed, None if it was not written."""
+        return self._ids.get(key)
+
+    def flush(self):
+        nodes, self._nodes = self._nodes, {}
+        relationships, self._relationships = self._relationships, {}
+        graphs, self._graphs = self._graphs, 0
+        self._buffered = 0
+        self._last_flush = perf_counter()
+        if graphs:
+            # the nodes of graphs written in several batches may be linked to nodes of the previous batches
+            written = MappingProxyType(self._ids)
+            try:
+                ids, relationships_written = self.db.write_transaction(
+                    self._write_tx, nodes, relationships, written, name='GraphWriter'
+                )
+            except self.tolerated as e:
+                logger.error(e)
+                logger.error(f"Exception when writing {graphs} graph(s), writing them again node by node")
+                ids, relationships_written = self._write_tolerant(nodes, relationships, written)
+            self._ids.update(ids)
+            self.nodes_written += len(ids)
+            self.relationships_written += relationships_written
+
+    def _node_code(self, label: str, names: Tuple) -> str:
+        properties_str = ', '.join([f"{escape_name(k)}: row.props.{escape_name(k)}" for k in names])
+        return f"UNWIND $batch AS row {self.clause} (n:{escape_name(label)} {{ {properties_str} }}) RETURN row.key AS key, id(n) AS id;"
+
+    def _relationship_code(self, rel_type: str) -> str:
+        return f'''
+                UNWIND $batch AS row
+                MATCH (s) WHERE id(s) = row.source
+                MATCH (t) WHERE id(t) = row.target
+                {self.clause} (s) -[r:{escape_name(rel_type)}]-> (t)
+                RETURN count(r) AS n
+                '''
+
+    @staticmethod
+    def _resolve(rel_type: str, rows: List[Dict], ids: Dict) -> List[Dict]:
+        batch = []
+        for row in rows:
+            source, target = ids.get(row['source']), ids.get(row['target'])
+            if source is None or target is None:
+                logger.warning(f"skipping {rel_type} relationship to or from a node that was not written")
+            else:
+                batch.append({'source': source, 'target': target})
+        return batch
+
+    def _write_tx(self, tx: Transaction, nodes: Dict, relationships: Dict, written: Mapping = MappingProxyType({})):
+        # nodes are written first so that the relationships can be resolved to ids within the same transaction;
+        # the function has no side effect so that the driver can retry it
+        ids = {}
+        for (label, names), rows in nodes.items():
+            results = tx.run(self._node_code(label, names), {'batch': rows})
+            ids.update({r['key']: r['id'] for r in results})
+        relationships_written = 0
+        for rel_type, rows in relationships.items():
+            batch = self._resolve(rel_type, rows, ChainMap(ids, written))
+            if batch:
+                results = tx.run(self._relationship_code(rel_type), {'batch': batch})
+                relationships_written += results.single()['n']
+        return ids, relationships_written
+
+    def _write_tolerant(self, nodes: Dict, relationships: Dict, written: Mapping = MappingProxyType({})):
+        ids = {}
+        for (label, names), rows in nodes.items():
+            q = Query(code=self._node_code(label, names), returns=['key', 'id'])
+            for row in rows:
+                try:
+                    ids.update({r['key']: r['id'] for r in self.db.query(q.bind(batch=[row]))})
+                except self.tolerated as e:
+                    logger.error(e)
+                    logger.error(f"Exception with {label}")
+        relationships_written = 0
+        for rel_type, rows in relationships.items():
+            batch = self._resolve(rel_type, rows, ChainMap(ids, written))
+            if batch:
+                q = Query(code=self._relationship_code(rel_type), returns=['n'], params={'batch': batch})
+                relationships_written += self.db.query(q)[0]['n']
+        return ids, relationships_written
+
+
+class AsyncInstance:
+
+    def __init__(self, uri, user, password, **driver_config):
+        """
+        Asyncio counterpart of Instance, wrapping an async neo4j driver and its connection pool.
+
+        Queries follow the same Query contract (code, params, access_mode) and the coroutines return the same
+        records as the corresponding Instance methods, so that a pipeline stage can await database writes while
+        other tasks wait on HTTP. The driver is bound to the event loop it is first used in.
+
+        Args:
+            uri (str): the bolt or neo4j URI of the database
+            user (str): the user name
+            password (str): the password
+            driver_config: forwarded to AsyncGraphDatabase.driver(), e.g. max_connection_pool_size or connection_acquisition_timeout
+        """
+        self._driver = AsyncGraphDatabase.driver(uri, auth=(user, password), **driver_config)
+
+    async def close(self):
+        await self._driver.close()
+
+    async def query(self, q: Query):
+        return await self.query_with_tx_funct(self._tx_funct, q)
+
+    async def query_with_tx_funct(self, tx_funct: Callable, q: Query):
+        # tx_funct is a coroutine function that consumes the results within the transaction, see Instance.query_with_tx_funct()
+        async with self._driver.session(default_access_mode=q.access_mode) as session:
+            if q.access_mode == READ_ACCESS:
+                results = await session.execute_read(tx_funct, q.code, q.params)
+            else:
+                results = await session.execute_write(tx_funct, q.code, q.params)
+            return results
+
+    async def query_many(self, queries: Iterable[Query], concurrency: int = 8) -> List:
+        """
+        Run queries concurrently, each in its own transaction, with at most `concurrency` of them in flight.
+
+        Returns:
+            (List): the records of each query, in the order of the queries.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(q: Query):
+            async with semaphore:
+                return await self.query(q)
+        return await asyncio.gather(*[bounded(q) for q in queries])
+
+    async def exists(self, q: Query) -> bool:
+        async def tx_funct(tx, code, params):
+            results = await tx.run(code, params)
+            found_one = await results.single() is not None
+            summary = await results.consume()
+            notifications = summary.notifications
+            if notifications:
+                logger.warning(f"{notifications} when checking for existence.")
+                logger.warning(summary.query)
+                logger.warning(summary.parameters)
+            return found_one
+        return await self.query_with_tx_funct(tx_funct, q)
+
+    async def batch_of_nodes(self, label: str, batch: List[Dict]):
+        nodes = []
+        if batch:
+            q = Query(
+                code=f'''
+                    UNWIND $batch AS row
+                    CREATE (n:{escape_name(label)})
+                    SET n += row
+                    RETURN n
+                    ''',
+                returns=['n'],
+                params={'batch': batch},
+            )
+            records = await self.query(q)
+            nodes = [r['n'] for r in records]
+        return nodes
+
+    async def batch_of_relationships(self, batch: List[Dict], rel_label: str = '', clause="CREATE"):
+        relationships = []
+        if batch:
+            if clause not in ('MERGE', 'CREATE'):
+                raise ValueError(f"clause must be 'MERGE' or 'CREATE', not '{clause}'")
+            q = Query(
+                code=f'''
+                    UNWIND $batch AS row
+                    MATCH (s) WHERE id(s) = row.source
+                    MATCH (t) WHERE id(t) = row.target
+                    {clause} (s) -[r:{escape_name(rel_label)}]-> (t)
+                    RETURN r
+                    ''',
+                returns=['r'],
+                params={'batch': batch},
+            )
+            records = await self.query(q)
+            relationships = [r['r'] for r in records]
+        return relationships
+
+    @staticmethod
+    async def _tx_funct(tx: AsyncManagedTransaction, code: str, params: Dict = {}):
+        results = await tx.run(code, params)
+        records = [r async for r in results]
+        return records
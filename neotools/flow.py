@@ -3,6 +3,7 @@
 from time import perf_counter
 from common.logging import get_logger
 from neotools import FLOW_BATCH_SIZE
+from neotools.metrics import QUERY_METRICS, QueryEvent, summarize
 
 Logger = get_logger(__name__)
 
@@ -34,25 +35,37 @@ class DbTask:
     def __init__(self, description):
         self.logger = Logger
         self.description = description
+        self._summaries = []
+        self._records = 0
 
     def run_query_with_single_result(self, tx, query):
         """Run the given query and return the single result record."""
         self.logger.debug("Query: %s", query)
         result = tx.run(query)
         record = result.single()
+        self._records += record is not None
+        self._summaries.append(result.consume())
         self.logger.debug("Result: %s", str(record))
         return record
 
     def run_task(self, db_session):
         """Runs the task in a new transaction within the given database session."""
         self.logger.info('Running task "%s"', self.description)
+        self._summaries = []
+        self._records = 0
         start = perf_counter()
         with db_session.begin_transaction() as tx:
             self._run(tx)
             tx.commit()
         end = perf_counter()
         delta = end - start
-        Logger.info('Task "%s" took %.2f s', self.description, delta)
+        summary = summarize(self._summaries)
+        QUERY_METRICS.record(QueryEvent(name=self.__class__.__name__, wall_time=delta, records=self._records, **summary))
+        updates = ', '.join([f"{c}: {v}" for c, v in summary['counters'].items() if v])
+        Logger.info(
+            'Task "%s" took %.2f s (server: %s s until available, %s s until consumed; %s)',
+            self.description, delta, summary['available_after'], summary['consumed_after'], updates or 'no updates',
+        )
 
     def _run(self, _):
         raise NotImplementedError("Subclasses must implement this method")
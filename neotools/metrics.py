@@ -0,0 +1,156 @@
+"""Per-query instrumentation: latency histograms and update counters by query class, in Prometheus text format."""
+
+from bisect import bisect_left
+from collections import namedtuple
+from threading import Lock
+from typing import Dict, List
+
+# upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# the attributes of neo4j.SummaryCounters that are aggregated
+COUNTERS = (
+    'nodes_created', 'nodes_deleted',
+    'relationships_created', 'relationships_deleted',
+    'properties_set', 'labels_added', 'labels_removed',
+)
+
+QueryEvent = namedtuple('QueryEvent', [
+    'name',  # the name of the query, i.e. of its Query class
+    'wall_time',  # seconds from requesting the session until the results were consumed
+    'available_after',  # seconds the server took until the first record was available, None if unknown
+    'consumed_after',  # seconds the server took until all records were consumed, None if unknown
+    'records',  # number of records returned
+    'counters',  # Dict of the COUNTERS of the query summary
+    'code',  # the cypher code, None for transactions running several statements
+    'params',  # the parameters of the query
+    'access_mode',  # READ_ACCESS or WRITE_ACCESS
+], defaults=(None, None, None))
+
+
+def summarize(summaries: List) -> Dict:
+    """
+    Sum the server timings and counters of the summaries of the statements run for one query.
+
+    Args:
+        summaries (List[neo4j.ResultSummary]): the summaries of the results
+    """
+    available_after = [s.result_available_after for s in summaries if s.result_available_after is not None]
+    consumed_after = [s.result_consumed_after for s in summaries if s.result_consumed_after is not None]
+    return {
+        'available_after': sum(available_after) / 1000 if available_after else None,
+        'consumed_after': sum(consumed_after) / 1000 if consumed_after else None,
+        'counters': {c: sum(getattr(s.counters, c) for s in summaries) for c in COUNTERS},
+    }
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is the +Inf bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def prometheus(self, metric: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{metric}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class QueryStats:
+    """The statistics of one query."""
+
+    def __init__(self):
+        self.wall_time = Histogram()
+        self.available_after = Histogram()
+        self.consumed_after = Histogram()
+        self.records = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def record(self, event: QueryEvent):
+        self.wall_time.observe(event.wall_time)
+        if event.available_after is not None:
+            self.available_after.observe(event.available_after)
+        if event.consumed_after is not None:
+            self.consumed_after.observe(event.consumed_after)
+        self.records += event.records
+        for c in COUNTERS:
+            self.counters[c] += event.counters.get(c, 0)
+
+    def as_dict(self) -> Dict:
+        calls = self.wall_time.count
+        return {
+            'calls': calls,
+            'wall_time_total_s': round(self.wall_time.sum, 3),
+            'wall_time_mean_ms': round(self.wall_time.sum / calls * 1000, 3) if calls else 0.0,
+            'server_time_total_s': round(self.available_after.sum + self.consumed_after.sum, 3),
+            'records': self.records,
+            **{c: v for c, v in self.counters.items() if v},
+        }
+
+
+class QueryMetrics:
+    """
+    Aggregates QueryEvents by query name.
+
+    The record() method is meant to be registered as hook of a database Instance. The metrics are those of the
+    current process: with several gunicorn workers, each exposes its own.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stats = {}
+
+    def record(self, event: QueryEvent):
+        with self._lock:
+            self._stats.setdefault(event.name, QueryStats()).record(event)
+
+    def as_dict(self) -> Dict:
+        """The statistics by query name, the most time consuming first."""
+        with self._lock:
+            stats = {name: s.as_dict() for name, s in self._stats.items()}
+        return dict(sorted(stats.items(), key=lambda item: item[1]['wall_time_total_s'], reverse=True))
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def prometheus(self) -> str:
+        """The metrics in Prometheus text exposition format."""
+        histograms = [
+            ('neo4j_query_duration_seconds', 'wall_time', 'Wall time of queries, from session request until results are consumed.'),
+            ('neo4j_query_result_available_after_seconds', 'available_after', 'Server time until the first record is available.'),
+            ('neo4j_query_result_consumed_after_seconds', 'consumed_after', 'Server time until all records are consumed.'),
+        ]
+        with self._lock:
+            stats = sorted(self._stats.items())
+            lines = []
+            for metric, attr, help in histograms:
+                lines.append(f'# HELP {metric} {help}')
+                lines.append(f'# TYPE {metric} histogram')
+                for name, s in stats:
+                    lines += getattr(s, attr).prometheus(metric, f'query="{name}"')
+            lines.append('# HELP neo4j_query_records_total Records returned by queries.')
+            lines.append('# TYPE neo4j_query_records_total counter')
+            for name, s in stats:
+                lines.append(f'neo4j_query_records_total{{query="{name}"}} {s.records}')
+            lines.append('# HELP neo4j_query_updates_total Updates made by queries, by kind of update.')
+            lines.append('# TYPE neo4j_query_updates_total counter')
+            for name, s in stats:
+                for c, v in s.counters.items():
+                    lines.append(f'neo4j_query_updates_total{{query="{name}",counter="{c}"}} {v}')
+        return '\n'.join(lines) + '\n'
+
+
+QUERY_METRICS = QueryMetrics()
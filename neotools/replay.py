@@ -0,0 +1,265 @@
+"""
+Offline replay of query results, to run and benchmark the Python side of neotools and neoflask without Neo4j.
+
+A ReplayInstance stands in for a database Instance. In record mode it runs the queries against a real database and
+saves the records they return in a fixture store; in replay mode it answers the same queries from the store only.
+Set NEO_REPLAY to the directory of the store and NEO_REPLAY_MODE to 'record' or 'replay' to have get_db() return a
+ReplayInstance, e.g. to record the fixtures of the test suite of the API and replay them on any machine:
+
+    NEO_REPLAY=fixtures/replay NEO_REPLAY_MODE=record python -m pytest neoflask
+    NEO_REPLAY=fixtures/replay NEO_REPLAY_MODE=replay python -m pytest neoflask
+
+Results are keyed by the name of the query and a digest of its code and parameters, so that a query whose code
+changed is not answered with stale records. The records are stored as returned by Record.data(), i.e. nodes and
+relationships become dictionaries of their properties as they would for ask_neo().
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List
+import neo4j.time
+from neo4j import READ_ACCESS
+from .db import Instance, Query, DEFAULT_FETCH_SIZE
+
+RECORD, REPLAY = 'record', 'replay'
+
+# the temporal types that are encoded by their ISO format, see encode() and decode()
+TEMPORAL_TYPES = {
+    'DateTime': neo4j.time.DateTime,
+    'Date': neo4j.time.Date,
+    'Time': neo4j.time.Time,
+    'Duration': neo4j.time.Duration,
+}
+
+
+class ReplayMiss(KeyError):
+    """Raised in replay mode for a query that was not recorded."""
+
+
+def encode(value):
+    """A JSON serializable version of a value returned by Record.data()."""
+    if isinstance(value, dict):
+        return {k: encode(v) for k, v in value.items()}
+    for name, t in TEMPORAL_TYPES.items():  # before tuples, Duration is one
+        if isinstance(value, t):
+            return {'$type': name, 'iso': value.iso_format()}
+    if isinstance(value, (list, tuple)):
+        return [encode(v) for v in value]
+    if isinstance(value, datetime.datetime):
+        return {'$type': 'datetime', 'iso': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$type': 'date', 'iso': value.isoformat()}
+    return value
+
+
+def decode(value):
+    """The inverse of encode()."""
+    if isinstance(value, dict):
+        if '$type' in value:
+            if value['$type'] == 'datetime':
+                return datetime.datetime.fromisoformat(value['iso'])
+            if value['$type'] == 'date':
+                return datetime.date.fromisoformat(value['iso'])
+            return TEMPORAL_TYPES[value['$type']].from_iso_format(value['iso'])
+        return {k: decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    return value
+
+
+def fixture_key(code: str, params: Dict) -> str:
+    """A digest of a statement and its parameters, independent of the order of the parameters."""
+    canonical = json.dumps([code, encode(dict(params or {}))], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ReplayRecord(dict):
+    """A record read from the fixture store, with the part of the neo4j.Record interface used by the queries."""
+
+    def data(self, *keys) -> Dict:
+        if keys:
+            return {k: self[k] for k in keys}
+        return dict(self)
+
+    def value(self, key=0, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return super().__getitem__(key)
+
+
+class ReplaySummary:
+    """The summary of a replayed statement: no server timings, no updates and no notifications."""
+    result_available_after = None
+    result_consumed_after = None
+    notifications = None
+    counters = None
+
+
+class ReplayResult:
+
+    def __init__(self, records: List, summary=None):
+        self._records = records
+        self._summary = summary or ReplaySummary()
+
+    def __iter__(self) -> Iterator:
+        return iter(self._records)
+
+    def single(self, strict: bool = False):
+        if not self._records:
+            return None
+        return self._records[0]
+
+    def data(self, *keys) -> List[Dict]:
+        return [r.data(*keys) for r in self._records]
+
+    def consume(self):
+        return self._summary
+
+
+class FixtureStore:
+
+    def __init__(self, path: str):
+        """
+        The recorded results, one JSON file per query name in the directory `path`.
+
+        Each file maps the key of a statement (see fixture_key()) to its code, parameters and records.
+        """
+        self.path = Path(path)
+        self._lock = Lock()
+        self._fixtures = {}
+
+    def _file(self, name: str) -> Path:
+        return self.path / (re.sub(r'[^\w.-]', '_', name) + '.json')
+
+    def _load(self, name: str) -> Dict:
+        # to be called with the lock held
+        if name not in self._fixtures:
+            file = self._file(name)
+            self._fixtures[name] = json.loads(file.read_text()) if file.exists() else {}
+        return self._fixtures[name]
+
+    def get(self, name: str, code: str, params: Dict) -> List[ReplayRecord]:
+        with self._lock:
+            fixture = self._load(name).get(fixture_key(code, params))
+        if fixture is None:
+            raise ReplayMiss(f"no recorded results for {name} with parameters {dict(params or {})}")
+        return [ReplayRecord(decode(r)) for r in fixture['records']]
+
+    def put(self, name: str, code: str, params: Dict, records: List[Dict]):
+        with self._lock:
+            fixtures = self._load(name)
+            fixtures[fixture_key(code, params)] = {
+                'code': code,
+                'params': encode(dict(params or {})),
+                'records': [encode(r) for r in records],
+            }
+            os.makedirs(self.path, exist_ok=True)
+            self._file(name).write_text(json.dumps(fixtures, indent=2, sort_keys=True, default=str))
+
+
+class ReplayTransaction:
+    """
+    Stands in for the transaction given to a transaction function.
+
+    In record mode the statements are run in the real transaction `tx` and their records saved; in replay mode
+    they are read from the store.
+    """
+
+    def __init__(self, store: FixtureStore, name: str, tx=None):
+        self._store = store
+        self._name = name
+        self._tx = tx
+
+    def run(self, code: str, parameters: Dict = None, **kwparameters):
+        params = {**dict(parameters or {}), **kwparameters}
+        if self._tx is None:
+            return ReplayResult(self._store.get(self._name, code, params))
+        result = self._tx.run(code, params)
+        records = list(result)
+        self._store.put(self._name, code, params, [r.data() for r in records])
+        return ReplayResult(records, result.consume())
+
+
+class ReplayInstance(Instance):
+
+    def __init__(self, path: str, mode: str = REPLAY, db: Instance = None):
+        """
+        A database Instance that records query results to, or replays them from, a fixture store.
+
+        Args:
+            path (str): the directory of the fixture store
+            mode (str): RECORD to run the queries with `db` and save their results, REPLAY to only read the store
+            db (Instance): the database the queries are recorded from, required in record mode
+
+        Attributes:
+            hooks (List[Callable]): functions called with a metrics.QueryEvent after each query, as for Instance
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"mode must be '{RECORD}' or '{REPLAY}', not '{mode}'")
+        if mode == RECORD and db is None:
+            raise ValueError("a database instance is required to record query results")
+        self.mode = mode
+        self.store = FixtureStore(path)
+        self._db = db
+        self._driver = db._driver if db is not None else None
+        self._max_pool_size = db._max_pool_size if db is not None else None
+        self._pool_stats = db._pool_stats if db is not None else None
+        self.hooks = []
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+
+    def pool_stats(self) -> Dict:
+        if self._db is not None:
+            return self._db.pool_stats()
+        return {'max_size': None, 'in_use': None, 'idle': None}
+
+    def _run(self, name: str, tx_funct: Callable, *args, q: Query = None):
+        start = perf_counter()
+        if self.mode == REPLAY:
+            results = tx_funct(ReplayTransaction(self.store, name), *args)
+        else:
+            def recording_tx_funct(tx, *args):
+                return tx_funct(ReplayTransaction(self.store, name, tx), *args)
+            # the recorded database passes the code and parameters of q itself, and notifies its own hooks if any
+            if q is not None:
+                results = self._db.query_with_tx_funct(recording_tx_funct, q)
+            else:
+                results = self._db.write_transaction(recording_tx_funct, *args, name=name)
+        self._notify(name, perf_counter() - start, self._count(results), [], q)
+        return results
+
+    def query_with_tx_funct(self, tx_funct: Callable, q: Query):
+        return self._run(type(q).__name__, tx_funct, q.code, q.params, q=q)
+
+    def stream(self, q: Query, fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator:
+        def tx_funct(tx, code, params):
+            return list(tx.run(code, params))
+        yield from self.query_with_tx_funct(tx_funct, q)
+
+    def write_transaction(self, tx_funct: Callable, *args, name: str = 'transaction'):
+        return self._run(name, tx_funct, *args)
+
+    def explain(self, code: str, params: Dict = None, access_mode: str = READ_ACCESS):
+        # there are no plans to replay, nothing is planned without a database
+        if self.mode == REPLAY:
+            return None
+        return self._db.explain(code, params, access_mode)
+
+    def profile(self, code: str, params: Dict = None):
+        if self.mode == REPLAY:
+            return None
+        return self._db.profile(code, params)
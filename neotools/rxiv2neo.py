@@ -2,15 +2,15 @@ from lxml.etree import parse, XMLParser
 import re
 import pandas as pd
 import json
-from typing import List
+from typing import Dict, List, Tuple
 from zipfile import ZipFile, BadZipFile
 from pathlib import Path
 from argparse import ArgumentParser
 from neo4j.exceptions import ClientError
 import common.logging
 from .model import JATS_GRAPH_MODEL, CORD19_GRAPH_MODEL
-from .txt2node import XMLNode, JSONNode
-from .db import Instance
+from .txt2node import XMLNode, JSONNode, flatten
+from .db import Instance, GraphWriter
 from .queries import (
     SOURCE_BY_UUID,
     CREATE_INDEX_DOI,
@@ -29,19 +29,55 @@ DEBUG_MODE = False
 
 class MECALoader:
 
-    def __init__(self, path: Path, glob_pattern='*.meca', check_for_duplicate=False):
+    def __init__(self, path: Path, glob_pattern='*.meca', check_for_duplicate=False, articles_per_commit=1):
         self.path = path
         self.archives = self.path.glob(glob_pattern)
         self.check_for_duplicate = check_for_duplicate
         self.parser = XMLParser(load_dtd=True, no_network=True, recover=True)
+        # each article is written atomically; several articles per commit means fewer but larger transactions
+        self.writer = GraphWriter(DB, graphs_per_commit=articles_per_commit)
+        self.buffered = []  # the archives whose articles are buffered by the writer, not written yet
 
-    def load_full_text(self, z: ZipFile, meca_archive, path_full_text: str):
+    def load_full_text(self, z: ZipFile, meca_archive, path_full_text: str) -> Tuple[List[Dict], List[Dict]]:
         with z.open(path_full_text) as full_text_xml:
             logger.info(f"parsing {meca_archive}/{path_full_text}")
             xml = parse(full_text_xml, parser=self.parser).getroot() # root is <article>
             source = meca_archive.name
             xml_node = XMLNode(xml, JATS_GRAPH_MODEL)
-            build_neo_graph(xml_node, source, DB)
+            return neo_graph(xml_node, source)
+
+    def write(self, meca_archive: Path, nodes: List[Dict], relationships: List[Dict]) -> int:
+        """Buffer the article of an archive, and return the number of archives whose articles could not be written."""
+        self.buffered.append(meca_archive)
+        try:
+            self.writer.write_graph(nodes, relationships)
+        except Exception:
+            return self.failed()
+        if not self.writer.pending:
+            self.loaded()
+        return 0
+
+    def flush(self) -> int:
+        """Write the buffered articles, and return the number of archives whose articles could not be written."""
+        try:
+            self.writer.flush()
+        except Exception:
+            return self.failed()
+        self.loaded()
+        return 0
+
+    def loaded(self):
+        for meca_archive in self.buffered:
+            logger.info(f"loaded {meca_archive.name}")
+        self.buffered = []
+
+    def failed(self) -> int:
+        # the transaction of the flush failed as a whole: none of the buffered articles was written
+        logger.error(
+            f"Error writing the articles of {', '.join(a.name for a in self.buffered)}", exc_info=True
+        )
+        failed, self.buffered = len(self.buffered), []
+        return failed
 
     def already_loaded(self, meca_archive: Path):
         def tx_funct(tx, code, params):
@@ -92,10 +128,13 @@ class MECALoader:
                             logger.warning(msg)
                             path_full_text = self.find_alternative(xml_file_list, path_full_text)
                             logger.warning(f"Trying {path_full_text} instead.")
-                        self.load_full_text(z, meca_archive, path_full_text)
+                        nodes, relationships = self.load_full_text(z, meca_archive, path_full_text)
                 except Exception:
                     logger.error(f"Error processing MECA archive {meca_archive}", exc_info=True)
                     skipped += 1
+                else:
+                    skipped += self.write(meca_archive, nodes, relationships)
+        skipped += self.flush()
         if count is not None:
             logger.info(f"skipped {skipped} out of {count+1}")
         else:
@@ -143,8 +182,7 @@ class CORDLoader:
                 logger.warning(summary.statement)
                 logger.warning(summary.parameters)
             return found_one
-        query = SOURCE_BY_UUID
-        query.params = {'source': archive.name}
+        query = SOURCE_BY_UUID(params={'source': archive.name})
         found_it = DB.query_with_tx_funct(tx_funct, query)
         return found_it
 
@@ -172,25 +210,42 @@ class NoException(Exception):
         super().__init__()
 
 
-def build_neo_graph(py_node, source: str, db: Instance, catch_exception: Exception = NoException):
-    properties = py_node.properties  # deal with types!
-    properties['source'] = source
-    try:
-        node = db.node(py_node)
-    except catch_exception as e:
-        logger.error(e)
-        logger.error(f"Exception with {py_node.label}")
-        node = None
-    except NoException as e:
-        raise e
-    if node is not None:
-        logger.info(f"loaded {py_node.label} as node {node.id}")
-        for rel, children in py_node.children.items():
-            for child in children:
-                child_node = build_neo_graph(child, source, db, catch_exception)
-                if rel is not None:
-                    db.relationship(node, child_node, rel)
-    return node
+def build_neo_graph(
+    py_node, source: str, db: Instance, catch_exception: Exception = NoException, writer: GraphWriter = None,
+    atomic: bool = True,
+):
+    """
+    Write the graph of a parsed document to the database in a single transaction.
+
+    Args:
+        writer (GraphWriter): the writer buffering the document, e.g. to commit several documents together;
+            by default the document is written immediately.
+        atomic (bool): False to write the graph in batches of GraphWriter.batch_size nodes and relationships
+            instead, for documents too large for one transaction such as whole ontologies.
+
+    Returns:
+        (int): the id of the root node, or None if it is not written yet or could not be written.
+    """
+    nodes, relationships = neo_graph(py_node, source)
+    flush_now = writer is None
+    if flush_now:
+        writer = GraphWriter(db, tolerated=(catch_exception,))
+    key = writer.write_graph(nodes, relationships, atomic=atomic)
+    if flush_now:
+        writer.flush()
+    if writer.pending:
+        logger.info(f"buffered {py_node.label} with {len(nodes)} nodes and {len(relationships)} relationships")
+    else:
+        logger.info(f"loaded {py_node.label} with {len(nodes)} nodes and {len(relationships)} relationships")
+    return writer.node_id(key)
+
+
+def neo_graph(py_node, source: str) -> Tuple[List[Dict], List[Dict]]:
+    """The nodes and relationships of a parsed document, see txt2node.flatten(), with the source as property of every node."""
+    nodes, relationships = flatten(py_node)
+    for n in nodes:
+        n['properties']['source'] = source
+    return nodes, relationships
 
 
 def add_indices():
@@ -208,6 +263,7 @@ if __name__ == '__main__':
     parser.add_argument('path', nargs="?", help='Paths to directory containing the archives.')
     parser.add_argument('-Y', '--type', choices=['meca','cord19'], help="Type or archive.")
     parser.add_argument('--no_duplicate_check', action="store_true", help="Use flag to remove check on whether a paper has already been loaded.")
+    parser.add_argument('--articles_per_commit', default=1, type=int, help="Number of MECA articles written in the same transaction.")
     args = parser.parse_args()
     path = args.path
     type = args.type
@@ -215,7 +271,7 @@ if __name__ == '__main__':
 
     if path:
         if type == 'meca':
-            MECALoader(Path(path), check_for_duplicate=check_for_duplicate).load_dir()
+            MECALoader(Path(path), check_for_duplicate=check_for_duplicate, articles_per_commit=args.articles_per_commit).load_dir()
         else:  # type == 'cord19':
             CORDLoader(Path(path), ['MedRxiv']).load_dir()
         add_indices()
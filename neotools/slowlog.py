@@ -0,0 +1,182 @@
+"""
+Capture of slow queries, with their parameters and, for a sample of the read queries, the plan profiled by the server.
+
+Slow queries are stored in a SQLite database that keeps the most recent entries only. List the worst offenders with:
+
+    python -m neotools.slowlog [--path PATH] [--limit N]
+    python -m neotools.slowlog --show ID
+"""
+
+import json
+import os
+import sqlite3
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from random import random
+from typing import Dict, List
+from neo4j import READ_ACCESS
+import common.logging
+from common.logging import LOGGING_BASE_DIR
+from .metrics import QueryEvent
+
+logger = common.logging.get_logger(__name__)
+
+DEFAULT_PATH = f'{LOGGING_BASE_DIR}/slow_queries.sqlite'
+
+# number of operators kept per profiled plan, the ones with the most db hits
+TOP_OPERATORS = 5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS slow_queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at TEXT NOT NULL,
+    name TEXT NOT NULL,
+    wall_time REAL NOT NULL,
+    server_time REAL,
+    records INTEGER,
+    params TEXT,
+    code TEXT,
+    db_hits INTEGER,
+    operators TEXT,
+    plan TEXT
+)
+'''
+
+
+def flatten_plan(plan: Dict) -> List[Dict]:
+    """The operators of a profiled plan as a list, each with its own db hits and rows."""
+    operators = []
+    stack = [plan]
+    while stack:
+        op = stack.pop()
+        operators.append({
+            'operator': op.get('operatorType'),
+            'db_hits': op.get('dbHits', 0),
+            'rows': op.get('rows', 0),
+            'details': op.get('args', {}).get('Details', ''),
+        })
+        stack += op.get('children', [])
+    return operators
+
+
+class SlowQueryLog:
+
+    def __init__(self, db, path: str = DEFAULT_PATH, threshold: float = 1.0, profile_rate: float = 0.1, max_entries: int = 10000):
+        """
+        Records the queries slower than a threshold; meant to be registered as hook of a database Instance.
+
+        Queries are recorded, and profiled, in a background thread so that the slow query itself is not delayed
+        further. Only read queries are profiled: PROFILE runs the query again and would repeat the writes.
+
+        Args:
+            db (Instance): the database instance the profiled queries are run against
+            path (str): the SQLite database file
+            threshold (float): the wall time in seconds above which a query is recorded
+            profile_rate (float): the fraction of the slow read queries that are re-run with PROFILE
+            max_entries (int): the number of most recent entries kept
+        """
+        self.db = db
+        self.path = path
+        self.threshold = threshold
+        self.profile_rate = profile_rate
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slowlog')
+
+    def hook(self, event: QueryEvent):
+        if event.wall_time >= self.threshold and event.code is not None:
+            profile = event.access_mode == READ_ACCESS and random() < self.profile_rate
+            self._executor.submit(self._capture, event, profile)
+
+    def _capture(self, event: QueryEvent, profile: bool):
+        try:
+            plan = self._profile(event) if profile else None
+            self._store(event, plan)
+        except Exception:
+            logger.exception(f"could not record slow query {event.name}")
+
+    def _profile(self, event: QueryEvent) -> Dict:
+        # Instance.profile() does not notify the hooks again
+        summary = self.db.profile(event.code, event.params)
+        return summary.profile if summary is not None else None
+
+    def connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)  # several workers may write at the same time
+        connection.execute(SCHEMA)
+        return connection
+
+    def _store(self, event: QueryEvent, plan: Dict = None):
+        server_times = [t for t in (event.available_after, event.consumed_after) if t is not None]
+        db_hits, operators = None, None
+        if plan is not None:
+            all_operators = flatten_plan(plan)
+            db_hits = sum(op['db_hits'] for op in all_operators)
+            operators = sorted(all_operators, key=lambda op: op['db_hits'], reverse=True)[:TOP_OPERATORS]
+        with self.connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO slow_queries (recorded_at, name, wall_time, server_time, records, params, code, db_hits, operators, plan) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    event.name,
+                    event.wall_time,
+                    sum(server_times) if server_times else None,
+                    event.records,
+                    json.dumps(dict(event.params or {}), default=str),
+                    event.code,
+                    db_hits,
+                    json.dumps(operators) if operators is not None else None,
+                    json.dumps(plan, default=str) if plan is not None else None,
+                )
+            )
+            # rotation: only the most recent entries are kept
+            connection.execute('DELETE FROM slow_queries WHERE id <= ?', (cursor.lastrowid - self.max_entries,))
+        connection.close()
+
+    def worst(self, limit: int = 20) -> List[Dict]:
+        """The queries with the largest total time spent in slow executions."""
+        with self.connect() as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                'SELECT name, COUNT(*) AS n, SUM(wall_time) AS total_time, MAX(wall_time) AS max_time, '
+                'MAX(db_hits) AS max_db_hits, MAX(recorded_at) AS last_seen, MAX(id) AS last_id '
+                'FROM slow_queries GROUP BY name ORDER BY total_time DESC LIMIT ?',
+                (limit,)
+            ).fetchall()
+        connection.close()
+        return [dict(r) for r in rows]
+
+    def entry(self, id: int) -> Dict:
+        with self.connect() as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute('SELECT * FROM slow_queries WHERE id = ?', (id,)).fetchone()
+        connection.close()
+        return dict(row) if row is not None else None
+
+
+def main():
+    parser = ArgumentParser(description='Lists the slowest queries recorded by the slow query log.')
+    parser.add_argument('--path', default=DEFAULT_PATH, help='Path to the slow query log.')
+    parser.add_argument('--limit', default=20, type=int, help='Number of queries to list.')
+    parser.add_argument('--show', type=int, help='Id of an entry to show with its parameters and most expensive operators.')
+    args = parser.parse_args()
+    log = SlowQueryLog(None, path=args.path)
+    if args.show is not None:
+        entry = log.entry(args.show)
+        if entry is None:
+            print(f"no entry {args.show}")
+            return
+        print(f"{entry['name']} on {entry['recorded_at']}: {entry['wall_time']:.3f} s, {entry['records']} records, {entry['db_hits']} db hits")
+        print(f"params: {entry['params']}")
+        print(entry['code'])
+        for op in json.loads(entry['operators'] or '[]'):
+            print(f"{op['db_hits']:>12} db hits {op['rows']:>10} rows  {op['operator']} {op['details']}")
+    else:
+        print(f"{'query':<40} {'n':>6} {'total s':>10} {'max s':>8} {'max db hits':>12}  last entry")
+        for r in log.worst(args.limit):
+            print(f"{r['name']:<40} {r['n']:>6} {r['total_time']:>10.2f} {r['max_time']:>8.2f} {r['max_db_hits'] or '':>12}  {r['last_id']} ({r['last_seen']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+from neo4j import READ_ACCESS, WRITE_ACCESS
+from . import get_db, close_db, get_async_db, close_async_db
+from .db import AsyncInstance, GraphWriter, Instance, Query, ReadQuery
+
+
+class GetDbTestCase(TestCase):
+
+    def tearDown(self):
+        close_db()
+
+    def test_driver_is_reused(self):
+        self.assertIs(get_db(), get_db())
+
+    def test_new_driver_after_close(self):
+        db = get_db()
+        close_db()
+        self.assertIsNot(db, get_db())
+
+    def test_new_driver_after_fork(self):
+        db = get_db()
+        with patch('neotools.os.getpid', return_value=-1):
+            self.assertIsNot(db, get_db())
+
+    def test_pool_stats(self):
+        stats = get_db().pool_stats()
+        self.assertEqual(0, stats['in_use'])
+        self.assertEqual(0, stats['acquisitions'])
+
+
+class AccessModeTestCase(TestCase):
+
+    class Read(ReadQuery):
+        code = "MATCH (n) RETURN n"
+
+    class Write(Query):
+        code = "CREATE (n) RETURN n"
+
+    def setUp(self):
+        self.db = Instance("bolt://localhost:7687", "neo4j", "password")
+        self.db._driver = MagicMock()
+        self.session = self.db._driver.session.return_value.__enter__.return_value
+
+    def test_read_query_uses_read_transaction(self):
+        self.db.query(self.Read())
+        self.db._driver.session.assert_called_once_with(default_access_mode=READ_ACCESS)
+        self.session.execute_read.assert_called_once()
+        self.session.execute_write.assert_not_called()
+
+    def test_write_query_uses_write_transaction(self):
+        self.db.query(self.Write())
+        self.db._driver.session.assert_called_once_with(default_access_mode=WRITE_ACCESS)
+        self.session.execute_write.assert_called_once()
+        self.session.execute_read.assert_not_called()
+
+    def test_explain_does_not_notify_hooks(self):
+        hook = MagicMock()
+        self.db.hooks.append(hook)
+        self.db.explain(self.Write.code, {}, WRITE_ACCESS)
+        self.db._driver.session.assert_called_once_with(default_access_mode=WRITE_ACCESS)
+        self.session.run.assert_called_once_with('EXPLAIN ' + self.Write.code, {})
+        hook.assert_not_called()
+
+
+class QueryTestCase(TestCase):
+
+    class ByDoi(ReadQuery):
+        code = "MATCH (a:Article {doi: $doi}) RETURN a"
+        map = {'doi': {'req_param': 'doi', 'default': ''}}
+        returns = ['a']
+
+    def test_class_is_validated_at_creation(self):
+        with self.assertRaises(ValueError):
+            class Invalid(Query):
+                code = "MATCH (a:Article) RETURN a"
+                map = {'doi': {'req_param': 'doi', 'default': ''}}
+
+    def test_class_attributes_are_frozen(self):
+        self.assertEqual(('a',), self.ByDoi.returns)
+        with self.assertRaises(TypeError):
+            self.ByDoi.map['doi'] = {}
+
+    def test_instances_are_immutable(self):
+        q = self.ByDoi(params={'doi': '10.1/a'})
+        with self.assertRaises(TypeError):
+            q.params['doi'] = '10.1/b'
+        with self.assertRaises(AttributeError):
+            q.code = "MATCH (n) DETACH DELETE n"
+
+    def test_bind_returns_a_new_query(self):
+        q = self.ByDoi()
+        bound = q.bind_request(doi='10.1/a', other='ignored')
+        self.assertEqual({}, dict(q.params))
+        self.assertEqual({'doi': '10.1/a'}, dict(bound.params))
+        self.assertEqual({'doi': '10.1/b'}, dict(bound.bind(doi='10.1/b').params))
+        self.assertEqual({'doi': ''}, dict(q.bind_request().params))
+        self.assertIsInstance(bound, self.ByDoi)
+        self.assertEqual(hash(q), hash(bound))
+
+    def test_code_composed_at_instantiation(self):
+        class Composed(Query):
+            def __init__(self, label):
+                self.code = f"MATCH (n:{label} {{id: $id}}) RETURN n"
+                super().__init__(params={'id': 1})
+        self.assertEqual("MATCH (n:Article {id: $id}) RETURN n", Composed('Article').code)
+
+
+class HooksTestCase(TestCase):
+
+    def setUp(self):
+        self.db = Instance("bolt://localhost:7687", "neo4j", "password")
+        self.db._driver = MagicMock()
+        session = self.db._driver.session.return_value.__enter__.return_value
+        self.result = MagicMock()
+        self.result.__iter__.return_value = ['a', 'b']
+        summary = self.result.consume.return_value
+        summary.result_available_after = 3
+        summary.result_consumed_after = 7
+        summary.counters.nodes_created = 1
+        tx = MagicMock()
+        tx.run.return_value = self.result
+        session.execute_read.side_effect = lambda tx_funct, *args: tx_funct(tx, *args)
+        self.events = []
+        self.db.hooks.append(self.events.append)
+
+    def test_hooks_receive_query_event(self):
+        self.assertEqual(['a', 'b'], self.db.query(AccessModeTestCase.Read()))
+        event, = self.events
+        self.assertEqual('Read', event.name)
+        self.assertEqual(2, event.records)
+        self.assertEqual((0.003, 0.007), (event.available_after, event.consumed_after))
+        self.assertEqual(1, event.counters['nodes_created'])
+
+    def test_failing_hook_does_not_fail_query(self):
+        self.db.hooks.insert(0, MagicMock(side_effect=RuntimeError))
+        self.assertEqual(['a', 'b'], self.db.query(AccessModeTestCase.Read()))
+        self.assertEqual(1, len(self.events))
+
+
+class ParameterisedWriteTestCase(TestCase):
+
+    class Node:
+        label = 'Contrib'
+
+        def __init__(self, properties, id=None):
+            self.properties = properties
+            self.id = id
+
+    def setUp(self):
+        self.db = Instance("bolt://localhost:7687", "neo4j", "password")
+        self.db.query_with_tx_funct = MagicMock(return_value={'n': 'node', 'r': 'rel'})
+
+    def _statement(self):
+        q = self.db.query_with_tx_funct.call_args[0][1]
+        return q.code, q.params
+
+    def test_node_statement_only_depends_on_label_and_property_names(self):
+        self.db.node(self.Node({'surname': "O'Brien", 'given_names': None}))
+        code_1, params_1 = self._statement()
+        self.db.node(self.Node({'given_names': 'Ann', 'surname': 'Smith'}))
+        code_2, params_2 = self._statement()
+        self.assertEqual(code_1, code_2)
+        self.assertEqual("MERGE (n:`Contrib` { `given_names`: $props.`given_names`, `surname`: $props.`surname` }) RETURN n;", code_1)
+        self.assertEqual({'props': {'surname': r"O\'Brien", 'given_names': ''}}, params_1)
+
+    def test_relationship_ids_are_parameters(self):
+        self.db.relationship(self.Node({}, id=1), self.Node({}, id=2), 'has_author')
+        code, params = self._statement()
+        self.assertNotIn('1', code)
+        self.assertEqual({'a': 1, 'b': 2}, params)
+
+    def test_invalid_clause(self):
+        with self.assertRaises(ValueError):
+            self.db.node(self.Node({}), clause='DELETE')
+        with self.assertRaises(ValueError):
+            self.db.relationship(self.Node({}, id=1), self.Node({}, id=2), 'has_author', clause='DELETE')
+
+
+class StreamTestCase(TestCase):
+
+    def setUp(self):
+        self.db = Instance("bolt://localhost:7687", "neo4j", "password")
+        self.db._driver = MagicMock()
+        self.session = self.db._driver.session.return_value.__enter__.return_value
+        self.tx = self.session.begin_transaction.return_value.__enter__.return_value
+        self.tx.run.return_value = iter(['a', 'b', 'c'])
+
+    def test_stream_yields_records_and_commits(self):
+        records = self.db.stream(AccessModeTestCase.Read(), fetch_size=2)
+        self.db._driver.session.assert_not_called()  # nothing runs before the first record is requested
+        self.assertEqual(['a', 'b', 'c'], list(records))
+        self.db._driver.session.assert_called_once_with(default_access_mode=READ_ACCESS, fetch_size=2)
+        self.tx.commit.assert_called_once()
+
+    def test_closed_stream_does_not_commit(self):
+        records = self.db.stream(AccessModeTestCase.Write())
+        self.assertEqual('a', next(records))
+        records.close()
+        self.tx.commit.assert_not_called()
+        self.db._driver.session.return_value.__exit__.assert_called_once()
+
+
+class GraphWriterTestCase(TestCase):
+
+    ARTICLE = (
+        [
+            {'key': 0, 'label': 'Article', 'properties': {'doi': '10.1/a', 'title': None}},
+            {'key': 1, 'label': 'Contrib', 'properties': {'surname': "O'Brien"}},
+            {'key': 2, 'label': 'Contrib', 'properties': {'surname': 'Smith'}},
+        ],
+        [
+            {'source': 0, 'target': 1, 'type': 'has_author'},
+            {'source': 0, 'target': 2, 'type': 'has_author'},
+        ],
+    )
+
+    def setUp(self):
+        self.statements = []
+
+        def run(code, params):
+            self.statements.append((code, params['batch']))
+            result = MagicMock()
+            if 'row.key' in code:
+                result.__iter__.return_value = [{'key': row['key'], 'id': 100 + row['key']} for row in params['batch']]
+            else:
+                result.single.return_value = {'n': len(params['batch'])}
+            return result
+        self.tx = MagicMock()
+        self.tx.run.side_effect = run
+        self.db = MagicMock()
+        self.db.write_transaction.side_effect = lambda tx_funct, *args, **kwargs: tx_funct(self.tx, *args)
+
+    def test_graph_is_written_in_one_transaction(self):
+        writer = GraphWriter(self.db)
+        key = writer.write_graph(*self.ARTICLE)
+        self.db.write_transaction.assert_called_once()
+        self.assertEqual(3, len(self.statements))  # one statement per label and one for the relationships
+        code, batch = self.statements[1]
+        self.assertIn('MERGE (n:`Contrib` { `surname`: row.props.`surname` })', code)
+        self.assertEqual([{'key': 1, 'props': {'surname': r"O\'Brien"}}, {'key': 2, 'props': {'surname': 'Smith'}}], batch)
+        self.assertEqual('', self.statements[0][1][0]['props']['title'])
+        self.assertEqual([{'source': 100, 'target': 101}, {'source': 100, 'target': 102}], self.statements[2][1])
+        self.assertEqual(100, writer.node_id(key))
+        self.assertEqual((3, 2), (writer.nodes_written, writer.relationships_written))
+
+    def test_several_graphs_per_commit(self):
+        writer = GraphWriter(self.db, graphs_per_commit=2)
+        first = writer.write_graph(*self.ARTICLE)
+        self.db.write_transaction.assert_not_called()
+        second = writer.write_graph(*self.ARTICLE)
+        self.db.write_transaction.assert_called_once()
+        self.assertEqual((100, 103), (writer.node_id(first), writer.node_id(second)))
+        self.assertEqual([{'source': 103, 'target': 104}, {'source': 103, 'target': 105}], self.statements[2][1][2:])
+
+    def test_graph_split_in_batches(self):
+        writer = GraphWriter(self.db, batch_size=3)
+        key = writer.write_graph(*self.ARTICLE, atomic=False)
+        writer.flush()
+        self.assertEqual(2, self.db.write_transaction.call_count)
+        # the node and relationship of the second batch, linked to the article written by the first
+        self.assertEqual([{'key': 2, 'props': {'surname': 'Smith'}}], self.statements[3][1])
+        self.assertEqual([{'source': 100, 'target': 102}], self.statements[4][1])
+        self.assertEqual(100, writer.node_id(key))
+        self.assertEqual((3, 2), (writer.nodes_written, writer.relationships_written))
+
+    def test_invalid_clause(self):
+        with self.assertRaises(ValueError):
+            GraphWriter(self.db, clause='DETACH DELETE')
+
+
+class AsyncInstanceTestCase(TestCase):
+
+    def setUp(self):
+        self.db = AsyncInstance("bolt://localhost:7687", "neo4j", "password")
+        self.db._driver = MagicMock()
+        self.session = self.db._driver.session.return_value.__aenter__.return_value
+        self.session.execute_read = AsyncMock(return_value=['read'])
+        self.session.execute_write = AsyncMock(return_value=['written'])
+
+    def test_access_mode_routing(self):
+        self.assertEqual(['read'], asyncio.run(self.db.query(AccessModeTestCase.Read())))
+        self.assertEqual(['written'], asyncio.run(self.db.query(AccessModeTestCase.Write())))
+
+    def test_query_many_keeps_order(self):
+        queries = [AccessModeTestCase.Read(), AccessModeTestCase.Write(), AccessModeTestCase.Read()]
+        results = asyncio.run(self.db.query_many(queries, concurrency=2))
+        self.assertEqual([['read'], ['written'], ['read']], results)
+
+    def test_driver_per_event_loop(self):
+        async def db_and_close():
+            db = get_async_db()
+            self.assertIs(db, get_async_db())
+            await close_async_db()
+            return db
+        self.assertIsNot(asyncio.run(db_and_close()), asyncio.run(db_and_close()))
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from .flow import SimpleDbTask
+from .metrics import COUNTERS
+
+
+class DbTaskTestCase(TestCase):
+
+    def summary(self):
+        return SimpleNamespace(
+            result_available_after=1, result_consumed_after=2, counters=SimpleNamespace(**dict.fromkeys(COUNTERS, 0)),
+        )
+
+    def test_records_counted(self):
+        session = MagicMock()
+        tx = session.begin_transaction.return_value.__enter__.return_value
+        tx.run.return_value.consume.side_effect = [self.summary(), self.summary()]
+        task = SimpleDbTask('creating a constraint', 'CREATE CONSTRAINT ...')
+        with patch('neotools.flow.QUERY_METRICS') as metrics:
+            tx.run.return_value.single.return_value = None  # e.g. a schema statement
+            task.run_task(session)
+            self.assertEqual(metrics.record.call_args.args[0].records, 0)
+            tx.run.return_value.single.return_value = {'count': 3}
+            task.run_task(session)
+            self.assertEqual(metrics.record.call_args.args[0].records, 1)
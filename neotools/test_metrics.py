@@ -0,0 +1,49 @@
+from unittest import TestCase
+from .metrics import Histogram, QueryEvent, QueryMetrics, COUNTERS
+
+
+def event(name, wall_time, nodes_created=0):
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters['nodes_created'] = nodes_created
+    return QueryEvent(name=name, wall_time=wall_time, available_after=0.001, consumed_after=0.002, records=2, counters=counters)
+
+
+class HistogramTestCase(TestCase):
+
+    def test_buckets_are_cumulative(self):
+        h = Histogram(buckets=(0.1, 1.0))
+        for v in (0.05, 0.1, 0.5, 2.0):
+            h.observe(v)
+        self.assertEqual(
+            [
+                'm_bucket{q="x",le="0.1"} 2',
+                'm_bucket{q="x",le="1.0"} 3',
+                'm_bucket{q="x",le="+Inf"} 4',
+                'm_sum{q="x"} 2.65',
+                'm_count{q="x"} 4',
+            ],
+            h.prometheus('m', 'q="x"')
+        )
+
+
+class QueryMetricsTestCase(TestCase):
+
+    def test_aggregation_by_query(self):
+        metrics = QueryMetrics()
+        metrics.record(event('STATS', 0.1))
+        metrics.record(event('STATS', 0.3))
+        metrics.record(event('MERGE_NODES', 1.0, nodes_created=5))
+        stats = metrics.as_dict()
+        self.assertEqual(['MERGE_NODES', 'STATS'], list(stats))  # most time consuming first
+        self.assertEqual(2, stats['STATS']['calls'])
+        self.assertEqual(200.0, stats['STATS']['wall_time_mean_ms'])
+        self.assertEqual(5, stats['MERGE_NODES']['nodes_created'])
+
+    def test_prometheus(self):
+        metrics = QueryMetrics()
+        metrics.record(event('STATS', 0.1))
+        text = metrics.prometheus()
+        self.assertIn('# TYPE neo4j_query_duration_seconds histogram', text)
+        self.assertIn('neo4j_query_duration_seconds_count{query="STATS"} 1', text)
+        self.assertIn('neo4j_query_records_total{query="STATS"} 2', text)
+        self.assertIn('neo4j_query_updates_total{query="STATS",counter="nodes_created"} 0', text)
@@ -0,0 +1,82 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+import neo4j.time
+from .db import ReadQuery
+from .replay import RECORD, REPLAY, ReplayInstance, ReplayMiss, ReplayResult, decode, encode, fixture_key
+
+
+class BY_DOI(ReadQuery):
+    code = 'MATCH (a:Article {doi: $doi}) RETURN a.title AS title, a.pub_date AS pub_date'
+    returns = ['title', 'pub_date']
+
+
+RECORDS = [
+    {'title': 'A title', 'pub_date': neo4j.time.DateTime(2021, 1, 2, 3, 4, 5)},
+    {'title': 'Another title', 'pub_date': None},
+]
+
+
+def data(tx, code, params):
+    return [r.data('title', 'pub_date') for r in tx.run(code, params)]
+
+
+class FakeRecord(dict):
+
+    def data(self, *keys):
+        return dict(self)
+
+
+class FakeInstance:
+    """Runs transaction functions in a transaction returning RECORDS."""
+
+    def __init__(self):
+        self.tx = MagicMock()
+        self.tx.run.return_value = ReplayResult([FakeRecord(r) for r in RECORDS])
+        self._driver = None
+        self._max_pool_size = None
+        self._pool_stats = None
+
+    def query_with_tx_funct(self, tx_funct, q):
+        return tx_funct(self.tx, q.code, q.params)
+
+
+class ReplayTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_encode(self):
+        value = {'dates': [neo4j.time.Date(2021, 1, 2), neo4j.time.Duration(days=2)], 'n': 1}
+        self.assertEqual(decode(encode(value)), value)
+
+    def test_fixture_key(self):
+        self.assertEqual(fixture_key('RETURN $a, $b', {'a': 1, 'b': 2}), fixture_key('RETURN $a, $b', {'b': 2, 'a': 1}))
+        self.assertNotEqual(fixture_key('RETURN $a, $b', {'a': 1, 'b': 2}), fixture_key('RETURN $a, $b', {'a': 1, 'b': 3}))
+
+    def test_record_and_replay(self):
+        q = BY_DOI(params={'doi': '10.1101/2021.01.01.1'})
+        db = FakeInstance()
+        recorder = ReplayInstance(self.dir.name, RECORD, db=db)
+        self.assertEqual(recorder.query_with_tx_funct(data, q), RECORDS)
+        db.tx.run.assert_called_once_with(q.code, dict(q.params))
+
+        replayer = ReplayInstance(self.dir.name, REPLAY)
+        events = []
+        replayer.hooks.append(events.append)
+        self.assertEqual(replayer.query_with_tx_funct(data, q), RECORDS)
+        self.assertEqual(list(replayer.stream(q)), RECORDS)
+        self.assertEqual([e.name for e in events], ['BY_DOI', 'BY_DOI'])
+        self.assertEqual(events[0].records, 2)
+
+    def test_replay_miss(self):
+        replayer = ReplayInstance(self.dir.name, REPLAY)
+        with self.assertRaises(ReplayMiss):
+            replayer.query_with_tx_funct(data, BY_DOI(params={'doi': 'unknown'}))
+
+    def test_record_requires_db(self):
+        with self.assertRaises(ValueError):
+            ReplayInstance(self.dir.name, RECORD)
@@ -0,0 +1,37 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+from neo4j.exceptions import ServiceUnavailable
+from .db import GraphWriter
+from .rxiv2neo import MECALoader
+
+
+ARTICLE = ([{'key': 0, 'label': 'Article', 'properties': {'doi': '10.1/a'}}], [])
+
+
+class MECALoaderTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+        self.loader = MECALoader(Path(self.dir.name), articles_per_commit=2)
+        self.db = MagicMock()
+        self.db.write_transaction.return_value = ({}, 0)
+        self.loader.writer = GraphWriter(self.db, graphs_per_commit=2)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_failed_flush_counts_all_buffered_archives(self):
+        self.db.write_transaction.side_effect = [ServiceUnavailable('connection lost'), ({}, 0)]
+        self.assertEqual(0, self.loader.write(Path('a.meca'), *ARTICLE))
+        self.assertEqual(2, self.loader.write(Path('b.meca'), *ARTICLE))
+        self.assertEqual(0, self.loader.write(Path('c.meca'), *ARTICLE))
+        self.assertEqual([Path('c.meca')], self.loader.buffered)
+        self.assertEqual(0, self.loader.flush())
+        self.assertEqual([], self.loader.buffered)
+
+    def test_failed_final_flush(self):
+        self.db.write_transaction.side_effect = ServiceUnavailable('connection lost')
+        self.loader.write(Path('a.meca'), *ARTICLE)
+        self.assertEqual(1, self.loader.flush())
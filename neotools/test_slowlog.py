@@ -0,0 +1,61 @@
+import json
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+from neo4j import READ_ACCESS, WRITE_ACCESS
+from .metrics import QueryEvent
+from .slowlog import SlowQueryLog, flatten_plan
+
+
+PLAN = {
+    'operatorType': 'ProduceResults', 'dbHits': 0, 'rows': 10, 'args': {'Details': 'n'},
+    'children': [
+        {'operatorType': 'Filter', 'dbHits': 300, 'rows': 10, 'args': {'Details': 'n.doi = $doi'}, 'children': [
+            {'operatorType': 'AllNodesScan', 'dbHits': 1000, 'rows': 999, 'args': {'Details': 'n'}, 'children': []},
+        ]},
+    ],
+}
+
+
+def event(name='BY_DOIS', wall_time=2.0, access_mode=READ_ACCESS):
+    return QueryEvent(
+        name=name, wall_time=wall_time, available_after=1.5, consumed_after=0.2, records=10, counters={},
+        code='MATCH (n) WHERE n.doi = $doi RETURN n', params={'doi': '10.1/a'}, access_mode=access_mode,
+    )
+
+
+class SlowQueryLogTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = TemporaryDirectory()
+        self.db = MagicMock()
+        self.db.profile.return_value.profile = PLAN
+        self.log = SlowQueryLog(self.db, path=f'{self.dir.name}/slow.sqlite', threshold=1.0, profile_rate=1.0, max_entries=3)
+
+    def tearDown(self):
+        self.log._executor.shutdown()
+        self.dir.cleanup()
+
+    def test_flatten_plan(self):
+        self.assertEqual(['ProduceResults', 'Filter', 'AllNodesScan'], [op['operator'] for op in flatten_plan(PLAN)])
+
+    def test_only_slow_queries_are_recorded(self):
+        self.log.hook(event(wall_time=0.5))
+        self.log.hook(event(wall_time=2.0))
+        self.log._executor.shutdown()
+        worst, = self.log.worst()
+        self.assertEqual(('BY_DOIS', 1, 1300), (worst['name'], worst['n'], worst['max_db_hits']))
+        entry = self.log.entry(worst['last_id'])
+        self.assertEqual({'doi': '10.1/a'}, json.loads(entry['params']))
+        self.assertEqual('AllNodesScan', json.loads(entry['operators'])[0]['operator'])
+
+    def test_write_queries_are_not_profiled(self):
+        self.log.hook(event(access_mode=WRITE_ACCESS))
+        self.log._executor.shutdown()
+        self.db.profile.assert_not_called()
+        self.assertIsNone(self.log.worst()[0]['max_db_hits'])
+
+    def test_rotation(self):
+        for i in range(5):
+            self.log._store(event(name=f'Q{i}'))
+        self.assertEqual({'Q2', 'Q3', 'Q4'}, {r['name'] for r in self.log.worst()})
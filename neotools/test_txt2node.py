@@ -2,7 +2,7 @@ from lxml.etree import parse
 from io import BytesIO
 from unittest import TestCase
 from .model import JATS_GRAPH_MODEL, CORD19_GRAPH_MODEL, CROSSREF_PREPRINT_API_GRAPH_MODEL
-from .txt2node import XMLNode, JSONNode
+from .txt2node import XMLNode, JSONNode, flatten
 
 
 class TestJSONNode(JSONNode):
@@ -364,4 +364,37 @@ class XMLNodeTestCase(NodeTestCase):
             }
         )
         actual_node = XMLNode(parse(BytesIO(input)).getroot(), JATS_GRAPH_MODEL)
-        self.assert_nodes_equal(expected_node, actual_node)
\ No newline at end of file
+        self.assert_nodes_equal(expected_node, actual_node)
+
+
+class FlattenTestCase(TestCase):
+
+    def test_flatten(self):
+        tree = TestJSONNode(
+            label='Article',
+            properties={'doi': '10.1/a'},
+            children={
+                'has_author': [
+                    TestJSONNode(
+                        label='Contrib',
+                        properties={'surname': 'Yang'},
+                        children={'has_orcid': [TestJSONNode(label='Contrib_id', properties={'text': 'orcid'})]},
+                    ),
+                    TestJSONNode(label='Contrib', properties={'surname': 'Smith'}),
+                ],
+                None: [TestJSONNode(label='Note', properties={})],
+            }
+        )
+        nodes, relationships = flatten(tree)
+        self.assertEqual(
+            [(0, 'Article'), (1, 'Contrib'), (2, 'Contrib_id'), (3, 'Contrib'), (4, 'Note')],
+            [(n['key'], n['label']) for n in nodes]
+        )
+        self.assertEqual(
+            [
+                {'source': 0, 'target': 1, 'type': 'has_author'},
+                {'source': 1, 'target': 2, 'type': 'has_orcid'},
+                {'source': 0, 'target': 3, 'type': 'has_author'},
+            ],
+            relationships
+        )
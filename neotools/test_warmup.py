@@ -0,0 +1,86 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+from neo4j import READ_ACCESS
+from neo4j.exceptions import CypherSyntaxError, ServiceUnavailable
+from .db import Query, ReadQuery, QUERY_REGISTRY
+from .replay import REPLAY, ReplayInstance
+from .warmup import example_params, registered_queries, warm_up
+
+
+class BY_DOI(ReadQuery):
+    code = 'MATCH (a:Article {doi: $doi}) RETURN a LIMIT $limit'
+    map = {'doi': [], 'limit': {'req_param': 'pagesize', 'default': 10}}
+    returns = ['a']
+    examples = [{'doi': '10.1/a'}]
+
+
+class BROKEN(ReadQuery):
+    code = 'MATCH (a:Article RETURN a'
+
+
+class SET_TITLE(Query):
+    code = 'MATCH (a:Article {doi: $doi}) SET a.title = $title'
+
+
+class WarmUpTestCase(TestCase):
+
+    def setUp(self):
+        self.db = MagicMock()
+
+    def test_registry(self):
+        self.assertIs(QUERY_REGISTRY[f'{__name__}.BY_DOI'], BY_DOI)
+        self.assertIs(QUERY_REGISTRY[f'{__name__}.SET_TITLE'], SET_TITLE)
+
+    def test_registered_queries(self):
+        self.assertEqual(registered_queries(exclude_tests=False, module=__name__), {
+            f'{__name__}.BY_DOI': BY_DOI,
+            f'{__name__}.BROKEN': BROKEN,
+        })
+        self.assertIn(f'{__name__}.SET_TITLE', registered_queries(read_only=False, exclude_tests=False, module=__name__))
+        self.assertEqual(registered_queries(module=__name__), {})
+
+    def test_example_params(self):
+        self.assertEqual(example_params(BY_DOI), [{'doi': '10.1/a', 'limit': 10}])
+        self.assertEqual(example_params(BROKEN), [{}])
+        # no value to type $doi and $title with
+        self.assertEqual(example_params(SET_TITLE), [])
+
+    def test_examples_frozen(self):
+        self.assertIsInstance(BY_DOI.examples, tuple)
+        with self.assertRaises(TypeError):
+            BY_DOI.examples[0]['doi'] = None
+        with self.assertRaises(ValueError):
+            class BY_TITLE(ReadQuery):
+                code = 'MATCH (a:Article {title: $title}) RETURN a'
+                examples = [{'doi': '10.1/a'}]
+
+    def test_warm_up(self):
+        failures = warm_up(self.db, [BY_DOI, SET_TITLE])
+        self.assertEqual(failures, {})
+        # SET_TITLE has no example values and is skipped
+        self.db.explain.assert_called_once_with(BY_DOI.code, {'doi': '10.1/a', 'limit': 10}, READ_ACCESS)
+        # the hooks of the instance are bypassed
+        self.db.query.assert_not_called()
+
+    def test_warm_up_failure(self):
+        def explain(code, params, access_mode):
+            if code == BROKEN.code:
+                error = CypherSyntaxError()
+                error.message = 'Invalid input'
+                raise error
+            return MagicMock()
+        self.db.explain.side_effect = explain
+        failures = warm_up(self.db, [BY_DOI, BROKEN])
+        self.assertEqual(failures, {'BROKEN': 'Invalid input'})
+
+    def test_warm_up_driver_error(self):
+        # a database that can't be reached stops the warm-up instead of timing out on each query
+        self.db.explain.side_effect = ServiceUnavailable('connection lost')
+        with self.assertRaises(ServiceUnavailable):
+            warm_up(self.db, [BROKEN, BY_DOI])
+        self.assertEqual(self.db.explain.call_count, 1)
+
+    def test_warm_up_replay(self):
+        with TemporaryDirectory() as path:
+            self.assertEqual(warm_up(ReplayInstance(path, REPLAY), [BY_DOI, BROKEN]), {})
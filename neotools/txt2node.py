@@ -1,5 +1,5 @@
 from lxml.etree import Element, XPathEvalError
-from typing import Dict
+from typing import Dict, List, Tuple
 import re
 import common.logging
 from .utils import inner_text
@@ -186,3 +186,28 @@ class JSONNode:
 
     def __str__(self):
         return self.to_str()
+
+
+def flatten(py_node) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Flattens the tree of an XMLNode or JSONNode into a table of nodes and a table of relationships.
+
+    Nodes are numbered in depth-first order, starting with 0 for the root.
+    Relationships link the nodes by their keys; children listed under the relationship None are not linked to their parent.
+
+    Returns:
+        (Tuple[List[Dict], List[Dict]]): the nodes as {'key', 'label', 'properties'} and the relationships as {'source', 'target', 'type'}
+    """
+    nodes, relationships = [], []
+    stack = [(py_node, None, None)]
+    while stack:
+        node, parent_key, rel = stack.pop()
+        key = len(nodes)
+        nodes.append({'key': key, 'label': node.label, 'properties': node.properties})
+        if parent_key is not None and rel is not None:
+            relationships.append({'source': parent_key, 'target': key, 'type': rel})
+        # pushed in reverse to pop the children in document order
+        for child_rel, children in reversed(list(node.children.items())):
+            for child in reversed(children):
+                stack.append((child, key, child_rel))
+    return nodes, relationships
@@ -0,0 +1,124 @@
+"""
+Plan warm-up of the registered queries: each query is compiled with EXPLAIN, which plans it without running it.
+
+Warming up puts the plans in Neo4j's query cache before the first request needs them, and reveals the queries that
+no longer compile against the current database. The parameters of the plans are typed like those of the requests,
+from the defaults of the query map and the Query.examples; queries without them are skipped. To check all the
+queries of the project, e.g. after a database update:
+
+    python -m neotools.warmup [--all]
+"""
+
+import re
+import sys
+from argparse import ArgumentParser
+from importlib import import_module
+from time import perf_counter
+from typing import Dict, Iterable, List
+from neo4j import READ_ACCESS
+from neo4j.exceptions import Neo4jError
+import common.logging
+from .db import Instance, Query, QUERY_REGISTRY
+
+logger = common.logging.get_logger(__name__)
+
+# the modules defining the queries of the project
+QUERY_MODULES = [
+    'neoflask.queries',
+    'neotools.queries',
+    'sdg.queries',
+    'sdg.algonet',
+    'peerreview.queries',
+    'ontoneo.queries',
+]
+
+
+def example_params(query_class) -> List[Dict]:
+    """
+    Representative parameters of a query: the default values of its map, updated with each of its examples.
+
+    Neo4j caches the plans by the types of the parameters, so a query with a variable that has neither a default value
+    nor an example value has no representative parameters and is not compiled: an empty list.
+    """
+    defaults = {}
+    for var_in_cypher, var_in_request in query_class.map.items():
+        if isinstance(var_in_request, dict) and var_in_request.get('default') is not None:
+            defaults[var_in_cypher] = var_in_request['default']
+    variables = set(re.findall(r"\$(\w+)", query_class.code))
+    examples = [{**defaults, **example} for example in query_class.examples or [{}]]
+    return [params for params in examples if variables <= params.keys()]
+
+
+def registered_queries(read_only: bool = True, exclude_tests: bool = True, module: str = '') -> Dict:
+    """
+    The registered query classes that can be compiled on their own, i.e. whose code is defined by the class.
+
+    Args:
+        read_only (bool): only the read queries
+        exclude_tests (bool): leave out the queries defined by test modules
+        module (str): only the queries defined in this module or package
+    """
+    return {
+        name: cls for name, cls in QUERY_REGISTRY.items()
+        if cls.code.strip()
+        and name.startswith(module)
+        and (cls.access_mode == READ_ACCESS or not read_only)
+        and not (exclude_tests and 'test' in cls.__module__)
+    }
+
+
+def warm_up(db: Instance, queries: Iterable = None) -> Dict:
+    """
+    Compile queries with EXPLAIN.
+
+    Args:
+        db (Instance): the database instance to compile the queries with
+        queries (Iterable): the Query classes to compile, by default the registered read queries
+
+    Returns:
+        (Dict): the error message by name of the queries that did not compile
+    """
+    if queries is None:
+        queries = registered_queries().values()
+    failures = {}
+    start = perf_counter()
+    n = 0
+    skipped = 0
+    # with Instance.explain() to not record the compilations as queries; driver errors (e.g. ServiceUnavailable) are
+    # raised to stop the warm-up rather than wait for the connection timeout of every query
+    for query_class in queries:
+        name = query_class.__name__
+        examples = example_params(query_class)
+        if not examples:
+            skipped += 1
+            logger.debug(f"query {name} not compiled: no example value for some of its variables")
+        for params in examples:
+            try:
+                summary = db.explain(query_class.code, params, query_class.access_mode)
+            except Neo4jError as e:
+                failures[name] = e.message
+                logger.error(f"query {name} does not compile: {e.message}")
+                break
+            if summary is not None:  # None without a database to plan with, e.g. replaying recorded results
+                n += 1
+    logger.info(f"compiled {n} plans in {perf_counter() - start:.2f} s, {len(failures)} failed, {skipped} queries without examples skipped")
+    return failures
+
+
+def main():
+    parser = ArgumentParser(description='Compiles the queries of the project with EXPLAIN to warm up the plan cache and check that they are valid.')
+    parser.add_argument('--all', action='store_true', help='Also compile the write queries (they are not run).')
+    args = parser.parse_args()
+    for module in QUERY_MODULES:
+        try:
+            import_module(module)
+        except ImportError as e:  # e.g. dependencies of the deploy image missing
+            logger.warning(f"queries of {module} not checked: {e}")
+    from . import get_db
+    failures = warm_up(get_db(), registered_queries(read_only=not args.all).values())
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    common.logging.configure_logging()
+    main()
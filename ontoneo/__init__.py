@@ -1,9 +1,9 @@
 import os
 from dotenv import load_dotenv
-from neotools.db import Instance
+from neotools import get_db
 
 load_dotenv()
 NEO_URI = os.getenv('NEO_URI')
 NEO_USERNAME = os.getenv("NEO_USERNAME")
 NEO_PASSWORD = os.getenv("NEO_PASSWORD")
-DB = Instance(NEO_URI, NEO_USERNAME, NEO_PASSWORD)
+DB = get_db()
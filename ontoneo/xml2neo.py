@@ -37,7 +37,8 @@ def load_ontology(path: Path, graph_model: Dict):
         source = path.name
         xml_node = XMLNode(xml, graph_model, namespaces=namespaces)
         DB.query(CONTRAINT_CLASS_UNIQUE()) # some ontologies share classes, will raise neobolt.exceptions.ConstraintError
-        build_neo_graph(xml_node, source, DB, ConstraintError)
+        # a whole ontology is too large for one transaction: written in batches, a constraint error only affects one
+        build_neo_graph(xml_node, source, DB, ConstraintError, atomic=False)
         res = DB.query(REMOVE_DEPRECATED())
         for row in res:
             logger.info("REMOVE_DEPRECATED: ", "; ".join([str(row[column]) for column in REMOVE_DEPRECATED.returns]))
@@ -1,7 +1,7 @@
 import os
 from hypothepy.v1.api import HypoApi
 from dotenv import load_dotenv
-from neotools.db import Instance
+from neotools import get_db
 
 load_dotenv()
 
@@ -20,4 +20,4 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 
 OPENAI_API_TOKEN = os.getenv("OPENAI_API_TOKEN")
 
-DB = Instance(NEO_URI, NEO_USERNAME, NEO_PASSWORD)
+DB = get_db()
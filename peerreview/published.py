@@ -1,8 +1,12 @@
+import asyncio
+import threading
 from argparse import ArgumentParser
+from typing import Dict
 from pandas import DataFrame, concat, read_csv, to_datetime
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 import common.logging
+from neotools import close_async_db, get_async_db
 from peerreview.neohypo import BioRxiv, CrossRefDOI
 from sdg.sdnode import API
 from . import DB
@@ -26,10 +30,23 @@ def _date_from_parts(parts):
 
 class PublicationUpdate:
 
-    def __init__(self, db):
+    def __init__(self, db, concurrency: int = 8):
         self.db = db
-        self.biorxiv = BioRxiv()
-        self.crossref = CrossRefDOI()
+        self.concurrency = concurrency  # number of preprints checked and updated at the same time
+        # the HTTP clients of each worker thread of asyncio.to_thread(): a requests.Session is not thread-safe
+        self._clients = threading.local()
+
+    @property
+    def biorxiv(self) -> BioRxiv:
+        if not hasattr(self._clients, 'biorxiv'):
+            self._clients.biorxiv = BioRxiv()
+        return self._clients.biorxiv
+
+    @property
+    def crossref(self) -> CrossRefDOI:
+        if not hasattr(self._clients, 'crossref'):
+            self._clients.crossref = CrossRefDOI()
+        return self._clients.crossref
 
     def get_not_published(self, limit_date: str):
         results = self.db.query(NotYetPublished(params={'limit_date': limit_date}))
@@ -39,38 +56,58 @@ class PublicationUpdate:
     def check_publication_status(self, preprint_doi):
         raise NotImplementedError()
 
-    def update_status(self, preprint_doi, published_doi):
+    def publication_metadata(self, preprint_doi, published_doi) -> Dict:
         cross_ref_metadata = self.crossref.details(published_doi)
         published_journal_title = cross_ref_metadata.get('container-title', '')
         published_date = _date_from_parts(cross_ref_metadata.get('published', {}).get('date-parts', [[]])[0])
-
-        params = {
+        return {
             'preprint_doi': preprint_doi,
             'published_doi': published_doi,
             'published_journal_title': published_journal_title,
             'published_date': published_date,
         }
+
+    def update_status(self, preprint_doi, published_doi):
+        params = self.publication_metadata(preprint_doi, published_doi)
         update_published_status = UpdatePublicationStatus(params=params)
         self.db.query(update_published_status)
-        return published_journal_title, published_date
+        return params['published_journal_title'], params['published_date']
+
+    async def _update_status_async(self, db, preprint_doi, published_doi):
+        # the blocking HTTP calls run in a worker thread while other preprints are written to the database
+        params = await asyncio.to_thread(self.publication_metadata, preprint_doi, published_doi)
+        await db.query(UpdatePublicationStatus(params=params))
+        logger.info(f"{preprint_doi} --> {published_doi} in {params['published_journal_title']} on {params['published_date']}")
+
+    async def _check_and_update_async(self, db, preprint_doi):
+        published_doi = await asyncio.to_thread(self.check_publication_status, preprint_doi)
+        if (published_doi is not None) and (published_doi != "NA"):
+            await self._update_status_async(db, preprint_doi, published_doi)
+
+    async def _gather(self, coroutine_funct, items):
+        db = get_async_db()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(item):
+            async with semaphore:
+                await coroutine_funct(db, *item)
+        try:
+            tasks = [bounded(item) for item in items]
+            with logging_redirect_tqdm():
+                for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+                    await task
+        finally:
+            await close_async_db()
 
     def run(self, limit_date: str):
         not_yet_published = self.get_not_published(limit_date)
         logger.info(f"{len(not_yet_published)} preprints posted since {limit_date} with no journal publication info yet.")
-        with logging_redirect_tqdm():
-            for preprint_doi in tqdm(not_yet_published):
-                published_doi = self.check_publication_status(preprint_doi)
-                if (published_doi is not None) and (published_doi != "NA"):
-                    journal, date = self.update_status(preprint_doi, published_doi)
-                    logger.info(f"{preprint_doi} --> {published_doi} in {journal} on {date}")
+        asyncio.run(self._gather(self._check_and_update_async, [(doi,) for doi in not_yet_published]))
 
     def up_date(self):
         published = [(r['preprint_doi'], r['published_doi']) for r in self.db.query(PublishedNoDate())]
         logger.info(f"{len(published)} preprints posted with no journal publication date yet.")
-        with logging_redirect_tqdm():
-            for preprint_doi, published_doi in tqdm(published):
-                journal, date = self.update_status(preprint_doi, published_doi)
-                logger.info(f"{preprint_doi} --> {published_doi} in {journal} on {date}")
+        asyncio.run(self._gather(self._update_status_async, published))
 
 class BiorxivPubUpdate(PublicationUpdate):
     def check_publication_status(self, preprint_doi):
@@ -153,6 +190,11 @@ class CrossRefPubUpdate(PublicationUpdate):
         super().__init__(db)
         self.crossref_preprints = CrossRefPreprintApi()
 
+    def run(self, limit_date: str):
+        # load the table of published preprints once, before the concurrent status checks read it
+        self.crossref_preprints._published_preprints()
+        super().run(limit_date)
+
     def check_publication_status(self, preprint_doi):
         data = self.crossref_preprints._published_preprints()
         published_dois = data.loc[data['preprint_doi'] == preprint_doi, 'published_doi']
@@ -2,7 +2,7 @@ import networkx as nx
 import numpy as np
 from cdlib.algorithms import spinglass
 import common.logging
-from neotools.db import Query
+from neotools.db import Query, ReadQuery
 from sklearn.feature_extraction.text import TfidfVectorizer
 from math import isnan
 from collections import OrderedDict
@@ -11,7 +11,7 @@ from . import DB
 logger = common.logging.get_logger(__name__)
 
 
-class ENTITY_AS_NODE(Query):
+class ENTITY_AS_NODE(ReadQuery):
     code = '''
 MATCH 
     (coll:SDCollection)-->(a:SDArticle)-[r:HasH]->(h:Hypothesis),
@@ -118,7 +118,7 @@ RETURN autotopics
 
 
 def full_graph(q):
-    results = DB.query(q)
+    results = DB.stream(q)  # the edges are added as they arrive rather than loading the whole result first
     g = nx.DiGraph()
     for r in results:
         source = r['edge']['source']
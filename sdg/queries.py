@@ -1,7 +1,7 @@
-from neotools.db import Query
+from neotools.db import Query, ReadQuery
 
 
-class ALL_ARTICLES(Query):
+class ALL_ARTICLES(ReadQuery):
 
     code = '''
 MATCH (a:SDArticle)
@@ -10,7 +10,7 @@ RETURN id(a) AS id, a.doi AS doi
     returns = ['id', 'doi']
 
 
-class FIGURES_BY_PAPER_ID(Query):
+class FIGURES_BY_PAPER_ID(ReadQuery):
 
     code = '''
 MATCH (a:SDArticle )-->(f:SDFigure)
@@ -22,7 +22,7 @@ ORDER BY f.fig_label ASC
     returns = ['id', 'fig_label', 'fig_title', 'href', 'caption']
 
 
-class PANEL_BY_FIG_ID(Query):
+class PANEL_BY_FIG_ID(ReadQuery):
 
     code = '''
 MATCH (f:SDFigure)-->(p:SDPanel)-->(t:SDTag)
@@ -468,6 +468,135 @@ create_automagic_collection = SimpleDbTask(
 )
 
 
+# The RefereedPreprint documents of the API (see REFEREED_PREPRINT_DOCUMENT_V2 in neoflask/queries.py), rendered once
+# per update instead of on every request. Must run after the collections, entities and highlights are linked.
+render_refereed_preprint_documents = UpdateOrCreateTask(
+    "rendering the refereed preprint documents of the API",
+    """
+    MATCH (:VizCollection {name: 'refereed-preprints'})-[:HasSubCol]->(:VizSubCollection)-[:HasPaper]->(vzp:VizPaper)
+    RETURN DISTINCT vzp
+    """,
+    """
+    // the most recent version of the article; as in REFEREED_PREPRINT_V2, no document without one, so that the paper is
+    // not found rather than returned with null fields
+    MATCH (article:Article {doi: vzp.doi})
+    WITH vzp, article
+    ORDER BY article.version DESC
+    WITH vzp, COLLECT(article)[0] AS a
+    MATCH (vzp)<-[:HasPaper]-(subcol:VizSubCollection)<-[:HasSubCol]-(:VizCollection {name: 'refereed-preprints'})
+    MATCH (vzp)-[:HasReviewDate]->(revdate:VizReviewDate)
+    WITH
+        a,
+        vzp,
+        COLLECT(DISTINCT subcol.name) AS reviewed_by,
+        COLLECT(DISTINCT revdate.date) AS review_dates
+    OPTIONAL MATCH (a)-->(auth:Contrib)
+    OPTIONAL MATCH (auth)-[:has_orcid]->(auth_id:Contrib_id)
+    WITH
+        a,
+        vzp,
+        reviewed_by,
+        review_dates,
+        auth,
+        auth_id
+    ORDER BY auth.position_idx
+    WITH
+        a,
+        vzp,
+        reviewed_by,
+        review_dates,
+        COLLECT(DISTINCT auth {.surname, .given_names, .position_idx, .corresp, orcid: auth_id.text}) AS authors
+    OPTIONAL MATCH (VizCollection {name: 'by-auto-topics'})-->(autotopics:VizSubCollection)-[rel_autotopics_paper]->(vzp)-[:HasEntityHighlight]->(highlight:VizEntity {category: 'entity'})
+    WITH
+        a,
+        vzp,
+        reviewed_by,
+        review_dates,
+        authors,
+        COLLECT(DISTINCT autotopics.topics) AS main_topics,
+        COLLECT(DISTINCT highlight.text) AS highlighted_entities
+    OPTIONAL MATCH (vzp)-[:HasEntity]->(assay:VizEntity {category: 'assay'})
+    WITH
+        a,
+        vzp,
+        reviewed_by,
+        review_dates,
+        authors,
+        main_topics,
+        highlighted_entities,
+        COLLECT(DISTINCT assay.text) AS assays
+    OPTIONAL MATCH (vzp)-[:HasEntity]->(entity:VizEntity {category: 'entity'})
+    // don't duplicate entities if they are in the topic highlight set
+    WHERE not((vzp)-[:HasEntityHighlight]->(entity))
+    WITH
+        a,
+        vzp,
+        reviewed_by,
+        review_dates,
+        authors,
+        main_topics,
+        highlighted_entities,
+        assays,
+        COLLECT(DISTINCT entity.text) AS entities
+    SET vzp.refereed_preprint_json = apoc.convert.toJson({
+        slug: vzp.slug,
+        doi: a.doi,
+        version: a.version,
+        source: a.source,
+        journal: a.journal_title,
+        title: a.title,
+        abstract: a.abstract,
+        journal_doi: a.journal_doi,
+        published_journal_title: a.published_journal_title,
+        pub_date: toString(DATETIME(a.publication_date)),
+        review_dates: review_dates,
+        reviewed_by: reviewed_by,
+        authors: authors,
+        entities: entities,
+        assays: assays,
+        main_topics: main_topics,
+        highlighted_entities: highlighted_entities
+    })
+    """,
+)
+
+# the refereed preprints of each reviewing service, and of all of them (list ''), in each order the API sorts them;
+# one VizPaperRank per paper and list, keyed 'reviewed_by|sort_by|asc' or 'reviewed_by|sort_by|desc', so that a page
+# of /api/v2/papers/ is read from the index on (list, rank) instead of sorting the whole list on every request.
+# Sorted like REFEREED_PREPRINTS_V2, ties broken by DOI in both, for a stable order for cursor pagination.
+rank_refereed_preprints = UpdateOrCreateTask(
+    "ranking the refereed preprints by reviewing service and sort order",
+    """
+    MATCH (:VizCollection {name: 'refereed-preprints'})-[:HasSubCol]->(review_service:VizSubCollection)
+    WITH COLLECT(review_service.name) AS names
+    UNWIND [''] + names AS reviewed_by
+    UNWIND ['preprint_date', 'review_date'] AS sort_by
+    UNWIND [true, false] AS sort_ascending
+    RETURN reviewed_by, sort_by, sort_ascending
+    """,
+    """
+    MATCH (:VizCollection {name: 'refereed-preprints'})-[:HasSubCol]->(review_service:VizSubCollection)-[:HasPaper]->(vzp:VizPaper)
+    WHERE (reviewed_by = '' OR review_service.name = reviewed_by) AND EXISTS { MATCH (:Article {doi: vzp.doi}) }
+    MATCH (vzp)-[:HasReviewDate]->(revdate:VizReviewDate)
+    WITH
+        reviewed_by,
+        sort_by,
+        sort_ascending,
+        vzp.doi AS doi,
+        {preprint_date: vzp.pub_date, review_date: revdate.date}[sort_by] AS sort_field
+    ORDER BY
+        CASE WHEN sort_ascending THEN sort_field ELSE null END ASC,
+        CASE WHEN sort_ascending THEN null ELSE sort_field END DESC,
+        doi ASC
+    WITH
+        reviewed_by + '|' + sort_by + '|' + CASE WHEN sort_ascending THEN 'asc' ELSE 'desc' END AS list,
+        COLLECT(DISTINCT doi) AS dois
+    UNWIND range(0, SIZE(dois) - 1) AS rank
+    CREATE (:VizPaperRank {list: list, rank: rank, doi: dois[rank], n_total: SIZE(dois)})
+    """,
+)
+
+
 Tasks = purge_viz_graph_tasks + [
     create_sd_articles,
     create_viz_papers,
@@ -477,6 +606,8 @@ Tasks = purge_viz_graph_tasks + [
     auto_topics_highlights,
     link_papers_to_highlights,
     create_automagic_collection,
+    render_refereed_preprint_documents,
+    rank_refereed_preprints,
 ]
 
 